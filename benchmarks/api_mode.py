@@ -0,0 +1,141 @@
+# encoding=utf8
+"""
+Время запуска воркера и обработки запроса с полными настройками
+(mega_market.settings) и в режиме API (mega_market.settings_api).
+
+Каждый профиль запускается в отдельном процессе: время импорта
+mega_market.wsgi после импорта Django (django.setup(), приложения,
+middleware и URL), затем запросы
+прямо в приложение WSGI без сети на базе SQLite во временном каталоге:
+
+    python benchmarks/api_mode.py --requests 2000 --starts 5
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'mega_market')
+PROFILES = ('mega_market.settings', 'mega_market.settings_api')
+OFFER_ID = '3fa85f64-5717-4562-b3fc-2c963f66a445'
+PATHS = (
+    ('GET', f'/nodes/{OFFER_ID}', ''),
+    ('GET', '/sales', 'date=2022-05-28T21:12:01.000Z'),
+    ('GET', f'/node/{OFFER_ID}/statistic', ''),
+)
+IMPORT = json.dumps({
+    'items': [{'type': 'OFFER', 'name': 'Оффер', 'id': OFFER_ID,
+               'price': 100}],
+    'updateDate': '2022-05-28T21:12:01.000Z',
+}).encode()
+
+
+def environ(method, path, query='', body=b''):
+    return {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.version': (1, 0),
+    }
+
+
+def call(application, env):
+    statuses = []
+    result = application(env, lambda status, headers: statuses.append(
+        status))
+    b''.join(result)
+    result.close()
+    return statuses[0]
+
+
+def worker(requests):
+    """
+    Выполняется в дочернем процессе, печатает результаты в JSON
+    """
+    sys.path.insert(0, PROJECT_DIR)
+    # Импорт самого Django одинаков для обоих профилей и не учитывается
+    import django.core.wsgi  # noqa: F401
+    started = time.perf_counter()
+    from mega_market.wsgi import application
+    from django.urls import get_resolver
+    # URL загружаются при первом запросе, для воркера это тоже запуск
+    get_resolver().url_patterns
+    startup = time.perf_counter() - started
+
+    call(application, environ('POST', '/imports', body=IMPORT))
+    results = {'startup': startup * 1e3}
+    for method, path, query in PATHS:
+        status = call(application, environ(method, path, query))
+        assert status.startswith('200'), (path, status)
+        started = time.perf_counter()
+        for _ in range(requests):
+            call(application, environ(method, path, query))
+        results[path.split('/')[1]] = (
+            (time.perf_counter() - started) / requests * 1e6)
+    print(json.dumps(results))
+
+
+def run(profile, requests, database):
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE=profile,
+        DB_ENGINE='django.db.backends.sqlite3',
+        DB_NAME=database,
+        READ_THROTTLE_RATE='1000000/s',
+        MODIFY_THROTTLE_RATE='1000000/s',
+    )
+    output = subprocess.run(
+        [sys.executable, __file__, '--worker', str(requests)],
+        env=env, check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--starts', type=int, default=5)
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker is not None:
+        worker(args.worker)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'db.sqlite3')
+        # Схему создает полный профиль, как в развертывании
+        subprocess.run(
+            [sys.executable, os.path.join(PROJECT_DIR, 'manage.py'),
+             'migrate', '-v', '0'],
+            env=dict(os.environ, DB_ENGINE='django.db.backends.sqlite3',
+                     DB_NAME=database),
+            check=True)
+        for profile in PROFILES:
+            runs = [run(profile, args.requests, database)
+                    for _ in range(args.starts)]
+            startup = sorted(result['startup'] for result in runs)
+            print(f'{profile}: startup {startup[len(startup) // 2]:.0f} ms')
+            for method, path, query in PATHS:
+                name = path.split('/')[1]
+                best = min(result[name] for result in runs)
+                print(f'  {method} /{name}: {best:.0f} us')
+
+
+if __name__ == '__main__':
+    main()
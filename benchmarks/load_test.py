@@ -0,0 +1,211 @@
+# encoding=utf8
+"""
+Нагрузочный тест чтения: /nodes, /sales и /node/{id}/statistic.
+
+Запускает сервер командой --server (по очереди для каждой команды),
+заполняет базу SQLite каталогом, держит --concurrency соединений
+с keep-alive в течение --duration секунд и печатает RPS, задержки
+и RPS на секунду процессорного времени сервера (процесс и его воркеры):
+
+    python benchmarks/load_test.py \\
+        --server "gunicorn mega_market.wsgi:application -w 2" \\
+        --server "gunicorn mega_market.asgi:application -w 2 \\
+                  -k uvicorn.workers.UvicornWorker"
+
+Команды выполняются в каталоге mega_market, адрес сервера - --bind.
+С --env-db используется база из переменных окружения DB_* (например,
+PostgreSQL из docker-compose): выигрыш ASGI заметен, когда запросы
+ждут сетевую БД, на SQLite сервер упирается только в процессор
+"""
+
+import argparse
+import collections
+import datetime
+import http.client
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+PROJECT_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'mega_market')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+DATE = datetime.datetime(2022, 5, 28, 21, 12, 1)
+
+
+def item_id(index):
+    return f'00000000-0000-0000-0000-{index:012d}'
+
+
+def populate(env, categories, offers, updates):
+    """
+    Создает каталог из categories категорий по offers товаров
+    и updates обновлений цен. Возвращает id категорий и товаров
+    """
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'],
+                   cwd=PROJECT_DIR, env=env, check=True)
+    category_ids = [item_id(index) for index in range(categories)]
+    offer_ids = [item_id(categories + index)
+                 for index in range(categories * offers)]
+    lines = [json.dumps({'id': category_id, 'name': 'Категория',
+                         'type': 'CATEGORY'})
+             for category_id in category_ids]
+    lines += [json.dumps({'id': offer_id, 'name': 'Оффер', 'type': 'OFFER',
+                          'parentId': category_ids[index // offers],
+                          'price': index})
+              for index, offer_id in enumerate(offer_ids)]
+    with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as feed:
+        feed.write('\n'.join(lines))
+        feed.flush()
+        for update in range(updates):
+            date = DATE + datetime.timedelta(hours=update)
+            subprocess.run(
+                [sys.executable, 'manage.py', 'import_feed', feed.name,
+                 '--date', date.isoformat() + '.000Z'],
+                cwd=PROJECT_DIR, env=env, check=True,
+                stdout=subprocess.DEVNULL)
+    return category_ids, offer_ids
+
+
+def make_paths(category_ids, offer_ids, updates):
+    date = (DATE + datetime.timedelta(hours=updates - 1)).isoformat()
+    query = urllib.parse.urlencode
+    return [
+        lambda: f'/nodes/{random.choice(category_ids)}',
+        lambda: f'/nodes/{random.choice(offer_ids)}',
+        lambda: '/sales?' + query({'date': date + '.000Z', 'limit': 100}),
+        lambda: f'/node/{random.choice(offer_ids)}/statistic',
+    ]
+
+
+def cpu_seconds(pid):
+    """
+    Процессорное время процесса и всех его потомков, секунды
+    """
+    parents = {}
+    times = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        parents[int(name)] = int(fields[1])
+        times[int(name)] = int(fields[11]) + int(fields[12])
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += times.get(current, 0)
+        stack.extend(child for child, parent in parents.items()
+                     if parent == current)
+    return total / CLOCK_TICKS
+
+
+def worker(host, port, paths, deadline, latencies, errors):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    while time.monotonic() < deadline:
+        path = random.choice(paths)()
+        started = time.monotonic()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as error:
+            errors.append(type(error).__name__)
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        if response.status != 200:
+            errors.append(response.status)
+        latencies.append(time.monotonic() - started)
+    connection.close()
+
+
+def wait_ready(host, port, path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request('GET', path)
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start')
+
+
+def run(command, env, bind, paths, concurrency, duration):
+    host, port = bind.split(':')
+    server = subprocess.Popen(
+        shlex.split(command) + ['--bind', bind], cwd=PROJECT_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(host, port, paths[0]())
+        latencies, errors = [], []
+        cpu_before = cpu_seconds(server.pid)
+        deadline = time.monotonic() + duration
+        threads = [
+            threading.Thread(target=worker, args=(
+                host, port, paths, deadline, latencies, errors))
+            for _ in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        cpu = cpu_seconds(server.pid) - cpu_before
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    rps = (len(latencies) - len(errors)) / duration
+    print(command)
+    print(f'  requests: {len(latencies)}, errors: {len(errors)}',
+          dict(collections.Counter(errors)) if errors else '')
+    print(f'  rps: {rps:.1f}, rps per cpu second: '
+          f'{rps * duration / cpu if cpu else 0:.1f}')
+    for percent in (50, 90, 99):
+        index = min(len(latencies) - 1, len(latencies) * percent // 100)
+        print(f'  p{percent}: {latencies[index] * 1000:.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', action='append', required=True)
+    parser.add_argument('--bind', default='127.0.0.1:8765')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=int, default=20)
+    parser.add_argument('--categories', type=int, default=100)
+    parser.add_argument('--offers', type=int, default=20)
+    parser.add_argument('--updates', type=int, default=10)
+    parser.add_argument('--env-db', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        if not args.env_db:
+            env['DB_ENGINE'] = 'django.db.backends.sqlite3'
+            env['DB_NAME'] = os.path.join(directory, 'db.sqlite3')
+        env.pop('GUNICORN_BIND', None)
+        # Все запросы идут с одного адреса, ограничение частоты
+        # измерило бы себя, а не сервер
+        env['READ_THROTTLE_RATE'] = '1000000/second'
+        category_ids, offer_ids = populate(
+            env, args.categories, args.offers, args.updates)
+        paths = make_paths(category_ids, offer_ids, args.updates)
+        for command in args.server:
+            run(command, env, args.bind, paths, args.concurrency,
+                args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# encoding=utf8
+"""
+Пиковая память процесса при выдаче статистики в зависимости от числа строк.
+
+Сравнивает потоковую выдачу (stream_items) с полной сборкой ответа
+через ShopUnitStatisticUnitSerializer(many=True) и JSONRenderer.
+Каждое измерение выполняется в отдельном процессе на временной
+базе SQLite:
+
+    python benchmarks/streaming_rss.py --rows 10000 100000 500000
+"""
+
+import argparse
+import datetime
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'mega_market')
+OFFER_ID = '3fa85f64-5717-4562-b3fc-2c963f66a445'
+
+
+def setup_django(db_name):
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ['DB_ENGINE'] = 'django.db.backends.sqlite3'
+    os.environ['DB_NAME'] = db_name
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mega_market.settings')
+    import django
+    django.setup()
+
+
+def populate(db_name, rows):
+    setup_django(db_name)
+    from django.core.management import call_command
+    from django.db import connection
+    from django.utils import timezone
+    from goods.models import ShopUnit
+
+    call_command('migrate', verbosity=0)
+    start = timezone.make_aware(datetime.datetime(2022, 1, 1))
+    ShopUnit.objects.create(
+        id=OFFER_ID, name='Оффер', type='OFFER', price=1, date=start)
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, 10000):
+            cursor.executemany(
+                'INSERT INTO goods_shopunitstatisticunit '
+                '(name, date, type, price, source_id, parent_id) '
+                'VALUES (%s, %s, %s, %s, %s, NULL)',
+                [('Оффер', start + datetime.timedelta(seconds=i),
+                  'OFFER', i, OFFER_ID)
+                 for i in range(offset, min(offset + 10000, rows))]
+            )
+
+
+def measure(db_name, mode):
+    setup_django(db_name)
+    from django.test import RequestFactory
+    from rest_framework.renderers import JSONRenderer
+    from goods.models import ShopUnitStatisticUnit
+    from goods.serializers import ShopUnitStatisticUnitSerializer
+    from goods.views import get_node_statistic
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if mode == 'stream':
+        request = RequestFactory().get(f'/node/{OFFER_ID}/statistic')
+        response = get_node_statistic(request, node_id=OFFER_ID)
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        queryset = ShopUnitStatisticUnit.objects.filter(source_id=OFFER_ID)
+        size = len(JSONRenderer().render({
+            'items': ShopUnitStatisticUnitSerializer(queryset, many=True).data
+        }))
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в Linux измеряется в килобайтах
+    print(f'{(peak - baseline) / 1024:.1f} {size / 2 ** 20:.1f} {elapsed:.2f}')
+
+
+def run(*args):
+    return subprocess.run(
+        [sys.executable, __file__, *args],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f'{"rows":>10} {"mode":>12} {"peak RSS, MB":>13} '
+          f'{"body, MB":>9} {"time, s":>8}')
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, 'bench.sqlite3')
+            run('--populate', db_name, str(rows))
+            for mode in ('stream', 'materialize'):
+                rss, size, elapsed = run('--measure', db_name, mode)
+                print(f'{rows:>10} {mode:>12} {rss:>13} '
+                      f'{size:>9} {elapsed:>8}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--populate']:
+        populate(sys.argv[2], int(sys.argv[3]))
+    elif sys.argv[1:2] == ['--measure']:
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,86 @@
+# encoding=utf8
+"""
+Время одной проверки ограничения частоты запросов.
+
+Сравнивает AnonRateThrottle из DRF (список времени запросов клиента
+в кэше locmem) с FixedWindowRateThrottle на хранилищах memory, sqlite
+и database (SQLite во временном каталоге):
+
+    python benchmarks/throttle_overhead.py --requests 5000 --rate 1000/m
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'mega_market')
+
+
+def setup_django(directory):
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ['DB_ENGINE'] = 'django.db.backends.sqlite3'
+    os.environ['DB_NAME'] = os.path.join(directory, 'db.sqlite3')
+    os.environ['THROTTLE_SQLITE_PATH'] = os.path.join(
+        directory, 'throttle.sqlite3')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mega_market.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def measure(throttle_class, requests, clients):
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+
+    factory = RequestFactory()
+    addresses = [f'10.0.{index // 256}.{index % 256}'
+                 for index in range(clients)]
+    started = time.perf_counter()
+    for index in range(requests):
+        request = factory.get(
+            '/sales', REMOTE_ADDR=addresses[index % clients])
+        request.user = AnonymousUser()
+        if throttle_class is not None:
+            throttle_class().allow_request(request, None)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=1)
+    parser.add_argument('--rate', default='1000/m')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(directory)
+        from django.core.cache import cache
+        from django.test import override_settings
+        from rest_framework.throttling import AnonRateThrottle
+        from goods import throttle
+
+        class HistoryThrottle(AnonRateThrottle):
+            rate = args.rate
+
+        class FixedWindowThrottle(throttle.FixedWindowRateThrottle):
+            rate = args.rate
+
+        # Время самой RequestFactory вычитается из результатов
+        baseline = measure(None, args.requests, args.clients)
+        cache.clear()
+        result = measure(HistoryThrottle, args.requests, args.clients)
+        print(f'AnonRateThrottle (locmem): {result - baseline:.1f} us')
+        for store in ('memory', 'sqlite', 'database'):
+            with override_settings(THROTTLE_STORE=store):
+                result = measure(
+                    FixedWindowThrottle, args.requests, args.clients)
+            print(f'FixedWindowRateThrottle ({store}): '
+                  f'{result - baseline:.1f} us')
+
+
+if __name__ == '__main__':
+    main()
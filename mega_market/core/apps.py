@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .routers import reset_read_alias
+        request_finished.connect(reset_read_alias)
@@ -0,0 +1,142 @@
+"""
+ASGI-обертка над WSGI-приложением Django. В Django 2.2 нет асинхронных
+представлений, поэтому каждый запрос целиком (представление, выдача
+тела ответа и закрытие соединения с БД) выполняется в одном потоке
+из пула, а цикл событий только принимает и отдает данные. Медленный
+запрос занимает поток пула, а не процесс
+"""
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Тело запроса больше этого размера буферизуется на диске
+BODY_MEMORY_SIZE = 1024 * 1024
+
+
+def build_environ(scope, body):
+    """
+    Окружение WSGI (PEP 3333) для запроса ASGI
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin1'),
+        'PATH_INFO': scope['path'].encode().decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin1')
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+class ThreadPoolASGIHandler:
+    """
+    Приложение ASGI 3, выполняющее wsgi_application в пуле
+    из max_workers потоков
+    """
+
+    def __init__(self, wsgi_application, max_workers):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported scope type {scope["type"]}')
+
+        body = await self.read_body(receive)
+        loop = asyncio.get_running_loop()
+        try:
+            messages = await loop.run_in_executor(
+                self.executor, self.run, scope, body, send, loop)
+        finally:
+            body.close()
+        for message in messages:
+            await send(message)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def read_body(receive):
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_MEMORY_SIZE)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        return body
+
+    def run(self, scope, body, send, loop):
+        """
+        Выполняет запрос в потоке пула. Обычный ответ возвращается
+        списком сообщений и отправляется из цикла событий, части
+        потокового ответа отправляются по мере выдачи, поток ждет
+        отправки каждой части
+        """
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'),
+                             value.encode('latin1'))
+                            for name, value in headers],
+            })
+
+        result = self.wsgi_application(build_environ(scope, body),
+                                       start_response)
+        try:
+            if not getattr(result, 'streaming', True):
+                return [start, {'type': 'http.response.body',
+                                'body': b''.join(result)}]
+            started = False
+            for chunk in result:
+                if chunk:
+                    if not started:
+                        send_sync(start)
+                        started = True
+                    send_sync({'type': 'http.response.body',
+                               'body': chunk, 'more_body': True})
+            if not started:
+                send_sync(start)
+            send_sync({'type': 'http.response.body', 'body': b''})
+            return []
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
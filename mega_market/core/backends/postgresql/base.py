@@ -0,0 +1,106 @@
+"""
+PostgreSQL с проверкой соединений перед повторным использованием
+и необязательным пулом соединений внутри процесса.
+
+CONN_HEALTH_CHECKS: постоянное соединение (CONN_MAX_AGE > 0) проверяется
+запросом перед первым обращением к БД в каждом запросе HTTP.
+POOL: {'SIZE': ..., 'TIMEOUT': ..., 'CHECK_INTERVAL': ...} - соединения
+берутся из пула и возвращаются в него при закрытии, SIZE 0 выключает пул
+"""
+import functools
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from core.pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _check(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except base.Database.Error:
+        return False
+    return True
+
+
+def _reset(connection):
+    """
+    Откатывает незавершенную транзакцию возвращаемого соединения
+    """
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == extensions.TRANSACTION_STATUS_IDLE:
+        return True
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        connection.rollback()
+    except base.Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get('POOL') or {}
+        if not options.get('SIZE'):
+            return None
+        pool = _pools.get(self.alias)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(self.alias)
+                if pool is None:
+                    pool = _pools[self.alias] = ConnectionPool(
+                        functools.partial(base.Database.connect,
+                                          **self.get_connection_params()),
+                        options['SIZE'],
+                        timeout=options.get('TIMEOUT', 10),
+                        check_interval=options.get('CHECK_INTERVAL', 30),
+                        check=_check, reset=_reset)
+        return pool
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.get()
+        # Как в base.DatabaseWrapper.get_new_connection
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if pool is None:
+            return super()._close()
+        # Соединение, закрытое внутри atomic, остается у DatabaseWrapper
+        # до отката, в пул его возвращать нельзя
+        if self.in_atomic_block:
+            return pool.discard(self.connection)
+        return pool.put(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                and self.pool is None):
+            self.health_check_done = True
+            if not self.in_atomic_block and not self.is_usable():
+                self.close()
+        super().ensure_connection()
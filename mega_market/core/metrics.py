@@ -0,0 +1,44 @@
+"""
+Метрики процесса в текстовом формате Prometheus
+"""
+from django.db import connections
+
+from core.pool import COUNTERS, ConnectionPool
+
+POOL_GAUGES = ('size', 'opened', 'in_use', 'idle', 'max_wait_seconds')
+
+
+def pool_samples():
+    """
+    Заполненность и ожидание пулов соединений с БД
+    """
+    samples = []
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if not isinstance(pool, ConnectionPool):
+            continue
+        metrics = pool.metrics()
+        labels = {'alias': alias}
+        samples += [(f'db_pool_{name}', 'gauge', labels, metrics[name])
+                    for name in POOL_GAUGES]
+        samples += [(f'db_pool_{name}_total', 'counter', labels,
+                     metrics[name])
+                    for name in COUNTERS]
+    return samples
+
+
+def render(samples):
+    """
+    Текст для samples из (имя, тип, метки, значение)
+    """
+    lines = []
+    declared = set()
+    for name, kind, labels, value in samples:
+        if name not in declared:
+            lines.append(f'# TYPE {name} {kind}')
+            declared.add(name)
+        label_text = ','.join(f'{key}="{label}"'
+                              for key, label in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text
+                     else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
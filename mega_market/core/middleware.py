@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import InterfaceError, OperationalError
+from rest_framework.throttling import BaseThrottle
+
+from .routers import choose_replica, mark_down, set_read_alias
+from .utils import is_shared_cache
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтения представлений REPLICA_READ_VIEWS на реплику.
+    После успешного запроса к REPLICA_STICKY_VIEWS клиент (адрес,
+    как у ограничения частоты запросов) REPLICA_STICKY_SECONDS секунд
+    читает из default и видит свои изменения. Если реплика отказала
+    во время выполнения представления, оно выполняется повторно
+    на default. Привязка хранится в кэше REPLICA_STICKY_CACHE, и без
+    общего для процессов бэкенда реплики не используются: запрос,
+    попавший в другой процесс, прочитал бы с реплики устаревшие данные.
+    Должна быть последней в MIDDLEWARE
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        if (self.enabled and match is not None
+                and match.url_name in settings.REPLICA_STICKY_VIEWS
+                and response.status_code < 400):
+            self.cache.set(self._sticky_key(request), True,
+                           settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    @staticmethod
+    def _sticky_key(request):
+        return f'replica:sticky:{BaseThrottle().get_ident(request)}'
+
+    @property
+    def cache(self):
+        return caches[settings.REPLICA_STICKY_CACHE]
+
+    @property
+    def enabled(self):
+        return bool(settings.DATABASE_REPLICAS) and is_shared_cache(
+            self.cache)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        set_read_alias(None)
+        if (not self.enabled
+                or request.method not in ('GET', 'HEAD')
+                or request.resolver_match.url_name
+                not in settings.REPLICA_READ_VIEWS
+                or self.cache.get(self._sticky_key(request))):
+            return None
+
+        alias = choose_replica()
+        if alias is None:
+            return None
+        set_read_alias(alias)
+        try:
+            return view_func(request, *view_args, **view_kwargs)
+        except (OperationalError, InterfaceError):
+            mark_down(alias)
+            set_read_alias(None)
+            return view_func(request, *view_args, **view_kwargs)
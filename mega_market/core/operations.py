@@ -0,0 +1,65 @@
+from django.db import NotSupportedError
+from django.db.migrations import AddIndex
+
+
+class AddIndexConcurrently(AddIndex):
+    """
+    Создает индекс без блокировки записи в таблицу
+    (CREATE INDEX CONCURRENTLY) на PostgreSQL.
+    На остальных СУБД и для секционированных таблиц, которые
+    не поддерживают CONCURRENTLY, работает как обычный AddIndex.
+    Миграция с этой операцией должна быть объявлена с atomic = False
+    """
+
+    def _execute_concurrently(self, schema_editor, sql):
+        if schema_editor.connection.in_atomic_block:
+            raise NotSupportedError(
+                'The AddIndexConcurrently operation cannot be executed '
+                'inside a transaction (set atomic = False on the migration).'
+            )
+        schema_editor.execute(sql)
+
+    @staticmethod
+    def _is_partitioned(schema_editor, model):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relkind = 'p' FROM pg_class "
+                "WHERE oid = %s::regclass", [model._meta.db_table])
+            return cursor.fetchone()[0]
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state)
+
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self._is_partitioned(schema_editor, model):
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            sql = str(self.index.create_sql(model, schema_editor))
+            self._execute_concurrently(schema_editor, sql.replace(
+                'CREATE INDEX', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS', 1))
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state)
+
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self._is_partitioned(schema_editor, model):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            sql = str(self.index.remove_sql(model, schema_editor))
+            self._execute_concurrently(schema_editor, sql.replace(
+                'DROP INDEX', 'DROP INDEX CONCURRENTLY', 1))
+
+    def describe(self):
+        return 'Concurrently create index %s on field(s) %s of model %s' % (
+            self.index.name,
+            ', '.join(self.index.fields),
+            self.model_name,
+        )
@@ -0,0 +1,130 @@
+"""
+Пул соединений с БД внутри процесса. Соединение, простоявшее в пуле
+дольше check_interval секунд, перед выдачей проверяется запросом,
+неработающие соединения закрываются и заменяются новыми
+"""
+import collections
+import threading
+import time
+
+COUNTERS = ('checkouts', 'wait_seconds', 'timeouts', 'connects', 'checks',
+            'failed_checks')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Не больше size соединений, созданных connect. Если все заняты,
+    get ждет освобождения соединения не дольше timeout секунд.
+    check(connection) проверяет соединение, reset(connection) готовит
+    возвращенное соединение к повторному использованию, оба возвращают
+    False для соединений, которые нужно закрыть
+    """
+
+    def __init__(self, connect, size, timeout=10, check_interval=30,
+                 check=None, reset=None):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.check = check
+        self.reset = reset
+        self.opened = 0
+        self.in_use = 0
+        # Свободные соединения и время их возврата в пул
+        self.idle = collections.deque()
+        self.condition = threading.Condition()
+        self.stats = collections.Counter()
+
+    def get(self):
+        started = time.monotonic()
+        with self.condition:
+            while not self.idle and self.opened >= self.size:
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No free connection in {self.timeout} seconds')
+                self.condition.wait(remaining)
+            waited = time.monotonic() - started
+            self.stats['checkouts'] += 1
+            self.stats['wait_seconds'] += waited
+            if waited > self.stats['max_wait_seconds']:
+                self.stats['max_wait_seconds'] = waited
+            if self.idle:
+                connection, returned = self.idle.pop()
+            else:
+                connection, returned = None, None
+            self.opened += connection is None
+            self.in_use += 1
+
+        try:
+            if connection is not None and not self._healthy(
+                    connection, returned):
+                self._count('failed_checks')
+                self._close(connection)
+                connection = None
+            if connection is None:
+                connection = self.connect()
+                self._count('connects')
+        except BaseException:
+            self._release()
+            raise
+        return connection
+
+    def _healthy(self, connection, returned):
+        if self.check is None:
+            return True
+        if time.monotonic() - returned < self.check_interval:
+            return True
+        self._count('checks')
+        return self.check(connection)
+
+    def put(self, connection):
+        """
+        Возвращает соединение в пул
+        """
+        if self.reset is not None and not self.reset(connection):
+            self._close(connection)
+            return self._release()
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.in_use -= 1
+            self.condition.notify()
+
+    def discard(self, connection):
+        """
+        Закрывает выданное соединение, не возвращая его в пул
+        """
+        self._close(connection)
+        self._release()
+
+    def _count(self, name):
+        with self.condition:
+            self.stats[name] += 1
+
+    def _release(self):
+        with self.condition:
+            self.opened -= 1
+            self.in_use -= 1
+            self.condition.notify()
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def metrics(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'opened': self.opened,
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+                'max_wait_seconds': self.stats['max_wait_seconds'],
+                **{name: self.stats[name] for name in COUNTERS},
+            }
@@ -0,0 +1,72 @@
+"""
+Чтение с реплик БД. ReplicaMiddleware выбирает реплику для запроса
+к представлению из REPLICA_READ_VIEWS, и до конца запроса (включая
+выдачу потокового ответа) ReplicaRouter направляет чтения на нее.
+Запись и все остальные запросы идут в default
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+_state = threading.local()
+# Недоступные реплики и время, до которого их не выбирать
+_down_until = {}
+
+
+def get_read_alias():
+    return getattr(_state, 'alias', None)
+
+
+def set_read_alias(alias):
+    _state.alias = alias
+
+
+def reset_read_alias(**kwargs):
+    """
+    Обработчик request_finished
+    """
+    _state.alias = None
+
+
+def mark_down(alias):
+    _down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+
+def choose_replica():
+    """
+    Случайная доступная реплика или None, если доступных нет.
+    Реплика, к которой не удалось подключиться, не выбирается
+    REPLICA_RETRY_SECONDS секунд
+    """
+    now = time.monotonic()
+    aliases = [alias for alias in settings.DATABASE_REPLICAS
+               if _down_until.get(alias, 0) <= now]
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            mark_down(alias)
+        else:
+            return alias
+    return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return get_read_alias()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с репликацией
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
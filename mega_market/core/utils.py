@@ -1,3 +1,7 @@
+from itertools import islice
+
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from rest_framework.views import exception_handler
 
 
@@ -12,3 +16,23 @@ def custom_exception_handler(exc, context):
             response.data['message'] = 'Validation Failed'
 
     return response
+
+
+def chunked(iterable, size):
+    """
+    Разбивает последовательность на списки длиной не больше size
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def is_shared_cache(cache):
+    """
+    Видят ли записи в кэш другие процессы: у DummyCache записей нет,
+    у LocMemCache они в памяти процесса
+    """
+    return not isinstance(cache, (DummyCache, LocMemCache))
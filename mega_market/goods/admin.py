@@ -2,5 +2,43 @@ from django.contrib import admin
 
 from . import models
 
-admin.site.register(models.ShopUnit)
+
+@admin.register(models.ShopUnit)
+class ShopUnitAdmin(admin.ModelAdmin):
+    """
+    Агрегаты категорий и пути ведет модель. Удаление - через
+    delete_unit, как DELETE /delete/{id}: с пересчетом агрегатов
+    родителей, инвалидацией кэша /nodes и записью в журнал каталога.
+    История всех сохранений одного запроса записывается одним пакетом
+    """
+    list_display = ('id', 'name', 'type', '_price', 'date')
+    list_editable = ('name', '_price')
+    readonly_fields = ('path', 'offer_sum', 'offer_count')
+
+    def changeform_view(self, request, *args, **kwargs):
+        if request.method != 'POST':
+            return super().changeform_view(request, *args, **kwargs)
+        with models.history_recorder.batch():
+            return super().changeform_view(request, *args, **kwargs)
+
+    def changelist_view(self, request, *args, **kwargs):
+        if request.method != 'POST':
+            return super().changelist_view(request, *args, **kwargs)
+        with models.history_recorder.batch():
+            return super().changelist_view(request, *args, **kwargs)
+
+    def delete_model(self, request, obj):
+        models.delete_unit(obj)
+
+    def delete_queryset(self, request, queryset):
+        units = list(queryset)
+        ids = {unit.id for unit in units}
+        for unit in units:
+            # Потомки выбранных категорий удаляются вместе с ними
+            if not ids.intersection(unit.ancestor_ids):
+                models.delete_unit(unit)
+
+
 admin.site.register(models.ShopUnitStatisticUnit)
+admin.site.register(models.ShopUnitStatisticRollup)
+admin.site.register(models.ImportJob)
@@ -0,0 +1,108 @@
+import uuid
+from collections import Counter
+
+from django.core.cache import caches
+from django.db import transaction
+
+from core.utils import chunked, is_shared_cache
+
+CACHE_ALIAS = 'nodes'
+# Больше элементов дешевле инвалидировать очисткой всего кэша
+INVALIDATE_LIMIT = 10000
+
+
+class NodeCache:
+    """
+    Кэш ответов /nodes/{id}. У каждого элемента есть версия, и ответ
+    хранится под ключом с версией. Инвалидация меняет версию, поэтому
+    ответ, посчитанный по данным до изменения, больше не читается,
+    даже если он был записан в кэш уже после инвалидации.
+    С бэкендом в памяти процесса инвалидация не дошла бы до других
+    процессов, и кэш выключен
+    """
+
+    def __init__(self, alias=CACHE_ALIAS):
+        self.alias = alias
+        self.stats = Counter()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        return is_shared_cache(self.cache)
+
+    @staticmethod
+    def _version_key(node_id):
+        return f'nodes:version:{node_id}'
+
+    def _get_version(self, node_id):
+        key = self._version_key(node_id)
+        version = self.cache.get(key)
+        if version is None:
+            # Версия вытеснена или еще не создана: начинаем новую,
+            # чтобы не прочитать ответы, записанные до вытеснения
+            self.cache.add(key, uuid.uuid4().hex, timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def get_or_set(self, node_id, compute, store=True):
+        """
+        Возвращает ответ из кэша или считает его через compute().
+        Ответ None не кэшируется, со store=False ответ не записывается
+        (он посчитан по реплике и может быть старше текущей версии)
+        """
+        if not self.enabled:
+            return compute()
+        key = f'nodes:data:{node_id}:{self._get_version(node_id)}'
+        data = self.cache.get(key)
+        if data is not None:
+            self.stats['hits'] += 1
+            return data
+
+        self.stats['misses'] += 1
+        data = compute()
+        if data is not None and store:
+            self.cache.set(key, data)
+        return data
+
+    def invalidate(self, ids):
+        if not self.enabled:
+            return
+        for chunk in chunked(ids, 1000):
+            self.cache.set_many(
+                {self._version_key(node_id): uuid.uuid4().hex
+                 for node_id in chunk},
+                timeout=None
+            )
+            self.stats['invalidations'] += len(chunk)
+
+    def invalidate_on_commit(self, ids):
+        """
+        Инвалидирует элементы сразу и еще раз после фиксации текущей
+        транзакции: ответы, посчитанные до фиксации, не будут прочитаны
+        """
+        if not self.enabled:
+            return
+        ids = list(ids)
+        self.invalidate(ids)
+        transaction.on_commit(lambda: self.invalidate(ids))
+
+    def clear(self):
+        if not self.enabled:
+            return
+        self.cache.clear()
+        self.stats['clears'] += 1
+
+    def clear_on_commit(self):
+        """
+        Очищает кэш сразу и еще раз после фиксации текущей транзакции
+        """
+        if not self.enabled:
+            return
+        self.clear()
+        transaction.on_commit(self.clear)
+
+
+node_cache = NodeCache()
@@ -0,0 +1,73 @@
+"""
+Быстрое представление элементов для чтения без сериализаторов DRF.
+Результат совпадает с ShopUnitTreeSerializer
+и ShopUnitStatisticUnitSerializer байт в байт
+"""
+from .models import ShopUnitType
+
+# Поля для values_list, из которых строится statistic_item
+STATISTIC_FIELDS = ('source_id', 'name', 'date', 'price', 'type', 'parent_id')
+# Поля для values_list, из которых строится rollup_item
+ROLLUP_FIELDS = STATISTIC_FIELDS + (
+    'min_price', 'max_price', 'price_sum', 'price_count')
+
+
+def format_date(value):
+    """
+    То же, что ISO8601DateField.to_representation, без strftime
+    """
+    return '%d-%02d-%02dT%02d:%02d:%02d.%03dZ' % (
+        value.year, value.month, value.day,
+        value.hour, value.minute, value.second, value.microsecond // 1000
+    )
+
+
+def _int_or_none(value):
+    return None if value is None else int(value)
+
+
+def statistic_item(row):
+    """
+    Запись истории из кортежа значений STATISTIC_FIELDS
+    """
+    source_id, name, date, price, unit_type, parent_id = row
+    return {
+        'id': source_id,
+        'name': name,
+        'date': format_date(date),
+        'price': _int_or_none(price),
+        'type': unit_type,
+        'parentId': parent_id,
+    }
+
+
+def rollup_item(row):
+    """
+    Агрегат истории за интервал из кортежа значений ROLLUP_FIELDS:
+    запись истории на конец интервала и цены за интервал
+    """
+    min_price, max_price, price_sum, price_count = row[6:]
+    item = statistic_item(row[:6])
+    item['minPrice'] = _int_or_none(min_price)
+    item['maxPrice'] = _int_or_none(max_price)
+    item['avgPrice'] = price_sum // price_count if price_count else None
+    return item
+
+
+def unit_item(unit):
+    """
+    Элемент, загруженный get_subtree, вместе с дочерними элементами
+    """
+    if unit.type == ShopUnitType.CATEGORY.value:
+        children = [unit_item(child) for child in unit.loaded_children]
+    else:
+        children = None
+    return {
+        'id': unit.id,
+        'name': unit.name,
+        'type': unit.type,
+        'parentId': unit.parent_id,
+        'date': format_date(unit.date),
+        'price': _int_or_none(unit.price),
+        'children': children,
+    }
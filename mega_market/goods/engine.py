@@ -0,0 +1,420 @@
+"""
+Каталог в памяти процесса для чтения /nodes и /sales.
+
+Элементы хранятся в параллельных массивах по номерам слотов: родитель,
+дочерние элементы, цена, сумма и количество товаров категории.
+Обновления цен товаров за последние CATALOG_ENGINE_SALES_DAYS дней
+(от самого нового обновления) хранятся отсортированными по (date, id)
+для выборки /sales, более старые сутки читаются из БД.
+
+Каталог загружается из БД при первом обращении, а перед каждым чтением
+применяет новые события журнала CatalogEvent: перечитывает измененные
+элементы и удаляет поддеревья. Номер последнего примененного события -
+версия каталога, ответ отдается только после того, как каталог догнал
+журнал. События применяются под блокировкой записи, ответы строятся
+под блокировкой чтения, которую потоки держат одновременно
+"""
+import bisect
+import datetime
+import json
+import threading
+from array import array
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from . import streaming
+from .encoders import STATISTIC_FIELDS, format_date
+from .models import CatalogEvent, CatalogEventKind, ShopUnit, \
+    ShopUnitStatisticUnit, ShopUnitType, query_chunks
+
+UNIT_FIELDS = ('id', 'name', 'type', '_price', 'date', 'parent_id',
+               'offer_sum', 'offer_count')
+
+OFFER = ShopUnitType.OFFER.value
+CATEGORY = ShopUnitType.CATEGORY.value
+# Пустые цена и родитель в целочисленных массивах
+NONE = -1
+# Больше обновлений цен дешевле удалить перестроением списка ключей
+REBUILD_LIMIT = 100
+
+
+class ReadWriteLock:
+    """
+    Блокировка для одновременного чтения многими потоками и монопольной
+    записи. Ожидающая запись не пропускает новых читателей
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class CatalogEngine:
+    def __init__(self):
+        self.version = None
+        self._lock = ReadWriteLock()
+
+    @property
+    def enabled(self):
+        return settings.CATALOG_ENGINE
+
+    def _reset(self):
+        self._slots = {}
+        self._free = []
+        self._ids = []
+        self._names = []
+        self._dates = []
+        self._categories = bytearray()
+        self._prices = array('q')
+        self._parents = array('q')
+        self._sums = array('q')
+        self._counts = array('q')
+        self._children = []
+        # Обновления цен товаров: ключи (date, id) по порядку,
+        # строки STATISTIC_FIELDS по id, id по элементу и дате и id
+        # по родителю на момент обновления.
+        # Хранятся обновления с датами от _sales_since, None - пока
+        # обновлений нет
+        self._sales_keys = []
+        self._sales_rows = {}
+        self._sales_by_unit = {}
+        self._sales_by_parent = {}
+        self._sales_since = None
+
+    def load(self):
+        """
+        Загружает каталог из БД целиком
+        """
+        with self._lock.write():
+            self._load()
+
+    def _load(self):
+        self._reset()
+        version = CatalogEvent.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        # По пути родители идут раньше своих элементов
+        units = ShopUnit.objects.order_by('path').values_list(*UNIT_FIELDS)
+        for row in units.iterator():
+            self._attach(self._store(row), row[5])
+
+        history = ShopUnitStatisticUnit.objects.filter(type=OFFER)
+        latest = history.aggregate(latest=Max('date'))['latest']
+        if latest is not None:
+            self._sales_since = self._window_start(latest)
+            history = history.filter(
+                date__gte=self._sales_since).order_by('date', 'id')
+            for row_id, *row in history.values_list(
+                    'id', *STATISTIC_FIELDS).iterator():
+                self._sales_keys.append((row[2], row_id))
+                self._add_sale(row_id, tuple(row))
+        # События, записанные во время загрузки, применятся повторно,
+        # перечитывание элементов идемпотентно
+        self.version = version
+
+    def sync(self):
+        """
+        Применяет события журнала после текущей версии. Если новых
+        событий нет, блокировка записи не берется
+        """
+        latest = CatalogEvent.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        if self.version is not None and latest <= self.version:
+            return
+        with self._lock.write():
+            if self.version is None:
+                return self._load()
+            events = CatalogEvent.objects.filter(
+                id__gt=self.version).order_by('id')
+            for event in events:
+                if event.kind == CatalogEventKind.RESET.value:
+                    return self._load()
+                self.apply(event)
+                self.version = event.id
+
+    def apply(self, event):
+        for unit_id in json.loads(event.deleted):
+            slot = self._slots.get(unit_id)
+            if slot is not None:
+                self._remove_subtree(slot)
+
+        changed = json.loads(event.changed)
+        self._reload_units(changed)
+        if event.date is not None:
+            for chunk in query_chunks(changed):
+                history = ShopUnitStatisticUnit.objects.filter(
+                    type=OFFER, date=event.date, source_id__in=chunk
+                ).values_list('id', *STATISTIC_FIELDS)
+                for row_id, *row in history:
+                    self._replace_sale(row_id, tuple(row))
+
+    # Элементы
+
+    def _store(self, row):
+        """
+        Записывает поля элемента в его слот, не меняя связей
+        """
+        unit_id, name, unit_type, price, date, _, offer_sum, offer_count = row
+        slot = self._slots.get(unit_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._ids)
+                self._ids.append(None)
+                self._names.append(None)
+                self._dates.append(None)
+                self._categories.append(0)
+                self._prices.append(NONE)
+                self._parents.append(NONE)
+                self._sums.append(0)
+                self._counts.append(0)
+                self._children.append(None)
+            self._slots[unit_id] = slot
+            self._ids[slot] = unit_id
+            self._parents[slot] = NONE
+            self._children[slot] = (
+                array('q') if unit_type == CATEGORY else None)
+        self._names[slot] = name
+        self._dates[slot] = date
+        self._categories[slot] = unit_type == CATEGORY
+        self._prices[slot] = NONE if price is None else price
+        self._sums[slot] = offer_sum
+        self._counts[slot] = offer_count
+        return slot
+
+    def _attach(self, slot, parent_id):
+        parent = NONE if parent_id is None else self._slots[parent_id]
+        if self._parents[slot] == parent:
+            return
+        if self._parents[slot] != NONE:
+            self._children[self._parents[slot]].remove(slot)
+        if parent != NONE:
+            self._children[parent].append(slot)
+        self._parents[slot] = parent
+
+    def _reload_units(self, ids):
+        """
+        Перечитывает элементы из БД. Родители, которых еще нет в каталоге
+        (их добавят следующие события), перечитываются тоже
+        """
+        parents = {}
+        while ids:
+            for chunk in query_chunks(ids):
+                for row in ShopUnit.objects.filter(
+                        id__in=chunk).values_list(*UNIT_FIELDS):
+                    self._store(row)
+                    parents[row[0]] = row[5]
+            ids = {parent_id for parent_id in parents.values()
+                   if parent_id is not None
+                   and parent_id not in self._slots}
+        for unit_id, parent_id in parents.items():
+            self._attach(self._slots[unit_id], parent_id)
+
+    def _remove_subtree(self, root):
+        if self._parents[root] != NONE:
+            self._children[self._parents[root]].remove(root)
+        removed = set()
+        stack = [root]
+        while stack:
+            slot = stack.pop()
+            if self._children[slot] is not None:
+                stack.extend(self._children[slot])
+            unit_id = self._ids[slot]
+            removed.add(unit_id)
+            del self._slots[unit_id]
+            self._ids[slot] = None
+            self._names[slot] = None
+            self._dates[slot] = None
+            self._parents[slot] = NONE
+            self._children[slot] = None
+            self._free.append(slot)
+        self._remove_sales(removed)
+
+    def _node_item(self, slot):
+        children = self._children[slot]
+        if children is None:
+            price = self._prices[slot]
+            price = None if price == NONE else price
+        else:
+            count = self._counts[slot]
+            price = self._sums[slot] // count if count else None
+        parent = self._parents[slot]
+        return {
+            'id': self._ids[slot],
+            'name': self._names[slot],
+            'type': CATEGORY if self._categories[slot] else OFFER,
+            'parentId': None if parent == NONE else self._ids[parent],
+            'date': format_date(self._dates[slot]),
+            'price': price,
+            'children': None if children is None else [
+                self._node_item(child) for child in children],
+        }
+
+    def node(self, node_id):
+        """
+        Элемент с поддеревом в виде unit_item или None
+        """
+        self.sync()
+        with self._lock.read():
+            slot = self._slots.get(str(node_id))
+            return None if slot is None else self._node_item(slot)
+
+    # Обновления цен товаров
+
+    def _add_sale(self, row_id, row):
+        self._sales_rows[row_id] = row
+        self._sales_by_unit.setdefault(row[0], {})[row[2]] = row_id
+        if row[5] is not None:
+            self._sales_by_parent.setdefault(row[5], set()).add(row_id)
+
+    def _drop_sale(self, row_id):
+        """
+        Удаляет строку обновления из индексов, кроме списка ключей.
+        Возвращает ключ строки
+        """
+        source_id, _, date, _, _, parent_id = self._sales_rows.pop(row_id)
+        dates = self._sales_by_unit[source_id]
+        del dates[date]
+        if not dates:
+            del self._sales_by_unit[source_id]
+        if parent_id is not None:
+            rows = self._sales_by_parent[parent_id]
+            rows.discard(row_id)
+            if not rows:
+                del self._sales_by_parent[parent_id]
+        return date, row_id
+
+    def _remove_sale_key(self, key):
+        index = bisect.bisect_left(self._sales_keys, key)
+        if index < len(self._sales_keys) and self._sales_keys[index] == key:
+            del self._sales_keys[index]
+
+    @staticmethod
+    def _window_start(latest):
+        return latest - datetime.timedelta(
+            days=settings.CATALOG_ENGINE_SALES_DAYS)
+
+    def _replace_sale(self, row_id, row):
+        source_id, date = row[0], row[2]
+        if self._sales_since is not None and date < self._sales_since:
+            # Вне окна, такие сутки читаются из БД
+            return
+        old_id = self._sales_by_unit.get(source_id, {}).get(date)
+        if old_id == row_id:
+            return
+        if old_id is not None:
+            self._remove_sale_key(self._drop_sale(old_id))
+        bisect.insort(self._sales_keys, (date, row_id))
+        self._add_sale(row_id, row)
+        self._trim_sales(self._window_start(self._sales_keys[-1][0]))
+
+    def _trim_sales(self, since):
+        """
+        Сдвигает начало окна обновлений цен на since
+        """
+        if self._sales_since is not None and since <= self._sales_since:
+            return
+        end = bisect.bisect_left(self._sales_keys, (since,))
+        for _, row_id in self._sales_keys[:end]:
+            self._drop_sale(row_id)
+        del self._sales_keys[:end]
+        self._sales_since = since
+
+    def _remove_sales(self, unit_ids):
+        """
+        Удаляет обновления элементов unit_ids и обновления, записанные
+        с ними в качестве родителя: в БД такая история удаляется вместе
+        с категорией, даже если товар потом перенесен в другую
+        """
+        row_ids = set()
+        for unit_id in unit_ids:
+            row_ids.update(self._sales_by_unit.get(unit_id, {}).values())
+            row_ids.update(self._sales_by_parent.get(unit_id, ()))
+        keys = [self._drop_sale(row_id) for row_id in row_ids]
+        if len(keys) <= REBUILD_LIMIT:
+            for key in keys:
+                self._remove_sale_key(key)
+        else:
+            self._sales_keys = [key for key in self._sales_keys
+                                if key[1] in self._sales_rows]
+
+    def _sales_page(self, start_date, after, date, limit):
+        start = bisect.bisect_left(self._sales_keys, (start_date,))
+        if after is not None:
+            start = max(start, bisect.bisect_right(self._sales_keys, after))
+        end = min(bisect.bisect_right(self._sales_keys, (date, float('inf'))),
+                  start + limit)
+        return [(row_id,) + self._sales_rows[row_id]
+                for _, row_id in self._sales_keys[start:end]]
+
+    def _iter_sales(self, start_date, after, date):
+        """
+        Читает обновления частями по CHUNK_SIZE, отпуская блокировку
+        между ними: следующая часть продолжается после ключа последней
+        строки, даже если каталог изменился
+        """
+        while True:
+            with self._lock.read():
+                page = self._sales_page(
+                    start_date, after, date, streaming.CHUNK_SIZE)
+            if not page:
+                return
+            yield from page
+            after = (page[-1][3], page[-1][0])
+
+    def sales(self, date, after=None, limit=None):
+        """
+        Обновления цен товаров за сутки до date включительно в порядке
+        (date, id) после курсора after = (date, id), как get_sales.
+        Возвращает строки ('id', *STATISTIC_FIELDS): с limit - список,
+        без него - итератор. None, если сутки начинаются раньше окна
+        CATALOG_ENGINE_SALES_DAYS и читать их нужно из БД
+        """
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        start_date = date - datetime.timedelta(days=1)
+        self.sync()
+        with self._lock.read():
+            if (self._sales_since is not None
+                    and start_date < self._sales_since):
+                return None
+            if limit is not None:
+                return self._sales_page(start_date, after, date, limit)
+        return self._iter_sales(start_date, after, date)
+
+
+catalog_engine = CatalogEngine()
@@ -0,0 +1,68 @@
+"""
+Потоковый импорт каталога в формате NDJSON: каждая строка - элемент
+импорта или JSON-массив элементов. Строки читаются по одной, элементы
+проверяются и записываются частями по FEED_CHUNK_SIZE, поэтому сами
+элементы не накапливаются в памяти, хранятся только уже импортированные
+id для проверки повторов. Весь фид импортируется в одной транзакции
+с одной датой обновления. Родительские категории должны идти в фиде
+раньше своих элементов
+"""
+import json
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from core.utils import chunked
+from .cache import node_cache
+from .importer import import_units
+from .serializers import ShopUnitImportSerializer
+
+FEED_CHUNK_SIZE = 1000
+
+
+def parse_feed(lines):
+    """
+    Разбирает строки NDJSON в элементы импорта
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            raise ValidationError({'line': number,
+                                   'error': 'Incorrect JSON'})
+        if isinstance(value, dict):
+            yield value
+        elif isinstance(value, list):
+            yield from value
+        else:
+            raise ValidationError({'line': number,
+                                   'error': 'Item or list of items expected'})
+
+
+@transaction.atomic
+def import_feed(lines, date, chunk_size=FEED_CHUNK_SIZE):
+    """
+    Импортирует элементы фида частями через import_units.
+    Повтор id отклоняется, даже если элементы попали в разные части.
+    Возвращает количество импортированных элементов
+    """
+    total = 0
+    seen = set()
+    for chunk in chunked(parse_feed(lines), chunk_size):
+        serializer = ShopUnitImportSerializer(data=chunk, many=True)
+        if not serializer.is_valid():
+            raise ValidationError({'offset': total,
+                                   'items': serializer.errors})
+        for item in serializer.validated_data:
+            if item['id'] in seen:
+                raise ValidationError({'id': item['id'],
+                                       'error': 'Duplicate id'})
+            seen.add(item['id'])
+        import_units(serializer.validated_data, date, invalidate=False)
+        total += len(chunk)
+    # Перечислять все id большого фида дороже, чем очистить кэш
+    node_cache.clear_on_commit()
+    return total
@@ -0,0 +1,52 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class HistoryRecorder:
+    """
+    Собирает записи истории и записывает их одним пакетом.
+    Внутри batch() записи копятся до выхода из блока и записываются
+    в той же транзакции, вне batch() - записываются сразу.
+    Из нескольких записей элемента с одной датой остается последняя
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self._local = threading.local()
+
+    @property
+    def _pending(self):
+        return getattr(self._local, 'pending', None)
+
+    @contextmanager
+    def batch(self):
+        if self._pending is not None:
+            # Вложенный блок пишет вместе с внешним
+            yield
+            return
+
+        self._local.pending = {}
+        try:
+            with transaction.atomic():
+                yield
+                self.flush()
+        finally:
+            self._local.pending = None
+
+    def record(self, rows):
+        """
+        Записывает строки истории или откладывает их до конца batch()
+        """
+        if self._pending is None:
+            self.write(list(rows))
+            return
+        for row in rows:
+            self._pending[(row.source_id, row.date)] = row
+
+    def flush(self):
+        rows = list(self._pending.values())
+        self._pending.clear()
+        if rows:
+            self.write(rows)
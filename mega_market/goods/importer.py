@@ -0,0 +1,181 @@
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .cache import node_cache
+from .models import ShopUnit, ShopUnitType, lock_with_ancestors, \
+    log_event, move_subtree, write_history
+
+BATCH_SIZE = 500
+
+
+def _ancestors(units, parent_id):
+    """
+    Родительские категории элемента в текущем состоянии units
+    """
+    while parent_id:
+        unit = units[parent_id]
+        yield unit
+        parent_id = unit.parent_id
+
+
+def _add_totals(units, unit, sign):
+    """
+    Добавляет (sign=1) или вычитает (sign=-1) товары элемента
+    из агрегатов его родительских категорий
+    """
+    offer_sum, offer_count = unit.offer_totals
+    touched = []
+    for parent in _ancestors(units, unit.parent_id):
+        parent.offer_sum += sign * offer_sum
+        parent.offer_count += sign * offer_count
+        touched.append(parent.id)
+    return touched
+
+
+def _make_paths(units):
+    """
+    Пересчитывает пути элементов units по их текущим родителям
+    """
+    paths = {}
+    for unit_id in units:
+        stack = []
+        while unit_id and unit_id not in paths:
+            stack.append(unit_id)
+            unit_id = units[unit_id].parent_id
+        parent_path = paths.get(unit_id, '')
+        for child_id in reversed(stack):
+            parent_path = paths[child_id] = units[child_id].make_path(
+                parent_path)
+    return paths
+
+
+def _validate(items, units):
+    """
+    Проверяет пачку целиком: типы, родителей и отсутствие циклов
+    """
+    batch = {}
+    for item in items:
+        if item['id'] in batch:
+            raise ValidationError('Duplicate id')
+        batch[item['id']] = item
+
+    for item in items:
+        existing = units.get(item['id'])
+        if existing and existing.type != item['type']:
+            raise ValidationError('Type can not be changed')
+
+        parent_id = item.get('parentId')
+        if parent_id is None:
+            continue
+        parent = batch.get(parent_id) or units.get(parent_id)
+        if parent is None:
+            raise ValidationError('Parent must be existing category')
+        parent_type = (parent['type'] if parent_id in batch
+                       else parent.type)
+        if parent_type != ShopUnitType.CATEGORY.value:
+            raise ValidationError('Parent must be existing category')
+
+    def final_parent(unit_id):
+        if unit_id in batch:
+            return batch[unit_id].get('parentId')
+        return units[unit_id].parent_id
+
+    checked = set()
+    for item in items:
+        path = set()
+        unit_id = item['id']
+        while unit_id and unit_id not in checked:
+            if unit_id in path:
+                raise ValidationError('Cyclic parent reference')
+            path.add(unit_id)
+            unit_id = final_parent(unit_id)
+        checked |= path
+
+
+@transaction.atomic
+def import_units(items, date, invalidate=True):
+    """
+    Импортирует пачку элементов, проверенных ShopUnitImportSerializer.
+    Все затронутые элементы и их родители загружаются заранее
+    и блокируются до конца транзакции, поэтому параллельные импорты
+    и удаления в одной ветке выполняются по очереди. Агрегаты, пути
+    и даты родительских категорий пересчитываются в памяти, а изменения
+    записываются пакетными запросами в одной транзакции. Без invalidate
+    кэш /nodes не инвалидируется, это должен сделать вызывающий код
+    """
+    parent_ids = {item.get('parentId') for item in items} - {None}
+    units = lock_with_ancestors({item['id'] for item in items} | parent_ids)
+    _validate(items, units)
+
+    batch_units = []
+    created = []
+    touched = set()
+
+    # Отсоединяем существующие элементы от прежних родителей
+    for item in items:
+        unit = units.get(item['id'])
+        if unit is None:
+            unit = ShopUnit(id=item['id'])
+            units[unit.id] = unit
+            created.append(unit)
+        else:
+            touched.update(_add_totals(units, unit, -1))
+        unit.parent_id = None
+        batch_units.append(unit)
+
+    # Применяем новые значения и присоединяем к новым родителям
+    for unit, item in zip(batch_units, items):
+        unit.name = item['name']
+        unit.type = item['type']
+        unit.price = item.get('price')
+        unit.date = date
+        unit.parent_id = item.get('parentId')
+        touched.update(_add_totals(units, unit, 1))
+
+    # Дата обновляется у всех новых родителей элементов пачки
+    dated = set()
+    for unit in batch_units:
+        for parent in _ancestors(units, unit.parent_id):
+            if parent.id in dated:
+                break
+            parent.date = date
+            dated.add(parent.id)
+
+    # Переносим поддеревья перемещенных категорий, начиная с глубоких
+    paths = _make_paths(units)
+    moved = sorted(
+        (unit for unit in batch_units
+         if unit.path and unit.path != paths[unit.id]
+         and unit.type == ShopUnitType.CATEGORY.value),
+        key=lambda unit: len(unit.path),
+        reverse=True
+    )
+    for unit in moved:
+        move_subtree(unit.path, paths[unit.id])
+    for unit_id, path in paths.items():
+        units[unit_id].path = path
+
+    batch_ids = {unit.id for unit in batch_units}
+    created_ids = {unit.id for unit in created}
+    ShopUnit.objects.bulk_create(created, batch_size=BATCH_SIZE)
+    ShopUnit.objects.bulk_update(
+        [unit for unit in batch_units if unit.id not in created_ids],
+        ['name', 'type', '_price', 'date', 'parent', 'path',
+         'offer_sum', 'offer_count'],
+        batch_size=BATCH_SIZE
+    )
+    ShopUnit.objects.bulk_update(
+        [units[unit_id] for unit_id in touched - batch_ids],
+        ['offer_sum', 'offer_count', 'date'],
+        batch_size=BATCH_SIZE
+    )
+
+    write_history(
+        batch_units + [units[unit_id] for unit_id in dated - batch_ids],
+        date
+    )
+
+    # Цены и даты меняются только у элементов пачки и их родителей
+    if invalidate:
+        node_cache.invalidate_on_commit(batch_ids | touched)
+    log_event(changed=batch_ids | touched | dated, date=date)
@@ -0,0 +1,100 @@
+"""
+Очередь импортов в БД. Запрос на импорт проверяется и сохраняется
+в ImportJob, а применяет его процесс import_worker. Задачи выполняются
+по одной в порядке update_date, поэтому воркер должен быть один
+"""
+import json
+import logging
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .importer import import_units
+from .models import ImportJob, ImportJobStatus
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_import(items, date):
+    """
+    Ставит проверенные сериализатором элементы в очередь
+    """
+    return ImportJob.objects.create(
+        update_date=date, items=json.dumps(items), total=len(items))
+
+
+def queued_jobs():
+    return ImportJob.objects.filter(
+        status=ImportJobStatus.QUEUED.value).order_by('update_date', 'created')
+
+
+def queue_position(job):
+    """
+    Количество задач, которые будут выполнены раньше job
+    """
+    if job.status != ImportJobStatus.QUEUED.value:
+        return None
+    return queued_jobs().filter(
+        Q(update_date__lt=job.update_date)
+        | Q(update_date=job.update_date, created__lt=job.created)
+    ).count()
+
+
+def recover_jobs():
+    """
+    Возвращает в очередь задачи, прерванные остановкой воркера:
+    их транзакция импорта откатилась
+    """
+    return ImportJob.objects.filter(
+        status=ImportJobStatus.RUNNING.value
+    ).update(status=ImportJobStatus.QUEUED.value, started=None)
+
+
+@transaction.atomic
+def claim_job():
+    """
+    Забирает из очереди задачу с самой ранней update_date
+    """
+    job = queued_jobs().select_for_update().first()
+    if job is not None:
+        job.status = ImportJobStatus.RUNNING.value
+        job.started = timezone.now()
+        job.save(update_fields=['status', 'started'])
+    return job
+
+
+def run_job(job):
+    """
+    Применяет импорт задачи. Ошибка импорта сохраняется в задаче
+    """
+    try:
+        import_units(json.loads(job.items), job.update_date)
+    except ValidationError as e:
+        job.status = ImportJobStatus.FAILED.value
+        job.error = json.dumps(e.detail, ensure_ascii=False)
+    except Exception as e:
+        logger.exception('Import job %s failed', job.id)
+        job.status = ImportJobStatus.FAILED.value
+        job.error = repr(e)
+    else:
+        job.status = ImportJobStatus.DONE.value
+        job.items = ''
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'error', 'items', 'finished'])
+    return job
+
+
+def process_jobs():
+    """
+    Выполняет задачи, пока очередь не опустеет.
+    Возвращает количество выполненных задач
+    """
+    count = 0
+    while True:
+        job = claim_job()
+        if job is None:
+            return count
+        run_job(job)
+        count += 1
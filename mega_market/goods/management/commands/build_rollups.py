@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from goods.models import RollupInterval
+from goods.rollups import BATCH_SIZE, build_rollups, reset_rollups
+
+
+class Command(BaseCommand):
+    help = ('Строит агрегаты истории цен по интервалам из записей истории, '
+            'добавленных после предыдущего запуска')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', action='append',
+            choices=[interval.value for interval in RollupInterval],
+            help='Интервал агрегации, по умолчанию все')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество записей истории в одной транзакции')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Удалить агрегаты и построить их заново по всей истории')
+
+    def handle(self, *args, **options):
+        intervals = options['interval'] or [
+            interval.value for interval in RollupInterval]
+        for interval in intervals:
+            if options['rebuild']:
+                reset_rollups(interval)
+            processed = build_rollups(interval, options['batch_size'])
+            self.stdout.write(f'{interval}: {processed} history rows')
@@ -0,0 +1,41 @@
+import sys
+
+from dateutil.parser import isoparse
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from goods.feed import FEED_CHUNK_SIZE, import_feed
+
+
+class Command(BaseCommand):
+    help = ('Импортирует каталог из файла NDJSON (элемент или массив '
+            'элементов в каждой строке) одной транзакцией')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл NDJSON, "-" - стандартный ввод')
+        parser.add_argument(
+            '--date', required=True, help='Дата обновления в ISO 8601')
+        parser.add_argument(
+            '--chunk-size', type=int, default=FEED_CHUNK_SIZE,
+            help='Количество элементов в одной пачке импорта')
+
+    def handle(self, *args, **options):
+        try:
+            date = isoparse(options['date'])
+        except ValueError:
+            raise CommandError('Incorrect date format')
+
+        if options['path'] == '-':
+            total = self.import_lines(sys.stdin.buffer, date, options)
+        else:
+            with open(options['path'], 'rb') as lines:
+                total = self.import_lines(lines, date, options)
+        self.stdout.write(f'Imported {total} items')
+
+    @staticmethod
+    def import_lines(lines, date, options):
+        try:
+            return import_feed(lines, date, options['chunk_size'])
+        except ValidationError as e:
+            raise CommandError(e.detail)
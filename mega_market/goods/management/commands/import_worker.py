@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from goods.jobs import process_jobs, recover_jobs
+
+
+class Command(BaseCommand):
+    help = ('Выполняет импорты из очереди (POST /imports?async=1) '
+            'по порядку updateDate. Запускать не больше одного процесса')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задачи из очереди и завершиться')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза между проверками пустой очереди, секунды')
+
+    def handle(self, *args, **options):
+        recovered = recover_jobs()
+        if recovered:
+            self.stdout.write(f'Requeued {recovered} interrupted jobs')
+        while True:
+            count = process_jobs()
+            if count:
+                self.stdout.write(f'Processed {count} jobs')
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from goods.partitions import RETENTION_DETACH, RETENTION_DROP, \
+    apply_retention, ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = ('Создает секции истории на следующие месяцы и применяет '
+            'политику хранения к старым секциям (только PostgreSQL)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int,
+            default=settings.HISTORY_PARTITIONS_AHEAD,
+            help='На сколько месяцев вперед создавать секции')
+        parser.add_argument(
+            '--retention-months', type=int,
+            default=settings.HISTORY_RETENTION_MONTHS,
+            help='Сколько полных месяцев истории хранить')
+        parser.add_argument(
+            '--retention-action', choices=[RETENTION_DETACH, RETENTION_DROP],
+            default=settings.HISTORY_RETENTION_ACTION,
+            help='Что делать со старыми секциями')
+        parser.add_argument(
+            '--no-compact', action='store_false', dest='compact',
+            default=settings.HISTORY_RETENTION_COMPACT,
+            help='Не достраивать агрегаты перед удалением секций')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write('History table is not partitioned')
+            return
+
+        for name in ensure_partitions(options['months_ahead']):
+            self.stdout.write(f'Created {name}')
+        if options['retention_months'] is None:
+            return
+        expired = apply_retention(
+            options['retention_months'], options['retention_action'],
+            options['compact'])
+        for name in expired:
+            self.stdout.write(f'{options["retention_action"]} {name}')
@@ -0,0 +1,45 @@
+import sys
+
+from dateutil.parser import isoparse
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from goods.seeding import SEED_CHUNK_SIZE, seed_catalog
+
+
+class Command(BaseCommand):
+    help = ('Загружает каталог в пустую базу из файла NDJSON: на PostgreSQL '
+            'через COPY, на остальных СУБД пакетными INSERT')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл NDJSON, "-" - стандартный ввод')
+        parser.add_argument(
+            '--date', required=True, help='Дата обновления в ISO 8601')
+        parser.add_argument(
+            '--replace', action='store_true',
+            help='Заменить существующий каталог вместе с историей')
+        parser.add_argument(
+            '--chunk-size', type=int, default=SEED_CHUNK_SIZE,
+            help='Количество элементов, проверяемых и загружаемых за раз')
+
+    def handle(self, *args, **options):
+        try:
+            date = isoparse(options['date'])
+        except ValueError:
+            raise CommandError('Incorrect date format')
+
+        if options['path'] == '-':
+            total = self.seed(sys.stdin.buffer, date, options)
+        else:
+            with open(options['path'], 'rb') as lines:
+                total = self.seed(lines, date, options)
+        self.stdout.write(f'Seeded {total} items')
+
+    @staticmethod
+    def seed(lines, date, options):
+        try:
+            return seed_catalog(lines, date, options['replace'],
+                                options['chunk_size'])
+        except ValidationError as e:
+            raise CommandError(e.detail)
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+def fill_offer_totals(apps, schema_editor):
+    """
+    Заполняет агрегаты категорий по уже загруженным товарам
+    """
+    ShopUnit = apps.get_model('goods', 'ShopUnit')
+    parents = dict(ShopUnit.objects.values_list('id', 'parent_id'))
+    totals = {}
+    offers = ShopUnit.objects.filter(type='OFFER').values_list(
+        'parent_id', '_price')
+    for parent_id, price in offers:
+        while parent_id:
+            offer_sum, offer_count = totals.get(parent_id, (0, 0))
+            totals[parent_id] = offer_sum + (price or 0), offer_count + 1
+            parent_id = parents.get(parent_id)
+
+    categories = list(ShopUnit.objects.filter(id__in=list(totals)))
+    for category in categories:
+        category.offer_sum, category.offer_count = totals[category.id]
+    ShopUnit.objects.bulk_update(
+        categories, ['offer_sum', 'offer_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopunit',
+            name='offer_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shopunit',
+            name='offer_sum',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_offer_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    """
+    Заполняет пути для уже загруженных элементов
+    """
+    ShopUnit = apps.get_model('goods', 'ShopUnit')
+    parents = dict(ShopUnit.objects.values_list('id', 'parent_id'))
+    paths = {}
+    for unit_id in parents:
+        stack = []
+        while unit_id and unit_id not in paths:
+            stack.append(unit_id)
+            unit_id = parents[unit_id]
+        parent_path = paths.get(unit_id, '')
+        for child_id in reversed(stack):
+            parent_path = paths[child_id] = f'{parent_path}{child_id}/'
+
+    units = list(ShopUnit.objects.all())
+    for unit in units:
+        unit.path = paths[unit.id]
+    ShopUnit.objects.bulk_update(units, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0002_shopunit_offer_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopunit',
+            name='path',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='shopunit',
+            index=models.Index(fields=['path'], name='shopunit_path_idx',
+                               opclasses=['text_pattern_ops']),
+        ),
+    ]
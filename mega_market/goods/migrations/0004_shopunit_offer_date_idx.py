@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('goods', '0003_shopunit_path'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='shopunit',
+            index=models.Index(condition=models.Q(type='OFFER'),
+                               fields=['date'],
+                               name='shopunit_offer_date_idx'),
+        ),
+    ]
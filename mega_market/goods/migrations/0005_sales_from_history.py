@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('goods', '0004_shopunit_offer_date_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='shopunitstatisticunit',
+            index=models.Index(fields=['type', 'date'],
+                               name='statistic_type_date_idx'),
+        ),
+        # /sales больше не читает ShopUnit
+        migrations.RemoveIndex(
+            model_name='shopunit',
+            name='shopunit_offer_date_idx',
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+from core.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('goods', '0005_sales_from_history'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='shopunitstatisticunit',
+            index=models.Index(fields=['source', 'date'],
+                               name='statistic_source_date_idx'),
+        ),
+        # Индекс внешнего ключа покрывается statistic_source_date_idx
+        migrations.AlterField(
+            model_name='shopunitstatisticunit',
+            name='source',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='history', to='goods.ShopUnit'),
+        ),
+    ]
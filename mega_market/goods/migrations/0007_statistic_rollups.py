@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0006_statistic_source_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('interval', models.TextField(choices=[('hour', 'hour'), ('day', 'day'), ('week', 'week')], max_length=4, primary_key=True, serialize=False)),
+                ('history_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShopUnitStatisticRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField(max_length=255)),
+                ('date', models.DateTimeField()),
+                ('type', models.TextField(choices=[('OFFER', 'OFFER'), ('CATEGORY', 'CATEGORY')], max_length=8)),
+                ('interval', models.TextField(choices=[('hour', 'hour'), ('day', 'day'), ('week', 'week')], max_length=4)),
+                ('price', models.IntegerField(null=True)),
+                ('min_price', models.IntegerField(null=True)),
+                ('max_price', models.IntegerField(null=True)),
+                ('price_sum', models.BigIntegerField(default=0)),
+                ('price_count', models.IntegerField(default=0)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups_children', to='goods.ShopUnit')),
+                ('source', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='goods.ShopUnit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='shopunitstatisticrollup',
+            constraint=models.UniqueConstraint(fields=('source', 'interval', 'date'), name='unique_rollup'),
+        ),
+    ]
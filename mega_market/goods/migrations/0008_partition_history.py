@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def partition_history(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from goods.partitions import rebuild_history_table
+    with schema_editor.connection.cursor() as cursor:
+        rebuild_history_table(cursor, partitioned=True)
+
+
+def unpartition_history(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from goods.partitions import rebuild_history_table
+    with schema_editor.connection.cursor() as cursor:
+        rebuild_history_table(cursor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0007_statistic_rollups'),
+    ]
+
+    operations = [
+        # Секционирование по месяцам date, см. goods.partitions
+        migrations.RunPython(partition_history, unpartition_history),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0009_import_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.TextField(choices=[('upsert', 'upsert'), ('delete', 'delete'), ('reset', 'reset')], max_length=6)),
+                ('changed', models.TextField(default='[]')),
+                ('deleted', models.TextField(default='[]')),
+                ('date', models.DateTimeField(null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+def set_unlogged(apps, schema_editor):
+    # Счетчики не нужно восстанавливать после сбоя, запись в них
+    # не должна проходить через WAL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE goods_throttlecounter SET UNLOGGED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0010_catalog_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleCounter',
+            fields=[
+                ('key', models.TextField(primary_key=True, serialize=False)),
+                ('bucket', models.BigIntegerField()),
+                ('count', models.IntegerField()),
+            ],
+        ),
+        migrations.RunPython(set_unlogged, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0011_throttle_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupwatermark',
+            name='pending',
+            field=models.TextField(default='[]'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-18 21:55
+
+from django.db import migrations, models
+
+
+def set_collation(collation):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        schema_editor.execute(
+            'ALTER TABLE goods_shopunit ALTER COLUMN path '
+            f'TYPE text COLLATE "{collation}"')
+    return operation
+
+
+class Migration(migrations.Migration):
+    # С побайтовым сравнением "C" обычный индекс по path подходит и для
+    # поиска потомков по LIKE 'префикс%', и для сравнения и сортировки
+    # по path при удалении поддерева частями
+
+    dependencies = [
+        ('goods', '0012_rollupwatermark_pending'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='shopunit',
+            name='shopunit_path_idx',
+        ),
+        migrations.RunPython(set_collation('C'),
+                             set_collation('default')),
+        migrations.AddIndex(
+            model_name='shopunit',
+            index=models.Index(fields=['path'], name='shopunit_path_idx'),
+        ),
+    ]
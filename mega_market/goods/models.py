@@ -1,9 +1,22 @@
+import datetime
 import enum
+import json
+import uuid
+from collections import defaultdict
 
-from django.db import models
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from core.utils import chunked
+from .cache import INVALIDATE_LIMIT, node_cache
+from .history import HistoryRecorder
+
+DELETE_CHUNK_SIZE = 500
+
 
 class ShopUnitType(enum.Enum):
     """
@@ -17,6 +30,46 @@ class ShopUnitType(enum.Enum):
         return tuple((e.name, e.value) for e in cls)
 
 
+class RollupInterval(enum.Enum):
+    """
+    Интервалы агрегации истории
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    WEEK = 'week'
+
+    @classmethod
+    def choices(cls):
+        return tuple((e.value, e.value) for e in cls)
+
+
+class ImportJobStatus(enum.Enum):
+    """
+    Состояния задачи импорта
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    @classmethod
+    def choices(cls):
+        return tuple((e.value, e.value) for e in cls)
+
+
+class CatalogEventKind(enum.Enum):
+    """
+    Виды изменений каталога в журнале CatalogEvent
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    RESET = 'reset'
+
+    @classmethod
+    def choices(cls):
+        return tuple((e.value, e.value) for e in cls)
+
+
 class ShopUnitABS(models.Model):
     class Meta:
         abstract = True
@@ -30,8 +83,22 @@ class ShopUnit(ShopUnitABS):
     """
     Товар, категория
     """
+
+    class Meta:
+        indexes = [
+            # В PostgreSQL path сравнивается побайтово (COLLATE "C",
+            # миграция 0013): индекс подходит и для LIKE 'префикс%',
+            # и для сортировки по path
+            models.Index(fields=['path'], name='shopunit_path_idx'),
+        ]
+
     id = models.TextField(primary_key=True, max_length=36)
+    # id всех родителей и самого элемента через '/', начиная с корня
+    path = models.TextField(default='')
     _price = models.IntegerField(null=True)
+    # Сумма и количество товаров в поддереве категории
+    offer_sum = models.BigIntegerField(default=0)
+    offer_count = models.IntegerField(default=0)
     parent = models.ForeignKey(
         to='ShopUnit',
         on_delete=models.CASCADE,
@@ -50,21 +117,69 @@ class ShopUnit(ShopUnitABS):
         self._price = value
 
     def get_category_price(self):
-        parent_category_ids = [self.id]
-        child_prices = []
-        while parent_category_ids:
-            current_id = parent_category_ids.pop()
-            children = self.__class__.objects.filter(parent__id=current_id)
-            [child_prices.append(e.price)
-             for e in children
-             if e.type == ShopUnitType.OFFER.value]
-            [parent_category_ids.append(e.id)
-             for e in children
-             if e.type == ShopUnitType.CATEGORY.value]
-        if child_prices:
-            return sum(child_prices) / len(child_prices)
+        if self.offer_count:
+            return self.offer_sum / self.offer_count
         return None
 
+    @property
+    def offer_totals(self):
+        """
+        Вклад элемента в агрегаты родительских категорий: (сумма, количество)
+        """
+        if self.type == ShopUnitType.OFFER.value:
+            return self._price or 0, 1
+        return self.offer_sum, self.offer_count
+
+    @property
+    def ancestor_ids(self):
+        """
+        id родительских категорий, начиная с корня
+        """
+        return self.path.split('/')[:-2]
+
+    def make_path(self, parent_path):
+        return f'{parent_path}{self.id}/'
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        """
+        Сохраняет элемент и переносит его товары из агрегатов прежних
+        родительских категорий в агрегаты новых. Элемент и родители
+        блокируются до конца транзакции, как при импорте
+        """
+        units = lock_with_ancestors({self.id, self.parent_id} - {None})
+        old = units.get(self.id)
+        parent = None
+        if self.parent_id:
+            parent = units.get(self.parent_id)
+            if parent is None:
+                raise ShopUnit.DoesNotExist('Parent does not exist')
+        if self.type == ShopUnitType.CATEGORY.value:
+            # Агрегаты категории меняются только вместе с ее товарами
+            self.offer_sum, self.offer_count = (
+                (old.offer_sum, old.offer_count) if old else (0, 0))
+
+        old_path = old.path if old else ''
+        self.path = self.make_path(parent.path if parent else '')
+        if old_path and old_path != self.path:
+            move_subtree(old_path, self.path)
+        super().save(*args, **kwargs)
+
+        totals = defaultdict(lambda: (0, 0))
+        for unit, sign in ((old, -1), (self, 1)):
+            if unit is None:
+                continue
+            offer_sum, offer_count = unit.offer_totals
+            for parent_id in unit.ancestor_ids:
+                total = totals[parent_id]
+                totals[parent_id] = (total[0] + sign * offer_sum,
+                                     total[1] + sign * offer_count)
+        shift_totals(totals)
+
+        ids = set(self.path.split('/')[:-1] + old_path.split('/')[:-1])
+        node_cache.invalidate_on_commit(ids)
+        log_event(changed=ids, date=self.date)
+
     def __str__(self):
         return f'[{self.id}] {self.type}: {self.name} - {self.price}'
 
@@ -79,6 +194,15 @@ class ShopUnitStatisticUnit(ShopUnitABS):
             models.UniqueConstraint(fields=['date', 'source'],
                                     name='unique_update')
         ]
+        indexes = [
+            # Индекс под выборку /sales
+            models.Index(fields=['type', 'date'],
+                         name='statistic_type_date_idx'),
+            # Индекс под выборку /node/{id}/statistic, заменяет
+            # индекс внешнего ключа source
+            models.Index(fields=['source', 'date'],
+                         name='statistic_source_date_idx'),
+        ]
 
     price = models.IntegerField(null=True)
 
@@ -86,6 +210,7 @@ class ShopUnitStatisticUnit(ShopUnitABS):
         to='ShopUnit',
         on_delete=models.CASCADE,
         related_name='history',
+        db_index=False,
     )
 
     parent = models.ForeignKey(
@@ -100,34 +225,410 @@ class ShopUnitStatisticUnit(ShopUnitABS):
         return f'[{self.source.id}] {self.name}: {self.price}'
 
 
+class ShopUnitStatisticRollup(ShopUnitABS):
+    """
+    История элемента, агрегированная по интервалам.
+    date - начало интервала, name, type, parent и price - из последней
+    записи истории в интервале
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'interval', 'date'],
+                                    name='unique_rollup')
+        ]
+
+    interval = models.TextField(choices=RollupInterval.choices(),
+                                max_length=4)
+    price = models.IntegerField(null=True)
+    min_price = models.IntegerField(null=True)
+    max_price = models.IntegerField(null=True)
+    # Сумма и количество непустых цен за интервал
+    price_sum = models.BigIntegerField(default=0)
+    price_count = models.IntegerField(default=0)
+
+    source = models.ForeignKey(
+        to='ShopUnit',
+        on_delete=models.CASCADE,
+        related_name='rollups',
+        db_index=False,
+    )
+
+    parent = models.ForeignKey(
+        to='ShopUnit',
+        on_delete=models.CASCADE,
+        related_name='rollups_children',
+        null=True,
+        blank=True
+    )
+
+    def __str__(self):
+        return f'[{self.source_id}] {self.interval} {self.date}: {self.price}'
+
+
+class RollupWatermark(models.Model):
+    """
+    Последняя запись истории, учтенная в агрегатах интервала
+    """
+    interval = models.TextField(choices=RollupInterval.choices(),
+                                max_length=4, primary_key=True)
+    history_id = models.BigIntegerField(default=0)
+    # id ниже history_id, которых не было среди записей при переносе
+    # отметки: их транзакции могли еще не зафиксироваться
+    pending = models.TextField(default='[]')
+
+
+class ImportJob(models.Model):
+    """
+    Импорт, поставленный в очередь. Выполняется командой import_worker
+    в порядке update_date
+    """
+
+    class Meta:
+        indexes = [
+            # Индекс под выборку следующей задачи из очереди
+            models.Index(fields=['status', 'update_date', 'created'],
+                         name='importjob_queue_idx'),
+        ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    status = models.TextField(choices=ImportJobStatus.choices(),
+                              max_length=7,
+                              default=ImportJobStatus.QUEUED.value)
+    update_date = models.DateTimeField()
+    # Проверенные сериализатором элементы в JSON, очищаются после импорта
+    items = models.TextField()
+    total = models.IntegerField()
+    error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f'[{self.id}] {self.update_date}: {self.status}'
+
+
+class CatalogEvent(models.Model):
+    """
+    Журнал изменений каталога для каталога в памяти (goods.engine).
+    id событий растут в порядке фиксации транзакций
+    """
+    id = models.BigAutoField(primary_key=True)
+    kind = models.TextField(choices=CatalogEventKind.choices(), max_length=6)
+    # id элементов в JSON: измененные (перечитываются из БД)
+    # и корни удаленных поддеревьев
+    changed = models.TextField(default='[]')
+    deleted = models.TextField(default='[]')
+    # Дата обновления, записи истории с которой перечитываются
+    date = models.DateTimeField(null=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'[{self.id}] {self.kind}'
+
+
+class ThrottleCounter(models.Model):
+    """
+    Счетчик запросов клиента за текущее окно ограничения частоты
+    (goods.throttle.DatabaseCounterStore)
+    """
+    key = models.TextField(primary_key=True)
+    # Окно: время его окончания в секундах
+    bucket = models.BigIntegerField()
+    count = models.IntegerField()
+
+
 @receiver(post_save, sender=ShopUnit)
 def post_save_handler(sender, instance, created, **kwargs):
     """
-    Обработчик пост-сохранения - добавляем запись в историю
+    Обработчик пост-сохранения - добавляем запись в историю.
+    С HISTORY_RECORDER = 'signal' запись пишется отдельными запросами
+    при каждом сохранении, как раньше
     """
-    obj, _ = ShopUnitStatisticUnit.objects.get_or_create(
+    if settings.HISTORY_RECORDER != 'signal':
+        history_recorder.record([history_row(instance, instance.date)])
+        return
+
+    ShopUnitStatisticUnit.objects.update_or_create(
         date=instance.date,
         source=instance,
         defaults={'name': instance.name,
                   'type': instance.type,
-                  'parent': instance.parent}
+                  'parent_id': instance.parent_id,
+                  'price': instance.price}
     )
-    obj.price = instance.price
-    obj.save()
 
 
-def update_parents_date(ids, date):
+def get_subtree(node_id):
     """
-    Обновляет дату изменения для родительских элементов
+    Загружает элемент со всеми потомками и собирает дерево в памяти.
+    Дочерние элементы категорий доступны в атрибуте loaded_children,
+    у товаров он равен None
     """
+    path = ShopUnit.objects.filter(
+        id=str(node_id)).values_list('path', flat=True).first()
+    if path is None:
+        return None
+
+    units = list(ShopUnit.objects.filter(path__startswith=path))
+    by_id = {}
+    for unit in units:
+        unit.loaded_children = (
+            [] if unit.type == ShopUnitType.CATEGORY.value else None)
+        by_id[unit.id] = unit
+
+    root = by_id[str(node_id)]
+    for unit in units:
+        if unit is not root:
+            by_id[unit.parent_id].loaded_children.append(unit)
+    return root
+
+
+def get_sales(date):
+    """
+    Обновления товаров за сутки до date включительно
+    в порядке (date, id)
+    """
+    return ShopUnitStatisticUnit.objects.filter(
+        type=ShopUnitType.OFFER.value,
+        date__gte=date - datetime.timedelta(days=1),
+        date__lte=date
+    ).order_by('date', 'id')
+
 
-    ids_to_update = ids
+def get_statistic(node_id, date_from=None, date_to=None):
+    """
+    История элемента за полуинтервал [date_from, date_to) по порядку дат
+    """
+    queryset = ShopUnitStatisticUnit.objects.filter(source_id=node_id)
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lt=date_to)
+    return queryset.order_by('date')
 
-    while ids_to_update:
-        elements = ShopUnit.objects.filter(id__in=ids_to_update)
-        ids_to_update = []
-        for element in elements:
-            element.date = date
-            if element.parent:
-                ids_to_update.append(element.parent.id)
-            element.save()
+
+def get_statistic_rollups(node_id, interval, date_from=None, date_to=None):
+    """
+    Агрегаты истории элемента по интервалам,
+    начинающимся в полуинтервале [date_from, date_to)
+    """
+    queryset = ShopUnitStatisticRollup.objects.filter(
+        source_id=node_id, interval=interval)
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lt=date_to)
+    return queryset.order_by('date')
+
+
+def query_chunks(ids):
+    """
+    Делит список id на части, укладывающиеся в лимит параметров запроса
+    """
+    ids = list(ids)
+    return chunked(ids, connection.features.max_query_params or len(ids) or 1)
+
+
+def get_units(ids, lock=False):
+    """
+    Загружает элементы по id. Возвращает словарь id -> ShopUnit.
+    С lock=True строки блокируются до конца транзакции в порядке id
+    """
+    queryset = ShopUnit.objects.all()
+    if lock:
+        queryset = queryset.select_for_update().order_by('id')
+        ids = sorted(ids)
+    units = {}
+    for chunk in query_chunks(ids):
+        units.update(
+            (unit.id, unit) for unit in queryset.filter(id__in=chunk))
+    return units
+
+
+def get_with_ancestors(ids):
+    """
+    Загружает элементы по id вместе со всеми их родителями.
+    Возвращает словарь id -> ShopUnit
+    """
+    units = get_units(ids)
+    ancestor_ids = {parent_id
+                    for unit in units.values()
+                    for parent_id in unit.ancestor_ids}
+    units.update(get_units(ancestor_ids - set(units)))
+    return units
+
+
+def lock_with_ancestors(ids):
+    """
+    Загружает элементы по id вместе с родителями, как get_with_ancestors,
+    и блокирует их строки до конца транзакции. Изменения, затрагивающие
+    общих родителей, выполняются по очереди и не теряют обновлений
+    агрегатов друг друга. Строки блокируются в порядке id; если пока
+    ждали блокировку, элемент перенесли, блокируются и новые родители
+    """
+    ids = set(ids)
+    wanted = ids | set(get_with_ancestors(ids))
+    requested = set()
+    units = {}
+    while wanted - requested:
+        units.update(get_units(wanted - requested, lock=True))
+        requested |= wanted
+        wanted = ids | {parent_id
+                        for unit_id in ids if unit_id in units
+                        for parent_id in units[unit_id].ancestor_ids}
+    return {unit_id: unit for unit_id, unit in units.items()
+            if unit_id in wanted}
+
+
+def shift_totals(totals):
+    """
+    Прибавляет к агрегатам категорий разности id -> (сумма, количество)
+    одним запросом UPDATE на каждую разность
+    """
+    by_delta = defaultdict(list)
+    for unit_id, delta in totals.items():
+        if any(delta):
+            by_delta[delta].append(unit_id)
+    for (offer_sum, offer_count), unit_ids in by_delta.items():
+        for chunk in query_chunks(unit_ids):
+            ShopUnit.objects.filter(id__in=chunk).update(
+                offer_sum=F('offer_sum') + offer_sum,
+                offer_count=F('offer_count') + offer_count
+            )
+
+
+def move_subtree(old_path, new_path):
+    """
+    Заменяет префикс пути у элемента и всех его потомков
+    """
+    ShopUnit.objects.filter(path__startswith=old_path).update(
+        path=Concat(Value(new_path), Substr('path', len(old_path) + 1),
+                    output_field=models.TextField())
+    )
+
+
+def log_event(changed=(), deleted=(), date=None,
+              kind=CatalogEventKind.UPSERT):
+    """
+    Записывает изменение каталога в журнал, если включен каталог в памяти.
+    Вызывается в транзакции изменения. На PostgreSQL таблица журнала
+    блокируется до фиксации, чтобы id событий шли в порядке фиксации
+    """
+    if not settings.CATALOG_ENGINE:
+        return
+    if deleted:
+        kind = CatalogEventKind.DELETE
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'LOCK TABLE {CatalogEvent._meta.db_table} '
+                f'IN SHARE ROW EXCLUSIVE MODE')
+    CatalogEvent.objects.create(
+        kind=kind.value, changed=json.dumps(sorted(changed)),
+        deleted=json.dumps(sorted(deleted)), date=date)
+
+
+def history_row(unit, date):
+    """
+    Запись истории с текущим состоянием элемента
+    """
+    return ShopUnitStatisticUnit(
+        date=date,
+        source_id=unit.id,
+        parent_id=unit.parent_id,
+        name=unit.name,
+        type=unit.type,
+        price=unit.price
+    )
+
+
+def save_history(rows):
+    """
+    Записывает строки истории. Записи тех же элементов
+    с теми же датами заменяются одним запросом DELETE на пачку
+    строк с любыми датами
+    """
+    # На строку нужно до двух параметров запроса: дата и id
+    size = (connection.features.max_query_params or 2 * len(rows) or 2) // 2
+    for chunk in chunked(rows, size):
+        source_ids = defaultdict(list)
+        for row in chunk:
+            source_ids[row.date].append(row.source_id)
+        condition = Q()
+        for date, ids in source_ids.items():
+            condition |= Q(date=date, source_id__in=ids)
+        ShopUnitStatisticUnit.objects.filter(condition).delete()
+    ShopUnitStatisticUnit.objects.bulk_create(rows, batch_size=500)
+
+
+history_recorder = HistoryRecorder(save_history)
+
+
+def write_history(units, date):
+    """
+    Записывает текущее состояние элементов в историю.
+    Записи этих элементов с той же датой заменяются
+    """
+    history_recorder.record(history_row(unit, date) for unit in units)
+
+
+@transaction.atomic
+def delete_unit(unit):
+    """
+    Удаляет элемент вместе с поддеревом частями по DELETE_CHUNK_SIZE,
+    не загружая объекты, и вычитает его товары из агрегатов родительских
+    категорий. Дата обновления родителей не меняется.
+    Элемент перечитывается вместе с родителями под блокировкой, как
+    при импорте: импорт в поддерево блокирует и сам элемент, поэтому
+    выполняется до или после удаления целиком. Возвращает False, если
+    элемент уже удален
+    """
+    unit = lock_with_ancestors([unit.id]).get(unit.id)
+    if unit is None:
+        return False
+
+    offer_sum, offer_count = unit.offer_totals
+    if offer_count:
+        ShopUnit.objects.filter(id__in=unit.ancestor_ids).update(
+            offer_sum=F('offer_sum') - offer_sum,
+            offer_count=F('offer_count') - offer_count
+        )
+    node_cache.invalidate_on_commit(unit.ancestor_ids)
+    log_event(changed=unit.ancestor_ids, deleted=[unit.id])
+
+    subtree = ShopUnit.objects.filter(path__startswith=unit.path)
+    clear_cache = subtree.count() > INVALIDATE_LIMIT
+    if clear_cache:
+        node_cache.clear_on_commit()
+    # Части выбираются по индексу path после последнего удаленного
+    # элемента, чтобы не просматривать заново уже удаленные строки
+    last_path = ''
+    while True:
+        rows = list(subtree.filter(path__gt=last_path).order_by(
+            'path').values_list('id', 'path')[:DELETE_CHUNK_SIZE])
+        if not rows:
+            break
+        ids = [row_id for row_id, _ in rows]
+        if not clear_cache:
+            node_cache.invalidate_on_commit(ids)
+        _delete_units(ids)
+        last_path = rows[-1][1]
+    return True
+
+
+def _delete_units(ids):
+    """
+    Удаляет элементы и их историю запросами DELETE без сборщика
+    каскадного удаления Django. Дочерние элементы должны удаляться
+    в той же транзакции
+    """
+    for model in (ShopUnitStatisticUnit, ShopUnitStatisticRollup):
+        # У истории нет зависимых объектов, QuerySet.delete()
+        # выполняется одним запросом
+        model.objects.filter(source_id__in=ids).delete()
+        model.objects.filter(parent_id__in=ids).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {ShopUnit._meta.db_table} WHERE id IN '
+            f'({", ".join(["%s"] * len(ids))})', ids)
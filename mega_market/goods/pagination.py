@@ -0,0 +1,45 @@
+import base64
+import binascii
+
+from dateutil.parser import isoparse
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+
+MAX_LIMIT = 10000
+
+
+def encode_cursor(row_id, date):
+    """
+    Курсор на строку: позиция (date, id) в порядке выдачи
+    """
+    value = f'{date.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date, row_id = value.split('|')
+        return isoparse(date), int(row_id)
+    except (ValueError, binascii.Error):
+        raise ParseError('Incorrect cursor')
+
+
+def parse_limit(limit):
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ParseError('Incorrect limit')
+    if not 0 < limit <= MAX_LIMIT:
+        raise ParseError('Incorrect limit')
+    return limit
+
+
+def after_cursor(queryset, cursor):
+    """
+    Строки queryset (упорядоченного по date, id) после курсора
+    """
+    date, row_id = decode_cursor(cursor)
+    return queryset.filter(Q(date__gt=date) | Q(date=date, id__gt=row_id))
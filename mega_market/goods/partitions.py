@@ -0,0 +1,214 @@
+"""
+Секционирование истории (PostgreSQL): таблица ShopUnitStatisticUnit
+разбита по месяцам поля date, записи вне созданных секций попадают
+в секцию по умолчанию. На остальных СУБД таблица не секционируется
+и функции этого модуля ничего не делают
+"""
+import datetime
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CatalogEventKind, RollupInterval, \
+    ShopUnitStatisticUnit, log_event
+from .rollups import build_rollups
+
+HISTORY_TABLE = ShopUnitStatisticUnit._meta.db_table
+DEFAULT_PARTITION = f'{HISTORY_TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{HISTORY_TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+RETENTION_DETACH = 'detach'
+RETENTION_DROP = 'drop'
+
+
+def month_start(date):
+    return datetime.datetime(date.year, date.month, 1,
+                             tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f'{HISTORY_TABLE}_p{month:%Y_%m}'
+
+
+def partition_month(name):
+    """
+    Месяц секции по ее имени или None для чужих таблиц
+    """
+    match = PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    return datetime.datetime(int(match[1]), int(match[2]), 1,
+                             tzinfo=datetime.timezone.utc)
+
+
+def expired_partitions(names, keep_months, today):
+    """
+    Секции, все записи которых старше keep_months полных месяцев
+    """
+    cutoff = add_months(month_start(today), -keep_months)
+    return sorted(
+        name for name in names
+        if partition_month(name) is not None
+        and partition_month(name) < cutoff
+    )
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass",
+            [HISTORY_TABLE])
+        return cursor.fetchone()[0]
+
+
+def list_partitions(cursor):
+    cursor.execute(
+        'SELECT inhrelid::regclass::text FROM pg_inherits '
+        'WHERE inhparent = %s::regclass', [HISTORY_TABLE])
+    return [name for name, in cursor.fetchall()]
+
+
+def create_partition(cursor, month):
+    """
+    Создает секцию на месяц. Записи этого месяца, попавшие в секцию
+    по умолчанию, переносятся в новую секцию
+    """
+    name = partition_name(month)
+    cursor.execute(
+        f'CREATE TABLE {name} (LIKE {HISTORY_TABLE} INCLUDING DEFAULTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+        f'WHERE date >= %s AND date < %s RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved',
+        [month, add_months(month, 1)])
+    cursor.execute(
+        f'ALTER TABLE {HISTORY_TABLE} ATTACH PARTITION {name} '
+        f'FOR VALUES FROM (%s) TO (%s)', [month, add_months(month, 1)])
+    return name
+
+
+@transaction.atomic
+def ensure_partitions(months_ahead, today=None):
+    """
+    Создает недостающие секции с текущего месяца на months_ahead вперед.
+    Возвращает имена созданных секций
+    """
+    if not is_partitioned():
+        return []
+    month = month_start(today or timezone.now())
+    with connection.cursor() as cursor:
+        existing = set(list_partitions(cursor))
+        return [
+            create_partition(cursor, add_months(month, offset))
+            for offset in range(months_ahead + 1)
+            if partition_name(add_months(month, offset)) not in existing
+        ]
+
+
+def apply_retention(keep_months, action=RETENTION_DETACH, compact=True,
+                    today=None):
+    """
+    Отсоединяет (detach) или удаляет (drop) секции старше keep_months
+    месяцев. С compact перед этим достраивает агрегаты истории, чтобы
+    графики по интервалам охватывали и удаленный период.
+    Возвращает имена обработанных секций
+    """
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        expired = expired_partitions(
+            list_partitions(cursor), keep_months, today or timezone.now())
+    if expired and compact:
+        for interval in RollupInterval:
+            build_rollups(interval.value)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name in expired:
+            cursor.execute(
+                f'ALTER TABLE {HISTORY_TABLE} DETACH PARTITION {name}')
+            if action == RETENTION_DROP:
+                cursor.execute(f'DROP TABLE {name}')
+            else:
+                _drop_foreign_keys(cursor, name)
+        if expired:
+            # История в каталоге в памяти перечитывается целиком
+            log_event(kind=CatalogEventKind.RESET)
+    return expired
+
+
+def _drop_foreign_keys(cursor, table):
+    """
+    Отсоединенная секция - архив, она не должна мешать удалять элементы
+    """
+    cursor.execute(
+        "SELECT conname FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+    for name, in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+
+
+def _table_definition(cursor, table):
+    """
+    Ограничения и индексы таблицы в виде, пригодном для пересоздания
+    """
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'c', 'f') "
+        "ORDER BY contype = 'f', conname", [table])
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+        "WHERE indrelid = %s::regclass AND indexrelid NOT IN ("
+        "SELECT conindid FROM pg_constraint WHERE conrelid = %s::regclass)",
+        [table, table])
+    indexes = [sql.replace(' ON ONLY ', ' ON ', 1)
+               for sql, in cursor.fetchall()]
+    return constraints, indexes
+
+
+def rebuild_history_table(cursor, partitioned):
+    """
+    Пересоздает таблицу истории секционированной по месяцам или обычной,
+    сохраняя данные, ограничения и индексы. Первичный ключ секционированной
+    таблицы должен включать date
+    """
+    constraints, indexes = _table_definition(cursor, HISTORY_TABLE)
+    old_table = f'{HISTORY_TABLE}_old'
+    cursor.execute(f'ALTER TABLE {HISTORY_TABLE} RENAME TO {old_table}')
+    cursor.execute(
+        f'CREATE TABLE {HISTORY_TABLE} '
+        f'(LIKE {old_table} INCLUDING DEFAULTS)'
+        + (' PARTITION BY RANGE (date)' if partitioned else ''))
+    cursor.execute(
+        f'ALTER SEQUENCE {HISTORY_TABLE}_id_seq OWNED BY {HISTORY_TABLE}.id')
+
+    if partitioned:
+        cursor.execute(
+            f'CREATE TABLE {DEFAULT_PARTITION} '
+            f'PARTITION OF {HISTORY_TABLE} DEFAULT')
+        cursor.execute(f'SELECT min(date) FROM {old_table}')
+        first, = cursor.fetchone()
+        month = month_start(first or timezone.now())
+        while month <= month_start(timezone.now()):
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+    cursor.execute(f'INSERT INTO {HISTORY_TABLE} SELECT * FROM {old_table}')
+    cursor.execute(f'DROP TABLE {old_table}')
+
+    for name, definition in constraints:
+        if definition.startswith('PRIMARY KEY'):
+            definition = ('PRIMARY KEY (id, date)' if partitioned
+                          else 'PRIMARY KEY (id)')
+        cursor.execute(
+            f'ALTER TABLE {HISTORY_TABLE} ADD CONSTRAINT {name} {definition}')
+    for sql in indexes:
+        cursor.execute(sql)
@@ -0,0 +1,156 @@
+"""
+Агрегаты истории цен по интервалам (час, день, неделя).
+Строятся инкрементально: каждая запись истории с id больше отметки
+RollupWatermark пересчитывает целиком интервалы, в которые она попала.
+id выдаются при вставке, а видны записи после фиксации транзакции,
+поэтому пропущенные id за последние LATE_ROWS_WINDOW id запоминаются
+и проверяются повторно
+"""
+import datetime
+import json
+
+from django.db import transaction
+
+from core.utils import chunked
+from .models import RollupInterval, RollupWatermark, \
+    ShopUnitStatisticRollup, ShopUnitStatisticUnit
+
+BATCH_SIZE = 10000
+SOURCES_CHUNK_SIZE = 500
+IDS_CHUNK_SIZE = 1000
+# Насколько далеко за отметкой может оказаться id записи, транзакция
+# которой зафиксировалась позже
+LATE_ROWS_WINDOW = 100000
+
+INTERVAL_LENGTH = {
+    RollupInterval.HOUR.value: datetime.timedelta(hours=1),
+    RollupInterval.DAY.value: datetime.timedelta(days=1),
+    RollupInterval.WEEK.value: datetime.timedelta(weeks=1),
+}
+
+
+def bucket_start(date, interval):
+    """
+    Начало интервала, в который попадает date. Недели начинаются
+    с понедельника
+    """
+    start = date.replace(minute=0, second=0, microsecond=0)
+    if interval == RollupInterval.HOUR.value:
+        return start
+    start = start.replace(hour=0)
+    if interval == RollupInterval.WEEK.value:
+        start -= datetime.timedelta(days=start.weekday())
+    return start
+
+
+def _aggregate(rows, interval):
+    """
+    Строит агрегаты из записей истории, упорядоченных по source, date
+    """
+    rollups = {}
+    for source_id, name, date, price, unit_type, parent_id in rows:
+        key = (source_id, bucket_start(date, interval))
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = ShopUnitStatisticRollup(
+                source_id=source_id, interval=interval, date=key[1])
+        rollup.name = name
+        rollup.type = unit_type
+        rollup.parent_id = parent_id
+        rollup.price = price
+        if price is not None:
+            if rollup.price_count == 0:
+                rollup.min_price = rollup.max_price = price
+            rollup.min_price = min(rollup.min_price, price)
+            rollup.max_price = max(rollup.max_price, price)
+            rollup.price_sum += price
+            rollup.price_count += 1
+    return rollups.values()
+
+
+def refresh_buckets(interval, source_ids, date_from, date_to):
+    """
+    Пересчитывает агрегаты элементов source_ids по интервалам
+    между началом интервала date_from и концом интервала date_to
+    """
+    date_from = bucket_start(date_from, interval)
+    date_to = bucket_start(date_to, interval) + INTERVAL_LENGTH[interval]
+    for chunk in chunked(source_ids, SOURCES_CHUNK_SIZE):
+        ShopUnitStatisticRollup.objects.filter(
+            interval=interval, source_id__in=chunk,
+            date__gte=date_from, date__lt=date_to
+        ).delete()
+        rows = ShopUnitStatisticUnit.objects.filter(
+            source_id__in=chunk, date__gte=date_from, date__lt=date_to
+        ).order_by('source_id', 'date').values_list(
+            'source_id', 'name', 'date', 'price', 'type', 'parent_id')
+        ShopUnitStatisticRollup.objects.bulk_create(
+            _aggregate(rows.iterator(), interval), batch_size=500)
+
+
+def _late_rows(pending):
+    """
+    Записи из пропусков, которые стали видны после переноса отметки
+    """
+    rows = []
+    for chunk in chunked(sorted(pending), IDS_CHUNK_SIZE):
+        rows.extend(ShopUnitStatisticUnit.objects.filter(
+            id__in=chunk).values_list('id', 'source_id', 'date'))
+    return rows
+
+
+def _refresh_rows(interval, rows):
+    """
+    Пересчитывает интервалы, в которые попали записи rows
+    """
+    dates = [date for _, _, date in rows]
+    refresh_buckets(interval, {source_id for _, source_id, _ in rows},
+                    min(dates), max(dates))
+
+
+def build_rollups(interval, batch_size=BATCH_SIZE):
+    """
+    Учитывает в агрегатах новые записи истории пачками по batch_size.
+    Возвращает количество учтенных записей
+    """
+    processed = 0
+    check_pending = True
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update() \
+                .get_or_create(interval=interval)
+            pending = set(json.loads(watermark.pending))
+            late = _late_rows(pending) if check_pending else []
+            check_pending = False
+            rows = list(ShopUnitStatisticUnit.objects.filter(
+                id__gt=watermark.history_id
+            ).order_by('id').values_list('id', 'source_id', 'date')[
+                :batch_size])
+            if not rows and not late:
+                return processed
+
+            if late:
+                _refresh_rows(interval, late)
+                pending.difference_update(row[0] for row in late)
+            if rows:
+                _refresh_rows(interval, rows)
+                last_id = rows[-1][0]
+                pending.update(range(
+                    max(watermark.history_id, last_id - LATE_ROWS_WINDOW) + 1,
+                    last_id + 1))
+                pending.difference_update(row[0] for row in rows)
+                watermark.history_id = last_id
+            watermark.pending = json.dumps(sorted(
+                row_id for row_id in pending
+                if row_id > watermark.history_id - LATE_ROWS_WINDOW))
+            watermark.save()
+        processed += len(rows) + len(late)
+
+
+def reset_rollups(interval):
+    """
+    Удаляет агрегаты интервала, следующий build_rollups построит их заново
+    """
+    with transaction.atomic():
+        ShopUnitStatisticRollup.objects.filter(interval=interval).delete()
+        RollupWatermark.objects.filter(interval=interval).delete()
@@ -0,0 +1,184 @@
+"""
+Первоначальная загрузка каталога. Элементы из NDJSON (как в import_feed,
+но в любом порядке) загружаются во временную таблицу: на PostgreSQL
+через COPY FROM STDIN, на остальных СУБД пакетными INSERT. Связи,
+типы родителей, пути и агрегаты категорий проверяются и считаются
+запросами SQL, после чего каталог и его история записываются
+в рабочие таблицы одной транзакцией
+"""
+import csv
+import io
+
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from core.utils import chunked
+from .cache import node_cache
+from .feed import parse_feed
+from .models import CatalogEventKind, RollupWatermark, ShopUnit, \
+    ShopUnitStatisticRollup, ShopUnitStatisticUnit, ShopUnitType, log_event
+from .serializers import ShopUnitImportSerializer
+
+SEED_CHUNK_SIZE = 10000
+
+UNITS = 'seed_units'
+PATHS = 'seed_paths'
+TOTALS = 'seed_totals'
+COLUMNS = ('id', 'name', 'type', 'parent_id', 'price')
+
+CATEGORY = ShopUnitType.CATEGORY.value
+OFFER = ShopUnitType.OFFER.value
+
+
+def _load_copy(cursor, rows):
+    buffer = io.StringIO()
+    # Непустые строки в кавычках, None без кавычек - это NULL для COPY
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {UNITS} ({", ".join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)',
+        buffer)
+
+
+def _load_batched(cursor, rows):
+    cursor.executemany(
+        f'INSERT INTO {UNITS} ({", ".join(COLUMNS)}) '
+        f'VALUES ({", ".join(["%s"] * len(COLUMNS))})', rows)
+
+
+def _load(cursor, lines, chunk_size):
+    """
+    Проверяет элементы сериализатором и загружает во временную таблицу.
+    Возвращает количество элементов
+    """
+    load = _load_copy if connection.vendor == 'postgresql' else _load_batched
+    total = 0
+    for chunk in chunked(parse_feed(lines), chunk_size):
+        serializer = ShopUnitImportSerializer(data=chunk, many=True)
+        if not serializer.is_valid():
+            raise ValidationError({'offset': total,
+                                   'items': serializer.errors})
+        load(cursor, [
+            (item['id'], item['name'], item['type'],
+             item.get('parentId'), item.get('price'))
+            for item in serializer.validated_data
+        ])
+        total += len(chunk)
+    cursor.execute(f'CREATE INDEX {UNITS}_id ON {UNITS} (id)')
+    cursor.execute(f'CREATE INDEX {UNITS}_parent ON {UNITS} (parent_id)')
+    return total
+
+
+def _check(cursor, sql, error):
+    cursor.execute(sql + ' LIMIT 1')
+    row = cursor.fetchone()
+    if row is not None:
+        raise ValidationError({'id': row[0], 'error': error})
+
+
+def _validate(cursor):
+    _check(cursor,
+           f'SELECT id FROM {UNITS} GROUP BY id HAVING count(*) > 1',
+           'Duplicate id')
+    _check(cursor,
+           f'SELECT s.id FROM {UNITS} s '
+           f'LEFT JOIN {UNITS} p ON p.id = s.parent_id '
+           f'WHERE s.parent_id IS NOT NULL AND p.id IS NULL',
+           'Parent not found')
+    _check(cursor,
+           f'SELECT s.id FROM {UNITS} s JOIN {UNITS} p ON p.id = s.parent_id '
+           f"WHERE p.type <> '{CATEGORY}'",
+           'Parent must be a category')
+
+
+def _compute(cursor):
+    """
+    Считает пути элементов и агрегаты категорий
+    """
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE {PATHS} AS '
+        f'WITH RECURSIVE tree (id, path) AS ('
+        f"SELECT id, id || '/' FROM {UNITS} WHERE parent_id IS NULL "
+        f'UNION ALL '
+        f"SELECT s.id, t.path || s.id || '/' FROM {UNITS} s "
+        f'JOIN tree t ON s.parent_id = t.id) '
+        f'SELECT id, path FROM tree')
+    cursor.execute(f'CREATE INDEX {PATHS}_id ON {PATHS} (id)')
+    # Элементы, не достижимые от корней, образуют цикл
+    _check(cursor,
+           f'SELECT s.id FROM {UNITS} s LEFT JOIN {PATHS} p ON p.id = s.id '
+           f'WHERE p.id IS NULL',
+           'Cycle in parents')
+
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE {TOTALS} AS '
+        f'WITH RECURSIVE ancestors (id, price) AS ('
+        f'SELECT parent_id, price FROM {UNITS} '
+        f"WHERE type = '{OFFER}' AND parent_id IS NOT NULL "
+        f'UNION ALL '
+        f'SELECT s.parent_id, a.price FROM ancestors a '
+        f'JOIN {UNITS} s ON s.id = a.id WHERE s.parent_id IS NOT NULL) '
+        f'SELECT id, sum(price) AS offer_sum, count(*) AS offer_count '
+        f'FROM ancestors GROUP BY id')
+    cursor.execute(f'CREATE INDEX {TOTALS}_id ON {TOTALS} (id)')
+
+
+def _clear_catalog(cursor):
+    tables = [model._meta.db_table for model in (
+        ShopUnitStatisticUnit, ShopUnitStatisticRollup, RollupWatermark,
+        ShopUnit)]
+    if connection.vendor == 'postgresql':
+        cursor.execute(f'TRUNCATE {", ".join(tables)}')
+    else:
+        for table in tables:
+            cursor.execute(f'DELETE FROM {table}')
+
+
+def _write(cursor, date):
+    units = ShopUnit._meta.db_table
+    history = ShopUnitStatisticUnit._meta.db_table
+    date = connection.ops.adapt_datetimefield_value(date)
+    cursor.execute(
+        f'INSERT INTO {units} (id, name, type, _price, date, parent_id, '
+        f'path, offer_sum, offer_count) '
+        f'SELECT s.id, s.name, s.type, s.price, %s, s.parent_id, p.path, '
+        f'COALESCE(t.offer_sum, 0), COALESCE(t.offer_count, 0) '
+        f'FROM {UNITS} s JOIN {PATHS} p ON p.id = s.id '
+        f'LEFT JOIN {TOTALS} t ON t.id = s.id', [date])
+    # Цена категории - целая часть среднего, как у ShopUnit.price
+    cursor.execute(
+        f'INSERT INTO {history} (name, date, type, price, source_id, '
+        f'parent_id) '
+        f'SELECT name, date, type, CASE '
+        f"WHEN type = '{OFFER}' THEN _price "
+        f'WHEN offer_count > 0 THEN offer_sum / offer_count END, '
+        f'id, parent_id FROM {units}')
+
+
+@transaction.atomic
+def seed_catalog(lines, date, replace=False, chunk_size=SEED_CHUNK_SIZE):
+    """
+    Загружает каталог из строк NDJSON с датой обновления date.
+    Каталог должен быть пуст, с replace он заменяется целиком.
+    Возвращает количество загруженных элементов
+    """
+    if not replace and ShopUnit.objects.exists():
+        raise ValidationError({'error': 'Catalog is not empty'})
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {UNITS} (id text, name text, '
+            f'type text, parent_id text, price integer)')
+        total = _load(cursor, lines, chunk_size)
+        _validate(cursor)
+        _compute(cursor)
+        if replace:
+            _clear_catalog(cursor)
+        _write(cursor, date)
+        # При ошибке временные таблицы удалит откат транзакции
+        for table in (TOTALS, PATHS, UNITS):
+            cursor.execute(f'DROP TABLE {table}')
+
+    node_cache.clear_on_commit()
+    log_event(kind=CatalogEventKind.RESET)
+    return total
@@ -1,7 +1,9 @@
 from dateutil.parser import isoparse
 from rest_framework import serializers
 
-from .models import ShopUnit, ShopUnitType, ShopUnitStatisticUnit
+from .jobs import queue_position
+from .models import ImportJob, ShopUnit, ShopUnitType, \
+    ShopUnitStatisticUnit
 
 
 class ISO8601DateField(serializers.Field):
@@ -15,19 +17,26 @@ class ISO8601DateField(serializers.Field):
     def to_internal_value(self, data):
         try:
             return isoparse(data)
-        except ValueError:
+        except (ValueError, TypeError):
             raise serializers.ValidationError(f'Incorrect date format')
 
 
+class UUIDStringField(serializers.UUIDField):
+    """
+    UUID в виде строки: '/' в id недопустим, он разделяет пути элементов
+    """
+
+    def to_internal_value(self, data):
+        return str(super().to_internal_value(data))
+
+
 class ShopUnitSerializer(serializers.ModelSerializer):
     parentId = serializers.PrimaryKeyRelatedField(
-        queryset=ShopUnit.objects,
         source='parent',
-        required=False,
-        allow_null=True
+        read_only=True
     )
 
-    price = serializers.IntegerField(required=False, allow_null=True)
+    price = serializers.IntegerField(read_only=True)
 
     date = ISO8601DateField()
 
@@ -36,31 +45,21 @@ class ShopUnitSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'name', 'type', 'parentId', 'date', 'price')
 
-    def get_children(self, obj):
-        if obj.type == ShopUnitType.CATEGORY.value:
-            return ShopUnitSerializer(
-                obj.children, many=True, read_only=True).data
-        else:
-            return None
 
-    def validate_price(self, value):
-        if self.initial_data['type'] == ShopUnitType.OFFER.value:
-            if value is None or value < 0:
-                raise serializers.ValidationError('Price must be positive')
-        if (self.initial_data['type'] == ShopUnitType.CATEGORY.value
-                and value is not None):
-            raise serializers.ValidationError('Price must be null')
-        return value
+class ShopUnitTreeSerializer(ShopUnitSerializer):
+    """
+    Элемент вместе с дочерними элементами, загруженными get_subtree
+    """
+    children = serializers.SerializerMethodField()
 
-    def validate_parentId(self, value):
-        if value:
-            if value.type != ShopUnitType.CATEGORY.value:
-                raise serializers.ValidationError(
-                    'Parent must be existing category')
-            if value.id == self.initial_data['id']:
-                raise serializers.ValidationError(
-                    'Parent must be different from current')
-        return value
+    class Meta(ShopUnitSerializer.Meta):
+        fields = ShopUnitSerializer.Meta.fields + ('children',)
+
+    def get_children(self, obj):
+        if obj.loaded_children is None:
+            return None
+        return ShopUnitTreeSerializer(
+            obj.loaded_children, many=True, read_only=True).data
 
 
 class ShopUnitStatisticUnitSerializer(serializers.ModelSerializer):
@@ -72,3 +71,52 @@ class ShopUnitStatisticUnitSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShopUnitStatisticUnit
         fields = ['id', 'name', 'date', 'price', 'type', 'parentId']
+
+
+class ShopUnitImportSerializer(serializers.Serializer):
+    """
+    Элемент запроса на импорт. Проверяет только сам элемент,
+    связи между элементами проверяются при импорте пачки
+    """
+    id = UUIDStringField()
+    name = serializers.CharField()
+    type = serializers.ChoiceField(choices=ShopUnitType.choices())
+    parentId = UUIDStringField(required=False, allow_null=True)
+    price = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        price = attrs.get('price')
+        if attrs['type'] == ShopUnitType.OFFER.value:
+            if price is None or price < 0:
+                raise serializers.ValidationError('Price must be positive')
+        elif price is not None:
+            raise serializers.ValidationError('Price must be null')
+        if attrs.get('parentId') == attrs['id']:
+            raise serializers.ValidationError(
+                'Parent must be different from current')
+        return attrs
+
+
+class ShopUnitImportRequestSerializer(serializers.Serializer):
+    items = ShopUnitImportSerializer(many=True)
+    updateDate = ISO8601DateField()
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Состояние задачи импорта. position - количество задач в очереди
+    перед этой
+    """
+    updateDate = ISO8601DateField(source='update_date')
+    position = serializers.SerializerMethodField()
+    created = ISO8601DateField()
+    started = ISO8601DateField()
+    finished = ISO8601DateField()
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'status', 'updateDate', 'total', 'position',
+                  'error', 'created', 'started', 'finished')
+
+    def get_position(self, obj):
+        return queue_position(obj)
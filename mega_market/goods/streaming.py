@@ -0,0 +1,44 @@
+from django.http import StreamingHttpResponse
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+from core.utils import chunked
+
+CHUNK_SIZE = 1000
+
+# Кодировщик с теми же настройками, что у JSONRenderer
+_encoder = JSONRenderer.encoder_class(
+    ensure_ascii=JSONRenderer.ensure_ascii,
+    allow_nan=not JSONRenderer.strict,
+    separators=SHORT_SEPARATORS if JSONRenderer.compact else LONG_SEPARATORS
+)
+
+
+def encode_json(data):
+    """
+    Кодирует данные в JSON байт в байт как JSONRenderer
+    """
+    return _encoder.encode(data).replace(
+        '\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def stream_items(queryset, to_representation):
+    """
+    Отдает {"items": [...]} по частям. Строки читаются серверным
+    курсором пачками по CHUNK_SIZE, каждая строка сразу кодируется
+    в JSON, поэтому память не зависит от размера выборки.
+    Вместо queryset можно передать итератор строк
+    """
+
+    def generate():
+        yield b'{"items":['
+        separator = b''
+        rows = (queryset.iterator(chunk_size=CHUNK_SIZE)
+                if hasattr(queryset, 'iterator') else queryset)
+        for chunk in chunked(rows, CHUNK_SIZE):
+            yield separator + b','.join(
+                encode_json(to_representation(row)) for row in chunk)
+            separator = b','
+        yield b']}'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
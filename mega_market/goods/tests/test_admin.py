@@ -0,0 +1,96 @@
+import datetime
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..admin import ShopUnitAdmin
+from ..models import ShopUnit, ShopUnitStatisticUnit
+
+
+class TestShopUnitAdmin(TestCase):
+    def setUp(self):
+        date = timezone.make_aware(datetime.datetime(2022, 5, 28))
+        self.model_admin = ShopUnitAdmin(ShopUnit, admin.site)
+        parent = None
+        for unit_id, unit_type, price in (
+                ('root', 'CATEGORY', None), ('category', 'CATEGORY', None),
+                ('offer', 'OFFER', 100)):
+            parent = ShopUnit(id=unit_id, name=unit_id, type=unit_type,
+                              date=date, parent=parent, price=price)
+            parent.save()
+        ShopUnit(id='other', name='other', type='OFFER', date=date,
+                 parent_id='root', price=300).save()
+
+    def root_totals(self):
+        root = ShopUnit.objects.get(id='root')
+        return root.offer_sum, root.offer_count
+
+    def test_delete_model(self):
+        self.assertEqual(self.root_totals(), (400, 2))
+        self.model_admin.delete_model(
+            None, ShopUnit.objects.get(id='category'))
+        self.assertEqual(self.root_totals(), (300, 1))
+        self.assertFalse(ShopUnitStatisticUnit.objects.filter(
+            source_id='offer').exists())
+
+    def test_delete_queryset_with_descendants(self):
+        self.model_admin.delete_queryset(
+            None, ShopUnit.objects.filter(id__in=['category', 'offer']))
+        self.assertEqual(self.root_totals(), (300, 1))
+        self.assertEqual(set(ShopUnit.objects.values_list('id', flat=True)),
+                         {'root', 'other'})
+
+
+class TestChangelistHistory(TestCase):
+    """
+    Редактирование нескольких элементов в списке админки
+    """
+
+    def setUp(self):
+        self.dates = [timezone.make_aware(datetime.datetime(2022, 5, day))
+                      for day in (27, 28)]
+        self.ids = [f'offer-{index}' for index in range(4)]
+        for index, unit_id in enumerate(self.ids):
+            ShopUnit(id=unit_id, name=unit_id, type='OFFER', price=index,
+                     date=self.dates[index % 2]).save()
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+
+    def post_changelist(self, price):
+        data = {'form-TOTAL_FORMS': len(self.ids),
+                'form-INITIAL_FORMS': len(self.ids),
+                '_save': 'Save'}
+        for index, unit_id in enumerate(sorted(self.ids)):
+            data.update({f'form-{index}-id': unit_id,
+                         f'form-{index}-name': f'{unit_id} {price}',
+                         f'form-{index}-_price': price})
+        table = ShopUnitStatisticUnit._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('admin:goods_shopunit_changelist'), data)
+        self.assertEqual(response.status_code, 302)
+        return [query['sql'].split(' ')[0]
+                for query in queries.captured_queries
+                if f'"{table}"' in query['sql'].split(' WHERE ')[0]]
+
+    def history(self):
+        return sorted(ShopUnitStatisticUnit.objects.values_list(
+            'source_id', 'date', 'name', 'price'))
+
+    def test_one_write_per_request(self):
+        self.assertEqual(self.post_changelist(10), ['DELETE', 'INSERT'])
+        self.assertEqual(len(self.history()), len(self.ids))
+        batched = self.history()
+
+        with override_settings(HISTORY_RECORDER='signal'):
+            self.post_changelist(20)
+            ShopUnitStatisticUnit.objects.all().delete()
+            queries = self.post_changelist(10)
+        # SELECT и INSERT или UPDATE на каждый элемент
+        self.assertEqual(len(queries), 2 * len(self.ids))
+        self.assertEqual(self.history(), batched)
@@ -0,0 +1,49 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from mega_market import settings_api
+
+from ..throttle import _stores
+
+
+@override_settings(
+    MIDDLEWARE=settings_api.MIDDLEWARE,
+    ROOT_URLCONF=settings_api.ROOT_URLCONF,
+    TEMPLATES=settings_api.TEMPLATES,
+    REST_FRAMEWORK=settings_api.REST_FRAMEWORK,
+    THROTTLE_STORE='memory',
+)
+class TestApiMode(TestCase):
+    """
+    Запросы с настройками mega_market.settings_api. INSTALLED_APPS
+    не подменяется: приложения auth и admin нужны другим тестам
+    """
+
+    def setUp(self):
+        _stores.clear()
+        self.addCleanup(_stores.clear)
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+
+    def test_import_and_read(self):
+        response = self.client.post(reverse('imports'), data={
+            "items": [{"type": "OFFER", "name": "Оффер",
+                       "id": self.offer_uuid, "price": 100}],
+            "updateDate": "2022-05-28T21:12:01.000Z",
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('nodes', args=[self.offer_uuid]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['price'], 100)
+
+    def test_errors(self):
+        response = self.client.get(reverse('nodes', args=[self.offer_uuid]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(),
+                         {'code': 404, 'message': 'Item not found'})
+        response = self.client.post(reverse('imports'), data={},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_no_admin(self):
+        self.assertEqual(self.client.get('/admin/').status_code, 404)
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from django.test import TransactionTestCase
+
+from mega_market.asgi import application
+
+DATE = "2022-05-28T21:12:01.000Z"
+
+
+def asgi_request(method, path, query_string=b'', body=b''):
+    """
+    Выполняет запрос к ASGI-приложению, возвращает статус,
+    заголовки и части тела ответа
+    """
+    messages = []
+    requests = [{'type': 'http.request', 'body': body[:10],
+                 'more_body': True},
+                {'type': 'http.request', 'body': body[10:]}]
+
+    async def receive():
+        return requests.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': method,
+        'path': path, 'query_string': query_string, 'root_path': '',
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+    }
+    asyncio.run(application(scope, receive, send))
+    start, *chunks = messages
+    return start['status'], dict(start['headers']), chunks
+
+
+class TestASGI(TransactionTestCase):
+    def setUp(self):
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        body = json.dumps({"items": [
+            {"type": "OFFER", "name": "Оффер", "id": self.offer_uuid,
+             "price": 100},
+        ], "updateDate": DATE}).encode()
+        status, _, _ = asgi_request('POST', '/imports', body=body)
+        self.assertEqual(status, 200)
+
+    def test_nodes(self):
+        status, headers, chunks = asgi_request(
+            'GET', f'/nodes/{self.offer_uuid}')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'application/json')
+        self.assertEqual(json.loads(chunks[0]['body'])['price'], 100)
+        self.assertFalse(chunks[-1].get('more_body'))
+
+    def test_not_found(self):
+        status, _, _ = asgi_request(
+            'GET', '/nodes/3fa85f64-5717-4562-b3fc-2c963f66a440')
+        self.assertEqual(status, 404)
+
+    def test_streaming(self):
+        status, _, chunks = asgi_request(
+            'GET', '/sales', query_string=f'date={DATE}'.encode())
+        self.assertEqual(status, 200)
+        self.assertGreater(len(chunks), 2)
+        data = json.loads(b''.join(chunk['body'] for chunk in chunks))
+        self.assertEqual([item['id'] for item in data['items']],
+                         [self.offer_uuid])
+
+    def test_concurrent_requests(self):
+        async def run_all():
+            loop = asyncio.get_running_loop()
+            return await asyncio.gather(*(
+                loop.run_in_executor(None, asgi_request, 'GET',
+                                     f'/nodes/{self.offer_uuid}')
+                for _ in range(8)))
+
+        results = asyncio.run(run_all())
+        self.assertEqual([status for status, _, _ in results], [200] * 8)
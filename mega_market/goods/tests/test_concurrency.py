@@ -0,0 +1,109 @@
+import datetime
+import threading
+import time
+import unittest
+from unittest import mock
+
+from django.db import connection, connections
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from .. import importer
+from ..importer import import_units
+from ..models import ShopUnit, delete_unit
+
+DATE = timezone.make_aware(datetime.datetime(2022, 5, 28))
+ROOT = '3fa85f64-5717-4562-b3fc-2c963f66a440'
+CATEGORIES = ['3fa85f64-5717-4562-b3fc-2c963f66a441',
+              '3fa85f64-5717-4562-b3fc-2c963f66a442']
+
+
+def category(unit_id, parent_id=None):
+    return {'id': unit_id, 'name': 'Категория', 'type': 'CATEGORY',
+            'parentId': parent_id, 'price': None}
+
+
+def offer(unit_id, parent_id, price):
+    return {'id': unit_id, 'name': 'Оффер', 'type': 'OFFER',
+            'parentId': parent_id, 'price': price}
+
+
+@unittest.skipIf(connection.vendor != 'postgresql', 'PostgreSQL only')
+class TestConcurrentImports(TransactionTestCase):
+    """
+    Изменения в разных потоках (как в разных воркерах) с общими
+    родителями. Задержка после чтения элементов дает другому потоку
+    прочитать те же родительские категории до записи
+    """
+
+    def setUp(self):
+        import_units([category(ROOT)] + [
+            category(category_id, ROOT) for category_id in CATEGORIES
+        ], DATE)
+        validate = importer._validate
+
+        def slow_validate(items, units):
+            validate(items, units)
+            time.sleep(0.2)
+
+        patcher = mock.patch('goods.importer._validate', slow_validate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_concurrently(self, *functions):
+        errors = []
+        barrier = threading.Barrier(len(functions))
+
+        def run(function):
+            try:
+                barrier.wait()
+                function()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(function,))
+                   for function in functions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def totals(self, unit_id):
+        unit = ShopUnit.objects.get(id=unit_id)
+        return unit.offer_sum, unit.offer_count
+
+    def test_imports_share_root(self):
+        errors = self.run_concurrently(*[
+            lambda index=index: import_units([offer(
+                f'3fa85f64-5717-4562-b3fc-2c963f66a45{index}',
+                CATEGORIES[index % 2], 100 * (index + 1))], DATE)
+            for index in range(4)
+        ])
+        self.assertEqual(errors, [])
+        self.assertEqual(self.totals(ROOT), (1000, 4))
+        self.assertEqual(self.totals(CATEGORIES[0]), (400, 2))
+        self.assertEqual(self.totals(CATEGORIES[1]), (600, 2))
+
+    def test_delete_during_import_into_subtree(self):
+        import_units([
+            offer('3fa85f64-5717-4562-b3fc-2c963f66a450', CATEGORIES[0], 100),
+            offer('3fa85f64-5717-4562-b3fc-2c963f66a451', CATEGORIES[1], 200),
+        ], DATE)
+        unit = ShopUnit.objects.get(id=CATEGORIES[0])
+
+        def delete():
+            # Импорт успевает прочитать категорию первым
+            time.sleep(0.05)
+            delete_unit(unit)
+
+        errors = self.run_concurrently(
+            lambda: import_units([offer(
+                '3fa85f64-5717-4562-b3fc-2c963f66a452',
+                CATEGORIES[0], 300)], DATE),
+            delete)
+        self.assertEqual(errors, [])
+        self.assertFalse(ShopUnit.objects.filter(id=CATEGORIES[0]).exists())
+        self.assertEqual(self.totals(ROOT), (200, 1))
@@ -0,0 +1,83 @@
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from ..encoders import STATISTIC_FIELDS, statistic_item, unit_item
+from ..models import ShopUnit, ShopUnitStatisticUnit, get_subtree
+from ..serializers import ShopUnitStatisticUnitSerializer, \
+    ShopUnitTreeSerializer
+from ..streaming import encode_json
+
+
+class TestGoldenOutput(TestCase):
+    """
+    Быстрые кодировщики должны выдавать те же байты, что и сериализаторы
+    """
+
+    def setUp(self):
+        self.dates = [
+            timezone.make_aware(datetime.datetime(2022, 2, 1, 12)),
+            timezone.make_aware(
+                datetime.datetime(2022, 12, 31, 23, 59, 59, 999999)),
+            timezone.make_aware(datetime.datetime(2022, 5, 28, 0, 0, 1, 1000)),
+        ]
+        self.names = ['Товары', 'jPhone "13"', 'line\u2028break\u2029',
+                      'tab\tslash\\', '😀 emoji']
+        self.units = []
+        self.root = self.create('CATEGORY', None, 0)
+        self.empty = self.create('CATEGORY', self.root, 1)
+        self.category = self.create('CATEGORY', self.root, 2)
+        # Средняя цена категорий дробная и должна отбрасывать дробную
+        # часть. Агрегаты категорий пересчитывает сохранение товаров
+        self.offers = [
+            self.create('OFFER', parent, i, price=price)
+            for i, (parent, price) in enumerate([
+                (self.category, 79999), (self.category, 0),
+                (self.root, 2 ** 31 - 1), (None, 3)])
+        ]
+
+    def create(self, unit_type, parent, i, price=None):
+        unit = ShopUnit.objects.create(
+            id=f'3fa85f64-5717-4562-b3fc-2c963f66a{len(self.units):03}',
+            name=self.names[i % len(self.names)],
+            type=unit_type,
+            price=price,
+            date=self.dates[i % len(self.dates)],
+            parent=parent
+        )
+        self.units.append(unit)
+        return unit
+
+    def test_tree(self):
+        root = ShopUnit.objects.get(id=self.root.id)
+        self.assertEqual((root.offer_sum, root.offer_count),
+                         (79999 + 2 ** 31 - 1, 3))
+        for unit in self.units:
+            node = get_subtree(unit.id)
+            self.assertEqual(
+                encode_json(unit_item(node)),
+                JSONRenderer().render(ShopUnitTreeSerializer(node).data)
+            )
+
+    def test_statistic(self):
+        queryset = ShopUnitStatisticUnit.objects.order_by('id')
+        self.assertTrue(queryset.exists())
+        rows = queryset.values_list(*STATISTIC_FIELDS)
+        self.assertEqual(
+            encode_json([statistic_item(row) for row in rows]),
+            JSONRenderer().render(
+                ShopUnitStatisticUnitSerializer(queryset, many=True).data)
+        )
+
+    def test_statistic_response(self):
+        response = self.client.get(
+            f'/node/{self.offers[0].id}/statistic')
+        queryset = ShopUnitStatisticUnit.objects.filter(
+            source=self.offers[0])
+        self.assertEqual(
+            b''.join(response.streaming_content),
+            JSONRenderer().render({'items': ShopUnitStatisticUnitSerializer(
+                queryset, many=True).data})
+        )
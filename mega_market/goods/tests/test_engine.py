@@ -0,0 +1,191 @@
+import json
+import threading
+from unittest import mock
+
+from dateutil.parser import isoparse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ..engine import ReadWriteLock, catalog_engine
+from ..models import CatalogEvent, CatalogEventKind, log_event
+
+DATE_1 = "2022-05-28T21:12:01.000Z"
+DATE_2 = "2022-05-29T10:00:00.000Z"
+DATE_3 = "2022-06-05T10:00:00.000Z"
+
+
+@override_settings(CATALOG_ENGINE=True)
+class TestCatalogEngine(TestCase):
+    def setUp(self):
+        self.root_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a440"
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        self.other_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a446"
+        catalog_engine.load()
+        self.post_items(DATE_1, [
+            {"type": "CATEGORY", "name": "Корень", "id": self.root_uuid},
+            {"type": "CATEGORY", "name": "Категория",
+             "id": self.category_uuid, "parentId": self.root_uuid},
+            {"type": "OFFER", "name": "Оффер", "id": self.offer_uuid,
+             "parentId": self.category_uuid, "price": 100},
+            {"type": "OFFER", "name": "Другой", "id": self.other_uuid,
+             "parentId": self.root_uuid, "price": 51},
+        ])
+
+    def post_items(self, date, items):
+        response = self.client.post(
+            reverse('imports'), data={"items": items, "updateDate": date},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def get_node(self, unit_id):
+        response = self.client.get(reverse('nodes', args=[unit_id]))
+        return response.status_code, response.json()
+
+    def get_sales(self, date, **params):
+        response = self.client.get(
+            reverse('sales'), data={'date': date, **params})
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return response.json()
+
+    def assertSameAsDatabase(self):
+        """
+        Ответы каталога в памяти совпадают с ответами по БД
+        """
+        for unit_id in (self.root_uuid, self.category_uuid,
+                        self.offer_uuid, self.other_uuid):
+            with self.settings(CATALOG_ENGINE=False):
+                expected = self.get_node(unit_id)
+            self.assertEqual(self.get_node(unit_id), expected)
+        for params in ({}, {'limit': 1}):
+            with self.settings(CATALOG_ENGINE=False):
+                expected = self.get_sales(DATE_2, **params)
+            self.assertEqual(self.get_sales(DATE_2, **params), expected)
+
+    def test_import(self):
+        status, data = self.get_node(self.root_uuid)
+        self.assertEqual(status, 200)
+        self.assertEqual(data['price'], 75)
+        self.assertSameAsDatabase()
+
+    def test_update_and_move(self):
+        self.post_items(DATE_2, [
+            {"type": "OFFER", "name": "Оффер", "id": self.offer_uuid,
+             "parentId": self.root_uuid, "price": 300},
+        ])
+        status, data = self.get_node(self.category_uuid)
+        self.assertIsNone(data['price'])
+        self.assertEqual(data['children'], [])
+        self.assertSameAsDatabase()
+
+    def test_delete(self):
+        response = self.client.delete(
+            reverse('delete', args=[self.category_uuid]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_node(self.offer_uuid)[0], 404)
+        self.assertSameAsDatabase()
+        self.assertEqual(len(self.get_sales(DATE_2)['items']), 1)
+
+    def test_delete_former_parent(self):
+        self.post_items(DATE_2, [
+            {"type": "OFFER", "name": "Оффер", "id": self.offer_uuid,
+             "parentId": self.root_uuid, "price": 300},
+        ])
+        self.assertEqual(len(self.get_sales(DATE_2)['items']), 3)
+        # История товара с родителем category_uuid удаляется вместе
+        # с категорией, хотя сам товар уже в другой категории
+        response = self.client.delete(
+            reverse('delete', args=[self.category_uuid]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_node(self.offer_uuid)[0], 200)
+        self.assertSameAsDatabase()
+        self.assertEqual(len(self.get_sales(DATE_2)['items']), 2)
+
+    def test_delete_rebuilds_sales_index(self):
+        with mock.patch('goods.engine.REBUILD_LIMIT', 0):
+            self.test_delete()
+
+    def test_sales_cursor(self):
+        first = self.get_sales(DATE_2, limit=1)
+        rest = self.get_sales(DATE_2, limit=10, cursor=first['nextCursor'])
+        self.assertEqual(
+            [item['id'] for item in first['items'] + rest['items']],
+            [item['id'] for item in self.get_sales(DATE_2)['items']])
+        self.assertIsNone(rest['nextCursor'])
+
+    def test_version_follows_log(self):
+        self.get_node(self.root_uuid)
+        version = catalog_engine.version
+        self.assertEqual(version, CatalogEvent.objects.latest('id').id)
+        self.post_items(DATE_2, [
+            {"type": "OFFER", "name": "Новое", "id": self.other_uuid,
+             "parentId": self.root_uuid, "price": 51},
+        ])
+        self.get_node(self.root_uuid)
+        self.assertGreater(catalog_engine.version, version)
+
+    def test_reset_reloads(self):
+        self.get_node(self.root_uuid)
+        # Изменение мимо журнала видно только после полной перезагрузки
+        with self.settings(CATALOG_ENGINE=False):
+            self.client.delete(reverse('delete', args=[self.root_uuid]))
+        self.assertEqual(self.get_node(self.root_uuid)[0], 200)
+        log_event(kind=CatalogEventKind.RESET)
+        self.assertEqual(self.get_node(self.root_uuid)[0], 404)
+
+    def test_sales_streamed_in_chunks(self):
+        with mock.patch('goods.streaming.CHUNK_SIZE', 1):
+            self.assertSameAsDatabase()
+
+    @override_settings(CATALOG_ENGINE_SALES_DAYS=2)
+    def test_sales_window(self):
+        catalog_engine.load()
+        self.post_items(DATE_3, [
+            {"type": "OFFER", "name": "Оффер", "id": self.offer_uuid,
+             "parentId": self.category_uuid, "price": 300},
+        ])
+        self.get_node(self.root_uuid)
+        # Обновления DATE_1 вышли из окна
+        self.assertEqual(len(catalog_engine._sales_keys), 1)
+        self.assertIsNone(catalog_engine.sales(isoparse(DATE_2)))
+        self.assertEqual(
+            len(list(catalog_engine.sales(isoparse(DATE_3)))), 1)
+        for date in (DATE_2, DATE_3):
+            with self.settings(CATALOG_ENGINE=False):
+                expected = self.get_sales(date)
+            self.assertEqual(self.get_sales(date), expected)
+
+
+class TestReadWriteLock(SimpleTestCase):
+    def run_thread(self, target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread
+
+    def test_readers_share(self):
+        lock = ReadWriteLock()
+        entered = threading.Event()
+
+        def read():
+            with lock.read():
+                entered.set()
+
+        with lock.read():
+            self.run_thread(read)
+            self.assertTrue(entered.wait(1))
+
+    def test_writer_excludes_readers(self):
+        lock = ReadWriteLock()
+        written = threading.Event()
+
+        def write():
+            with lock.write():
+                written.set()
+
+        with lock.read():
+            self.run_thread(write)
+            self.assertFalse(written.wait(0.1))
+        self.assertTrue(written.wait(1))
@@ -0,0 +1,180 @@
+import datetime
+import unittest
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ..models import ShopUnit, ShopUnitStatisticUnit, get_sales, \
+    get_statistic, history_recorder
+from ..partitions import add_months, ensure_partitions, \
+    expired_partitions, is_partitioned, month_start, partition_name
+
+
+class TestQueryPlans(TestCase):
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # На маленькой таблице PostgreSQL предпочтет полное сканирование
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_sales_uses_type_date_index(self):
+        date = timezone.make_aware(datetime.datetime(2022, 2, 4))
+        self.assertUsesIndex(get_sales(date), 'statistic_type_date_idx')
+
+    def test_statistic_uses_source_date_index(self):
+        date = timezone.make_aware(datetime.datetime(2022, 2, 4))
+        queryset = get_statistic(
+            '3fa85f64-5717-4562-b3fc-2c963f66a333',
+            date - datetime.timedelta(days=365), date)
+        self.assertUsesIndex(queryset, 'statistic_source_date_idx')
+
+
+class TestPartitions(TestCase):
+    def month(self, year, month):
+        return datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc)
+
+    def test_add_months(self):
+        self.assertEqual(add_months(self.month(2022, 11), 3),
+                         self.month(2023, 2))
+        self.assertEqual(add_months(self.month(2022, 1), -1),
+                         self.month(2021, 12))
+
+    def test_expired_partitions(self):
+        names = [partition_name(self.month(2022, month))
+                 for month in range(1, 7)]
+        today = timezone.make_aware(datetime.datetime(2022, 6, 15))
+        self.assertEqual(
+            expired_partitions(names + ['other_table'], 3, today),
+            names[:2])
+        self.assertEqual(expired_partitions(names, 12, today), [])
+
+    @unittest.skipIf(connection.vendor != 'postgresql', 'PostgreSQL only')
+    def test_ensure_partitions(self):
+        self.assertTrue(is_partitioned())
+        today = timezone.now()
+        ensure_partitions(2, today)
+        self.assertEqual(ensure_partitions(2, today), [])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT to_regclass(%s)',
+                [partition_name(add_months(month_start(today), 2))])
+            self.assertIsNotNone(cursor.fetchone()[0])
+
+    def test_not_partitioned_elsewhere(self):
+        if connection.vendor != 'postgresql':
+            self.assertFalse(is_partitioned())
+            self.assertEqual(ensure_partitions(3), [])
+
+
+class TestHistoryRecorder(TestCase):
+    def setUp(self):
+        self.dates = [
+            timezone.make_aware(datetime.datetime(2022, 5, 28, hour))
+            for hour in range(3)]
+        self.category_uuid = '3fa85f64-5717-4562-b3fc-2c963f66a441'
+        self.offer_uuid = '3fa85f64-5717-4562-b3fc-2c963f66a445'
+
+    def save_units(self):
+        category = ShopUnit(id=self.category_uuid, name='Категория',
+                            type='CATEGORY', date=self.dates[0])
+        category.save()
+        offer = ShopUnit(id=self.offer_uuid, name='Оффер', type='OFFER',
+                         price=10, date=self.dates[0], parent=category)
+        offer.save()
+        offer.price = 20
+        offer.save()
+        offer.date = self.dates[1]
+        offer.save()
+        offer.parent = None
+        offer.date = self.dates[2]
+        offer.save()
+
+    def history(self):
+        return sorted(ShopUnitStatisticUnit.objects.values_list(
+            'source_id', 'date', 'name', 'type', 'parent_id', 'price'))
+
+    def test_same_history_as_signal(self):
+        with override_settings(HISTORY_RECORDER='signal'):
+            self.save_units()
+        expected = self.history()
+        ShopUnit.objects.all().delete()
+
+        self.save_units()
+        self.assertEqual(self.history(), expected)
+        ShopUnit.objects.all().delete()
+
+        with history_recorder.batch():
+            self.save_units()
+        self.assertEqual(self.history(), expected)
+
+    def test_batch_writes_on_exit(self):
+        table = ShopUnitStatisticUnit._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            with history_recorder.batch():
+                self.save_units()
+                self.assertFalse(ShopUnitStatisticUnit.objects.exists())
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith(f'INSERT INTO "{table}"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ShopUnitStatisticUnit.objects.count(), 4)
+
+    def test_batch_discarded_on_error(self):
+        with self.assertRaises(ValueError):
+            with history_recorder.batch():
+                self.save_units()
+                raise ValueError
+        self.assertFalse(ShopUnitStatisticUnit.objects.exists())
+        with history_recorder.batch():
+            pass
+        self.assertFalse(ShopUnitStatisticUnit.objects.exists())
+
+
+class TestSaveTotals(TestCase):
+    def setUp(self):
+        self.date = timezone.make_aware(datetime.datetime(2022, 5, 28))
+        self.root = self.create('root', 'CATEGORY')
+        self.first = self.create('first', 'CATEGORY', self.root)
+        self.second = self.create('second', 'CATEGORY', self.root)
+        self.offer = self.create('offer', 'OFFER', self.first, 100)
+
+    def create(self, unit_id, unit_type, parent=None, price=None):
+        unit = ShopUnit(id=unit_id, name=unit_id, type=unit_type,
+                        date=self.date, parent=parent, price=price)
+        unit.save()
+        return unit
+
+    def totals(self, unit_id):
+        unit = ShopUnit.objects.get(id=unit_id)
+        return unit.offer_sum, unit.offer_count
+
+    def test_create(self):
+        self.assertEqual(self.totals('root'), (100, 1))
+        self.assertEqual(self.totals('first'), (100, 1))
+        self.assertEqual(self.totals('second'), (0, 0))
+
+    def test_price_change(self):
+        self.offer.price = 300
+        self.offer.save()
+        self.assertEqual(self.totals('root'), (300, 1))
+        self.assertEqual(self.totals('first'), (300, 1))
+
+    def test_reparent(self):
+        self.offer.parent = self.second
+        self.offer.save()
+        self.assertEqual(self.totals('root'), (100, 1))
+        self.assertEqual(self.totals('first'), (0, 0))
+        self.assertEqual(self.totals('second'), (100, 1))
+
+    def test_move_category(self):
+        self.first.parent = None
+        # Значения из устаревшего объекта не записываются
+        self.first.offer_sum = self.first.offer_count = 0
+        self.first.save()
+        self.assertEqual(self.totals('root'), (0, 0))
+        self.assertEqual(self.totals('first'), (100, 1))
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from core.metrics import render
+from core.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(SimpleTestCase):
+    def make_pool(self, size=2, **kwargs):
+        return ConnectionPool(FakeConnection, size, **kwargs)
+
+    def test_reuse(self):
+        pool = self.make_pool()
+        connection = pool.get()
+        pool.put(connection)
+        self.assertIs(pool.get(), connection)
+        metrics = pool.metrics()
+        self.assertEqual(metrics['connects'], 1)
+        self.assertEqual(metrics['checkouts'], 2)
+        self.assertEqual(metrics['in_use'], 1)
+
+    def test_timeout(self):
+        pool = self.make_pool(size=1, timeout=0.05)
+        pool.get()
+        with self.assertRaises(PoolTimeout):
+            pool.get()
+        self.assertEqual(pool.metrics()['timeouts'], 1)
+
+    def test_wait_for_release(self):
+        pool = self.make_pool(size=1, timeout=5)
+        connection = pool.get()
+        timer = threading.Timer(0.05, pool.put, [connection])
+        timer.start()
+        self.assertIs(pool.get(), connection)
+        timer.join()
+        self.assertGreater(pool.metrics()['max_wait_seconds'], 0)
+
+    def test_failed_check_replaces_connection(self):
+        pool = self.make_pool(check_interval=0,
+                              check=lambda connection: False)
+        connection = pool.get()
+        pool.put(connection)
+        time.sleep(0.001)
+        replacement = pool.get()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        metrics = pool.metrics()
+        self.assertEqual(metrics['failed_checks'], 1)
+        self.assertEqual(metrics['opened'], 1)
+
+    def test_check_skipped_for_recent_connections(self):
+        pool = self.make_pool(check_interval=60,
+                              check=lambda connection: False)
+        connection = pool.get()
+        pool.put(connection)
+        self.assertIs(pool.get(), connection)
+        self.assertEqual(pool.metrics()['checks'], 0)
+
+    def test_failed_reset_closes_connection(self):
+        pool = self.make_pool(reset=lambda connection: False)
+        connection = pool.get()
+        pool.put(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.metrics()['opened'], 0)
+
+    def test_failed_connect_releases_slot(self):
+        def connect():
+            raise OSError
+
+        pool = ConnectionPool(connect, 1, timeout=0.05)
+        with self.assertRaises(OSError):
+            pool.get()
+        self.assertEqual(pool.metrics()['opened'], 0)
+
+
+class TestMetrics(TestCase):
+    def test_render(self):
+        self.assertEqual(
+            render([('db_pool_in_use', 'gauge', {'alias': 'default'}, 2),
+                    ('db_pool_in_use', 'gauge', {'alias': 'replica'}, 0),
+                    ('hits_total', 'counter', {}, 5)]),
+            '# TYPE db_pool_in_use gauge\n'
+            'db_pool_in_use{alias="default"} 2\n'
+            'db_pool_in_use{alias="replica"} 0\n'
+            '# TYPE hits_total counter\n'
+            'hits_total 5\n')
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'nodes_cache_hits_total', response.content)
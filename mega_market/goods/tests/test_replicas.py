@@ -0,0 +1,147 @@
+import json
+import os
+import sqlite3
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core import routers
+
+REPLICA = 'replica'
+DATE_1 = "2022-05-28T21:12:01.000Z"
+DATE_2 = "2022-05-28T22:12:01.000Z"
+# Адрес другого клиента, его записи не привязывают нас к default
+OTHER_CLIENT = '10.0.0.1'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class TestReplicaRouting(TransactionTestCase):
+    """
+    Реплика - файл SQLite, в который копируется основная база
+    """
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.replica_path = os.path.join(cls.directory.name, 'replica.db')
+        connections.databases[REPLICA] = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.replica_path}
+        connections.ensure_defaults(REPLICA)
+        connections.prepare_test_settings(REPLICA)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+        if hasattr(connections._connections, REPLICA):
+            delattr(connections._connections, REPLICA)
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        self.other_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a446"
+        # Привязка к default в общем для процессов кэше
+        override = override_settings(CACHES=dict(
+            settings.CACHES, default={
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': os.path.join(self.directory.name, 'cache'),
+            }))
+        override.enable()
+        self.addCleanup(override.disable)
+        caches['default'].clear()
+        routers._down_until.clear()
+        self.import_price(100, DATE_1, OTHER_CLIENT)
+        self.replicate()
+        # Изменение, еще не дошедшее до реплики
+        self.import_price(200, DATE_2, OTHER_CLIENT)
+
+    def replicate(self):
+        connections[REPLICA].close()
+        connections['default'].ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        connections['default'].connection.backup(target)
+        target.close()
+
+    def import_price(self, price, date, address='127.0.0.1'):
+        response = self.client.post(reverse('imports'), data={
+            "items": [{"type": "OFFER", "name": "Оффер",
+                       "id": self.offer_uuid, "price": price}],
+            "updateDate": date,
+        }, content_type='application/json', REMOTE_ADDR=address)
+        self.assertEqual(response.status_code, 200)
+
+    def get_price(self):
+        response = self.client.get(reverse('nodes', args=[self.offer_uuid]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['price']
+
+    def get_statistic_prices(self):
+        response = self.client.get(
+            reverse('get_node_statistic', args=[self.offer_uuid]))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(b''.join(response.streaming_content))
+        return [item['price'] for item in data['items']]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.get_price(), 100)
+        self.assertEqual(self.get_statistic_prices(), [100])
+
+    def test_writes_go_to_primary(self):
+        self.import_price(300, DATE_2)
+        connections['default'].ensure_connection()
+        self.replicate()
+        self.assertEqual(self.get_price(), 300)
+
+    def test_sticky_after_write(self):
+        self.assertEqual(self.get_price(), 100)
+        response = self.client.post(reverse('imports'), data={
+            "items": [{"type": "OFFER", "name": "Другой",
+                       "id": self.other_uuid, "price": 1}],
+            "updateDate": DATE_2,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # Ответ, прочитанный с реплики, не попал в кэш /nodes
+        self.assertEqual(self.get_price(), 200)
+        self.assertEqual(self.get_statistic_prices(), [100, 200])
+
+    def test_sticky_after_delete(self):
+        response = self.client.delete(
+            reverse('delete', args=[self.offer_uuid]))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('nodes', args=[self.offer_uuid]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_fallback_when_replica_unreachable(self):
+        settings_dict = connections[REPLICA].settings_dict
+        name = settings_dict['NAME']
+        connections[REPLICA].close()
+        settings_dict['NAME'] = os.path.join(
+            self.directory.name, 'missing', 'replica.db')
+        try:
+            self.assertEqual(self.get_price(), 200)
+            self.assertIn(REPLICA, routers._down_until)
+        finally:
+            settings_dict['NAME'] = name
+
+    def test_local_sticky_cache_disables_replicas(self):
+        with override_settings(CACHES=dict(settings.CACHES, default={
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        })):
+            self.assertEqual(self.get_price(), 200)
+
+    def test_fallback_when_replica_fails(self):
+        connections[REPLICA].close()
+        os.remove(self.replica_path)
+        self.assertEqual(self.get_price(), 200)
+        self.assertIn(REPLICA, routers._down_until)
+        # Пока реплика недоступна, она не выбирается
+        self.replicate()
+        self.assertEqual(self.get_price(), 200)
@@ -0,0 +1,122 @@
+import datetime
+import io
+import json
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import RollupWatermark, ShopUnitStatisticRollup, \
+    ShopUnitStatisticUnit
+from ..rollups import bucket_start, build_rollups
+
+
+class TestBucketStart(TestCase):
+    def test_buckets(self):
+        date = timezone.make_aware(
+            datetime.datetime(2022, 5, 28, 21, 12, 1, 500))
+        self.assertEqual(bucket_start(date, 'hour'), timezone.make_aware(
+            datetime.datetime(2022, 5, 28, 21)))
+        self.assertEqual(bucket_start(date, 'day'), timezone.make_aware(
+            datetime.datetime(2022, 5, 28)))
+        self.assertEqual(bucket_start(date, 'week'), timezone.make_aware(
+            datetime.datetime(2022, 5, 23)))
+
+
+class TestRollups(TestCase):
+    def setUp(self):
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+
+    def import_offer(self, price, date):
+        response = self.client.post(reverse('imports'), data={
+            "items": [
+                {"id": self.category_uuid, "name": "Категория",
+                 "type": "CATEGORY"},
+                {"id": self.offer_uuid, "name": "Оффер", "type": "OFFER",
+                 "parentId": self.category_uuid, "price": price},
+            ],
+            "updateDate": date
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def get_statistic(self, unit_id, **params):
+        response = self.client.get(
+            reverse('get_node_statistic', args=[unit_id]), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))['items']
+
+    def test_incremental_build(self):
+        self.import_offer(10, "2022-05-28T21:12:01.000Z")
+        self.import_offer(30, "2022-05-28T22:12:01.000Z")
+        self.assertEqual(build_rollups('day'), 4)
+        self.assertEqual(build_rollups('day'), 0)
+
+        self.import_offer(5, "2022-05-28T23:12:01.000Z")
+        self.import_offer(7, "2022-05-29T01:00:00.000Z")
+        self.assertEqual(build_rollups('day', batch_size=1), 4)
+        self.assertEqual(
+            RollupWatermark.objects.get(interval='day').history_id,
+            ShopUnitStatisticUnit.objects.latest('id').id)
+
+        items = self.get_statistic(self.offer_uuid, interval='day')
+        self.assertEqual([item['date'] for item in items], [
+            "2022-05-28T00:00:00.000Z", "2022-05-29T00:00:00.000Z"])
+        self.assertEqual(items[0]['price'], 5)
+        self.assertEqual(items[0]['minPrice'], 5)
+        self.assertEqual(items[0]['maxPrice'], 30)
+        self.assertEqual(items[0]['avgPrice'], 15)
+        self.assertEqual(items[1]['avgPrice'], 7)
+
+    def test_late_committed_row(self):
+        self.import_offer(10, "2022-05-28T21:12:01.000Z")
+        self.import_offer(30, "2022-05-28T22:12:01.000Z")
+        # Запись еще не видна: ее транзакция зафиксируется после сборки
+        late = ShopUnitStatisticUnit.objects.get(
+            source_id=self.offer_uuid, price=10)
+        late_id = late.id
+        late.delete()
+        self.assertEqual(build_rollups('day'), 3)
+        self.assertEqual(json.loads(
+            RollupWatermark.objects.get(interval='day').pending), [late_id])
+
+        late.id = late_id
+        late.save(force_insert=True)
+        self.assertEqual(build_rollups('day'), 1)
+        self.assertEqual(build_rollups('day'), 0)
+        rollup = ShopUnitStatisticRollup.objects.get(
+            source_id=self.offer_uuid, interval='day')
+        self.assertEqual(
+            (rollup.min_price, rollup.max_price, rollup.price_count),
+            (10, 30, 2))
+        self.assertEqual(
+            RollupWatermark.objects.get(interval='day').pending, '[]')
+
+    def test_replaced_history_rebuilds_bucket(self):
+        self.import_offer(10, "2022-05-28T21:12:01.000Z")
+        build_rollups('hour')
+        self.import_offer(20, "2022-05-28T21:12:01.000Z")
+        build_rollups('hour')
+        rollup = ShopUnitStatisticRollup.objects.get(
+            source_id=self.category_uuid, interval='hour')
+        self.assertEqual(
+            (rollup.price, rollup.price_sum, rollup.price_count), (20, 20, 1))
+
+    def test_interval_range(self):
+        self.import_offer(10, "2022-05-28T21:12:01.000Z")
+        self.import_offer(20, "2022-05-29T21:12:01.000Z")
+        call_command('build_rollups', stdout=io.StringIO())
+        items = self.get_statistic(
+            self.category_uuid, interval='day',
+            dateStart="2022-05-29T00:00:00.000Z",
+            dateEnd="2022-05-30T00:00:00.000Z")
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]['price'], 20)
+
+    def test_incorrect_interval(self):
+        self.import_offer(10, "2022-05-28T21:12:01.000Z")
+        response = self.client.get(
+            reverse('get_node_statistic', args=[self.offer_uuid]),
+            {'interval': 'year'})
+        self.assertEqual(response.status_code, 400)
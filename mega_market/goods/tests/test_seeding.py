@@ -0,0 +1,75 @@
+import datetime
+import json
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from ..models import ShopUnit, ShopUnitStatisticUnit, get_subtree
+from ..seeding import seed_catalog
+
+
+class TestSeedCatalog(TestCase):
+    def setUp(self):
+        self.date = timezone.make_aware(datetime.datetime(2022, 5, 28))
+        self.root_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a440"
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.offer_uuids = ["3fa85f64-5717-4562-b3fc-2c963f66a445",
+                            "3fa85f64-5717-4562-b3fc-2c963f66a446",
+                            "3fa85f64-5717-4562-b3fc-2c963f66a447"]
+        # Элементы раньше родителей: порядок в фиде не важен
+        self.items = [
+            {"id": self.offer_uuids[0], "name": "Оффер", "type": "OFFER",
+             "parentId": self.category_uuid, "price": 10},
+            {"id": self.offer_uuids[1], "name": "Оффер", "type": "OFFER",
+             "parentId": self.category_uuid, "price": 25},
+            {"id": self.offer_uuids[2], "name": "Оффер", "type": "OFFER",
+             "parentId": self.root_uuid, "price": 4},
+            {"id": self.category_uuid, "name": "Категория",
+             "type": "CATEGORY", "parentId": self.root_uuid},
+            {"id": self.root_uuid, "name": "Корень", "type": "CATEGORY"},
+        ]
+
+    def seed(self, items, **kwargs):
+        lines = [json.dumps(item).encode() for item in items]
+        return seed_catalog(lines, self.date, chunk_size=2, **kwargs)
+
+    def test_seed(self):
+        self.assertEqual(self.seed(self.items), 5)
+        root = get_subtree(self.root_uuid)
+        self.assertEqual(root.offer_totals, (39, 3))
+        self.assertEqual(root.price, 13)
+        category = ShopUnit.objects.get(id=self.category_uuid)
+        self.assertEqual(category.path,
+                         f'{self.root_uuid}/{self.category_uuid}/')
+        self.assertEqual(int(category.price), 17)
+        self.assertEqual(category.date, self.date)
+
+        history = dict(ShopUnitStatisticUnit.objects.values_list(
+            'source_id', 'price'))
+        self.assertEqual(history[self.root_uuid], 13)
+        self.assertEqual(history[self.category_uuid], 17)
+        self.assertEqual(history[self.offer_uuids[0]], 10)
+
+    def test_missing_parent(self):
+        with self.assertRaises(ValidationError):
+            self.seed(self.items[:-1])
+        self.assertFalse(ShopUnit.objects.exists())
+
+    def test_offer_parent(self):
+        self.items[0]['parentId'] = self.offer_uuids[1]
+        with self.assertRaises(ValidationError):
+            self.seed(self.items)
+
+    def test_cycle(self):
+        self.items[-1]['parentId'] = self.category_uuid
+        with self.assertRaises(ValidationError):
+            self.seed(self.items)
+
+    def test_replace(self):
+        self.seed(self.items)
+        with self.assertRaises(ValidationError):
+            self.seed(self.items)
+        self.assertEqual(self.seed(self.items[-1:], replace=True), 1)
+        self.assertEqual(ShopUnit.objects.count(), 1)
+        self.assertEqual(ShopUnitStatisticUnit.objects.count(), 1)
@@ -0,0 +1,125 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import ThrottleCounter
+from ..throttle import DatabaseCounterStore, FixedWindowRateThrottle, \
+    GetReadRateThrottle, MemoryCounterStore, SQLiteCounterStore, _stores
+
+
+class CounterStoreTests:
+    def make_store(self):
+        raise NotImplementedError
+
+    def test_counts_within_bucket(self):
+        store = self.make_store()
+        self.assertEqual([store.incr('a', 10, 9) for _ in range(3)],
+                         [1, 2, 3])
+        self.assertEqual(store.incr('b', 10, 9), 1)
+
+    def test_new_bucket_resets(self):
+        store = self.make_store()
+        store.incr('a', 10, 9)
+        store.incr('a', 10, 9)
+        self.assertEqual(store.incr('a', 11, 10), 1)
+
+    def test_purge(self):
+        store = self.make_store()
+        store.incr('a', 10, 9)
+        store.incr('b', 12, 11)
+        store.purge(11)
+        self.assertEqual(store.incr('a', 10, 9), 1)
+        self.assertEqual(store.incr('b', 12, 11), 2)
+
+
+class TestMemoryCounterStore(CounterStoreTests, TestCase):
+    def make_store(self):
+        return MemoryCounterStore()
+
+
+class TestSQLiteCounterStore(CounterStoreTests, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'throttle.sqlite3')
+
+    def make_store(self):
+        return SQLiteCounterStore(self.path)
+
+    def test_shared_between_stores(self):
+        # Два хранилища на одном файле - как два воркера gunicorn
+        first, second = self.make_store(), self.make_store()
+        first.incr('a', 10, 9)
+        self.assertEqual(second.incr('a', 10, 9), 2)
+
+    def test_unavailable(self):
+        store = SQLiteCounterStore(
+            os.path.join(self.path, 'missing', 'throttle.sqlite3'))
+        with self.assertLogs('goods.throttle', 'ERROR'):
+            self.assertIsNone(store.incr('a', 10, 9))
+
+
+class TestDatabaseCounterStore(CounterStoreTests, TestCase):
+    def make_store(self):
+        return DatabaseCounterStore()
+
+    def test_single_row_per_key(self):
+        store = self.make_store()
+        for bucket in range(5):
+            store.incr('a', bucket, bucket - 1)
+        self.assertEqual(ThrottleCounter.objects.get(key='a').bucket, 4)
+
+
+@override_settings(THROTTLE_STORE='memory')
+class TestReadThrottle(TestCase):
+    def setUp(self):
+        _stores.clear()
+        self.addCleanup(_stores.clear)
+        self.url = reverse('nodes', args=[
+            '3fa85f64-5717-4562-b3fc-2c963f66a445'])
+
+    @staticmethod
+    def rate(rate):
+        return mock.patch.dict(GetReadRateThrottle.THROTTLE_RATES,
+                               {'read_anon': rate})
+
+    def test_limit_per_window(self):
+        with self.rate('2/minute'), \
+                mock.patch.object(GetReadRateThrottle, 'timer',
+                                  return_value=120.0):
+            statuses = [self.client.get(self.url).status_code
+                        for _ in range(3)]
+            self.assertEqual(statuses, [404, 404, 429])
+            response = self.client.get(self.url, REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, 404)
+
+        with self.rate('2/minute'), \
+                mock.patch.object(GetReadRateThrottle, 'timer',
+                                  return_value=180.0):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_retry_after(self):
+        with self.rate('1/minute'), \
+                mock.patch.object(GetReadRateThrottle, 'timer',
+                                  return_value=130.0):
+            self.client.get(self.url)
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '50')
+
+    def test_read_purge_keeps_modify_counters(self):
+        rates = {'read_anon': '100/second', 'modify_anon': '2/minute'}
+        imports = reverse('imports')
+        with mock.patch.dict(GetReadRateThrottle.THROTTLE_RATES, rates), \
+                mock.patch('goods.throttle.PURGE_EVERY', 1), \
+                mock.patch.object(FixedWindowRateThrottle, 'timer',
+                                  return_value=130.0):
+            for _ in range(2):
+                self.assertEqual(self.client.post(imports).status_code, 400)
+            # Каждое чтение удаляет закончившиеся окна
+            for _ in range(3):
+                self.assertEqual(self.client.get(self.url).status_code, 404)
+            self.assertEqual(self.client.post(imports).status_code, 429)
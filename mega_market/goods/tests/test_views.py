@@ -1,16 +1,63 @@
 import copy
+import io
 import json
+import tempfile
 import urllib.parse
+import uuid
+from unittest import mock
 
-from django.test import TestCase, Client
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, Client, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
 
-from ..models import ShopUnit
+from ..cache import NodeCache, node_cache
+from ..encoders import unit_item
+from ..jobs import process_jobs
+from ..models import ImportJob, ShopUnit, ShopUnitStatisticUnit, \
+    delete_unit, get_subtree
+from ..serializers import ShopUnitStatisticUnitSerializer
 
 E400 = {'status': 400, 'message': 'Validation Failed'}
 E404 = {'status': 404, 'message': 'Item not found'}
 
 
+def use_shared_node_cache(test):
+    """
+    Кэш /nodes в FileBasedCache во временном каталоге - общий бэкенд,
+    как у процессов в развертывании. Возвращает каталог кэша
+    """
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    override = override_settings(CACHES=dict(settings.CACHES, nodes={
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': directory.name,
+    }))
+    override.enable()
+    test.addCleanup(override.disable)
+    return directory.name
+
+
+class OtherProcessNodeCache(NodeCache):
+    """
+    Кэш /nodes другого процесса: свой экземпляр бэкенда
+    на тех же файлах
+    """
+
+    def __init__(self, location):
+        super().__init__()
+        self._cache = FileBasedCache(location, {})
+
+    @property
+    def cache(self):
+        return self._cache
+
+
 class TestImports(TestCase):
 
     def setUp(self):
@@ -301,3 +348,910 @@ class TestStatistics(TestCase):
             json_response=True
         )
         self.assertEqual(response.status_code, 404)
+
+    def get_statistic(self, unit_id, **params):
+        response = self.client.get(
+            reverse('get_node_statistic', args=[unit_id]), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))['items']
+
+    def test_statistics_half_interval(self):
+        category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        dates = ["2022-05-28T21:12:01.000Z", "2022-05-29T21:12:01.000Z",
+                 "2022-05-30T21:12:01.000Z"]
+        for price, date in zip([2, 4, 6], reversed(dates)):
+            response = self.client.post(reverse('imports'), data={
+                "items": [
+                    {"id": category_uuid, "name": "Категория",
+                     "type": "CATEGORY"},
+                    dict(self.offer, price=price, parentId=category_uuid),
+                ],
+                "updateDate": date
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+        items = self.get_statistic(
+            category_uuid, dateStart=dates[0], dateEnd=dates[2])
+        self.assertEqual([item['date'] for item in items], dates[:2])
+        self.assertEqual([item['price'] for item in items], [6, 4])
+        self.assertEqual(len(self.get_statistic(self.offer_uuid)), 3)
+
+
+class TestCategoryPrice(TestCase):
+    def setUp(self):
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+        self.root_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a440"
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.other_category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a442"
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        self.other_offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a446"
+
+        self.root = {
+            "id": self.root_uuid,
+            "name": "Корневая категория",
+            "price": None,
+            "type": "CATEGORY"
+        }
+        self.category = {
+            "id": self.category_uuid,
+            "parentId": self.root_uuid,
+            "name": "Категория",
+            "price": None,
+            "type": "CATEGORY"
+        }
+        self.other_category = {
+            "id": self.other_category_uuid,
+            "name": "Другая категория",
+            "price": None,
+            "type": "CATEGORY"
+        }
+        self.offer = {
+            "id": self.offer_uuid,
+            "parentId": self.category_uuid,
+            "name": "Оффер",
+            "price": 100,
+            "type": "OFFER"
+        }
+        self.other_offer = {
+            "id": self.other_offer_uuid,
+            "parentId": self.root_uuid,
+            "name": "Другой оффер",
+            "price": 51,
+            "type": "OFFER"
+        }
+
+    def import_items(self, *items):
+        response = self.client.post(
+            reverse('imports'),
+            json.dumps({"items": items, "updateDate": self.date_ok}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def get_price(self, node_id):
+        response = self.client.get(reverse('nodes', args=[node_id]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['price']
+
+    def test_category_price_average(self):
+        self.import_items(self.root, self.category, self.other_category,
+                          self.offer, self.other_offer)
+        self.assertEqual(self.get_price(self.category_uuid), 100)
+        self.assertEqual(self.get_price(self.root_uuid), 75)
+        self.assertIsNone(self.get_price(self.other_category_uuid))
+
+        root = ShopUnit.objects.get(id=self.root_uuid)
+        self.assertEqual((root.offer_sum, root.offer_count), (151, 2))
+
+    def test_category_price_offer_update(self):
+        self.import_items(self.root, self.category, self.offer)
+        offer = copy.deepcopy(self.offer)
+        offer['price'] = 300
+        self.import_items(offer)
+        self.assertEqual(self.get_price(self.category_uuid), 300)
+        self.assertEqual(self.get_price(self.root_uuid), 300)
+
+    def test_category_price_reparent(self):
+        self.import_items(self.root, self.category, self.other_category,
+                          self.offer, self.other_offer)
+
+        category = copy.deepcopy(self.category)
+        category['parentId'] = self.other_category_uuid
+        self.import_items(category)
+        self.assertEqual(self.get_price(self.root_uuid), 51)
+        self.assertEqual(self.get_price(self.other_category_uuid), 100)
+
+        offer = copy.deepcopy(self.offer)
+        offer['parentId'] = None
+        self.import_items(offer)
+        self.assertIsNone(self.get_price(self.other_category_uuid))
+        self.assertIsNone(self.get_price(self.category_uuid))
+
+    def test_category_price_delete(self):
+        self.import_items(self.root, self.category,
+                          self.offer, self.other_offer)
+
+        response = self.client.delete(
+            reverse('delete', args=[self.category_uuid]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_price(self.root_uuid), 51)
+
+        response = self.client.delete(
+            reverse('delete', args=[self.other_offer_uuid]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.get_price(self.root_uuid))
+
+
+# Запросы счетчиков ограничения частоты в подсчет не входят
+@override_settings(THROTTLE_STORE='memory')
+class TestNodesTree(TestCase):
+    def setUp(self):
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+        self.root_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a440"
+        ShopUnit.objects.create(
+            id=self.root_uuid, name="Корень", type="CATEGORY",
+            date=self.date_ok)
+
+    def build_tree(self, depth, width):
+        """
+        Строит дерево категорий заданной глубины с товарами на каждом уровне
+        """
+        parents = [self.root_uuid]
+        for _ in range(depth):
+            categories = []
+            for parent_id in parents:
+                for _ in range(width):
+                    category = ShopUnit.objects.create(
+                        id=str(uuid.uuid4()), name="Категория",
+                        type="CATEGORY", date=self.date_ok,
+                        parent_id=parent_id)
+                    ShopUnit.objects.create(
+                        id=str(uuid.uuid4()), name="Оффер",
+                        type="OFFER", price=10, date=self.date_ok,
+                        parent_id=category.id)
+                    categories.append(category.id)
+            parents = categories
+
+    def get_tree(self):
+        response = self.client.get(reverse('nodes', args=[self.root_uuid]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_children(self):
+        self.build_tree(depth=1, width=1)
+        tree = self.get_tree()
+        self.assertEqual(len(tree['children']), 1)
+        category = tree['children'][0]
+        self.assertEqual(category['parentId'], self.root_uuid)
+        self.assertEqual(len(category['children']), 1)
+        self.assertIsNone(category['children'][0]['children'])
+
+    def test_empty_category_children(self):
+        self.assertEqual(self.get_tree()['children'], [])
+
+    def test_constant_query_count(self):
+        with self.assertNumQueries(2):
+            self.get_tree()
+
+        self.build_tree(depth=3, width=3)
+        with self.assertNumQueries(2):
+            tree = self.get_tree()
+        self.assertEqual(len(tree['children']), 3)
+
+
+class TestBulkImport(TestCase):
+    def setUp(self):
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.child_category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a442"
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+
+        self.category = {
+            "id": self.category_uuid,
+            "name": "Категория",
+            "type": "CATEGORY"
+        }
+        self.child_category = {
+            "id": self.child_category_uuid,
+            "parentId": self.category_uuid,
+            "name": "Дочерняя категория",
+            "type": "CATEGORY"
+        }
+        self.offer = {
+            "id": self.offer_uuid,
+            "parentId": self.child_category_uuid,
+            "name": "Оффер",
+            "price": 2,
+            "type": "OFFER"
+        }
+
+    def post_items(self, *items):
+        return self.client.post(
+            reverse('imports'),
+            json.dumps({"items": items, "updateDate": self.date_ok}),
+            content_type='application/json'
+        )
+
+    def test_parent_after_child(self):
+        response = self.post_items(
+            self.offer, self.child_category, self.category)
+        self.assertEqual(response.status_code, 200)
+        category = ShopUnit.objects.get(id=self.category_uuid)
+        self.assertEqual((category.offer_sum, category.offer_count), (2, 1))
+
+    def test_history_written(self):
+        self.post_items(self.category, self.child_category, self.offer)
+        self.assertEqual(ShopUnitStatisticUnit.objects.count(), 3)
+        history = ShopUnitStatisticUnit.objects.get(
+            source_id=self.category_uuid)
+        self.assertEqual(history.price, 2)
+
+    def test_cycle(self):
+        self.post_items(self.category, self.child_category)
+        category = copy.deepcopy(self.category)
+        category['parentId'] = self.child_category_uuid
+        response = self.post_items(category)
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(
+            ShopUnit.objects.get(id=self.category_uuid).parent_id)
+
+    def test_type_change(self):
+        self.post_items(self.category)
+        category = copy.deepcopy(self.offer)
+        category['id'] = self.category_uuid
+        category['parentId'] = None
+        response = self.post_items(category)
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_independent_of_batch_size(self):
+        def offers(count):
+            return [{"id": str(uuid.uuid4()),
+                     "parentId": self.category_uuid,
+                     "name": "Оффер",
+                     "price": 10,
+                     "type": "OFFER"} for _ in range(count)]
+
+        self.post_items(self.category)
+        with CaptureQueriesContext(connection) as small:
+            self.post_items(*offers(2))
+        with CaptureQueriesContext(connection) as large:
+            self.post_items(*offers(50))
+        self.assertEqual(len(small), len(large))
+        category = ShopUnit.objects.get(id=self.category_uuid)
+        self.assertEqual(category.offer_count, 52)
+
+
+class TestImportAtomic(TestCase):
+    def setUp(self):
+        self.old_date = "2022-05-27T21:12:01.000Z"
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.new_category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a442"
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        self.new_offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a446"
+
+        self.category = {
+            "id": self.category_uuid,
+            "name": "Категория",
+            "type": "CATEGORY"
+        }
+        self.offer = {
+            "id": self.offer_uuid,
+            "parentId": self.category_uuid,
+            "name": "Оффер",
+            "price": 2,
+            "type": "OFFER"
+        }
+        self.post_items(self.old_date, self.category, self.offer)
+
+        self.updated_offer = copy.deepcopy(self.offer)
+        self.updated_offer['price'] = 10
+        self.new_category = {
+            "id": self.new_category_uuid,
+            "name": "Новая категория",
+            "type": "CATEGORY"
+        }
+        self.new_offer = {
+            "id": self.new_offer_uuid,
+            "parentId": self.new_category_uuid,
+            "name": "Новый оффер",
+            "price": 4,
+            "type": "OFFER"
+        }
+
+    def post_items(self, date, *items):
+        return self.client.post(
+            reverse('imports'),
+            json.dumps({"items": items, "updateDate": date}),
+            content_type='application/json'
+        )
+
+    def assertUnchanged(self):
+        self.assertFalse(ShopUnit.objects.filter(
+            id__in=[self.new_category_uuid, self.new_offer_uuid]).exists())
+        offer = ShopUnit.objects.get(id=self.offer_uuid)
+        self.assertEqual(offer.price, 2)
+        self.assertEqual(offer.date.isoformat(), '2022-05-27T21:12:01+00:00')
+        category = ShopUnit.objects.get(id=self.category_uuid)
+        self.assertEqual((category.offer_sum, category.offer_count), (2, 1))
+        self.assertEqual(ShopUnitStatisticUnit.objects.count(), 2)
+
+    def test_invalid_item_mid_batch(self):
+        bad_offer = copy.deepcopy(self.new_offer)
+        bad_offer['price'] = -1
+        response = self.post_items(
+            self.date_ok, self.new_category, self.updated_offer, bad_offer)
+        self.assertEqual(response.status_code, 400)
+        self.assertUnchanged()
+
+    def test_missing_parent_mid_batch(self):
+        orphan = copy.deepcopy(self.new_offer)
+        orphan['parentId'] = "3fa85f64-5717-4562-b3fc-2c963f66a449"
+        response = self.post_items(
+            self.date_ok, self.new_category, self.updated_offer, orphan)
+        self.assertEqual(response.status_code, 400)
+        self.assertUnchanged()
+
+    def test_database_error_rolls_back(self):
+        with mock.patch('goods.importer.write_history',
+                        side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.post_items(self.date_ok, self.new_category,
+                                self.new_offer, self.updated_offer)
+        self.assertUnchanged()
+
+
+class TestParentsDate(TestCase):
+    def setUp(self):
+        self.old_date = "2022-05-27T21:12:01.000Z"
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+
+    def post_items(self, date, *items):
+        response = self.client.post(
+            reverse('imports'),
+            json.dumps({"items": items, "updateDate": date}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def make_chain(self, depth):
+        """
+        Импортирует цепочку вложенных категорий, возвращает их id
+        """
+        ids = [str(uuid.uuid4()) for _ in range(depth)]
+        self.post_items(self.old_date, *[{
+            "id": category_id,
+            "parentId": ids[i - 1] if i else None,
+            "name": "Категория",
+            "type": "CATEGORY"
+        } for i, category_id in enumerate(ids)])
+        return ids
+
+    def import_offers(self, parent_id, count=2):
+        with CaptureQueriesContext(connection) as queries:
+            self.post_items(self.date_ok, *[{
+                "id": str(uuid.uuid4()),
+                "parentId": parent_id,
+                "name": "Оффер",
+                "price": 10,
+                "type": "OFFER"
+            } for _ in range(count)])
+        return len(queries)
+
+    def test_dates_and_history(self):
+        ids = self.make_chain(3)
+        self.import_offers(ids[-1])
+        for category in ShopUnit.objects.filter(id__in=ids):
+            self.assertEqual(category.date.isoformat(),
+                             '2022-05-28T21:12:01+00:00')
+            history = category.history.get(date=category.date)
+            self.assertEqual(history.price, 10)
+
+    def test_query_count_independent_of_depth(self):
+        shallow = self.make_chain(2)
+        deep = self.make_chain(10)
+        self.assertEqual(self.import_offers(shallow[-1]),
+                         self.import_offers(deep[-1], count=5))
+
+
+class TestHierarchyPath(TestCase):
+    def setUp(self):
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+        self.ids = {name: str(uuid.uuid4()) for name in 'abcdxy'}
+        # a -> b -> c -> x(offer), a -> d, y(offer) -> c
+        self.post_items(
+            self.category('a'), self.category('b', 'a'),
+            self.category('c', 'b'), self.category('d', 'a'),
+            self.offer('x', 'c'), self.offer('y', 'c'))
+
+    def category(self, name, parent=None):
+        return {"id": self.ids[name],
+                "parentId": parent and self.ids[parent],
+                "name": name,
+                "type": "CATEGORY"}
+
+    def offer(self, name, parent=None):
+        return {"id": self.ids[name],
+                "parentId": parent and self.ids[parent],
+                "name": name,
+                "price": 10,
+                "type": "OFFER"}
+
+    def post_items(self, *items):
+        response = self.client.post(
+            reverse('imports'),
+            json.dumps({"items": items, "updateDate": self.date_ok}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def assertPathsConsistent(self):
+        units = {unit.id: unit for unit in ShopUnit.objects.all()}
+        for unit in units.values():
+            parent_path = (units[unit.parent_id].path
+                           if unit.parent_id else '')
+            self.assertEqual(unit.path, f'{parent_path}{unit.id}/')
+
+    def children_ids(self, name):
+        response = self.client.get(reverse('nodes', args=[self.ids[name]]))
+        return {child['id'] for child in response.json()['children']}
+
+    def test_move_subtree(self):
+        self.post_items(self.category('b', 'd'))
+        self.assertPathsConsistent()
+        self.assertEqual(self.children_ids('a'), {self.ids['d']})
+        self.assertEqual(self.children_ids('d'), {self.ids['b']})
+
+    def test_nested_moves_in_one_batch(self):
+        self.post_items(self.category('b', 'd'), self.category('c'),
+                        self.offer('x', 'a'))
+        self.assertPathsConsistent()
+        self.assertEqual(self.children_ids('a'),
+                         {self.ids['d'], self.ids['x']})
+        self.assertEqual(self.children_ids('c'), {self.ids['y']})
+        a = ShopUnit.objects.get(id=self.ids['a'])
+        self.assertEqual((a.offer_sum, a.offer_count), (10, 1))
+
+    def test_orm_save_keeps_paths(self):
+        c = ShopUnit.objects.get(id=self.ids['c'])
+        c.parent_id = self.ids['d']
+        c.save()
+        self.assertPathsConsistent()
+
+
+class TestSalesHistory(TestCase):
+    def setUp(self):
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.offer_uuids = [str(uuid.uuid4()) for _ in range(5)]
+        self.post_items("2022-05-27T10:00:00.000Z", {
+            "id": self.category_uuid,
+            "name": "Категория",
+            "type": "CATEGORY"
+        })
+        for hour, price in (('10', 1), ('11', 2)):
+            self.post_items(f"2022-05-28T{hour}:00:00.000Z", *[{
+                "id": offer_uuid,
+                "parentId": self.category_uuid,
+                "name": "Оффер",
+                "price": price,
+                "type": "OFFER"
+            } for offer_uuid in self.offer_uuids])
+
+    def post_items(self, date, *items):
+        response = self.client.post(
+            reverse('imports'),
+            json.dumps({"items": items, "updateDate": date}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def get_sales(self, **params):
+        params.setdefault('date', "2022-05-28T12:00:00.000Z")
+        return self.client.get(
+            f"{reverse('sales')}?{urllib.parse.urlencode(params)}")
+
+    def test_every_update_streamed(self):
+        response = self.get_sales()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        items = json.loads(b''.join(response.streaming_content))['items']
+        self.assertEqual(len(items), 10)
+        self.assertEqual({item['type'] for item in items}, {'OFFER'})
+        self.assertEqual(sorted(item['price'] for item in items),
+                         [1] * 5 + [2] * 5)
+
+    def test_window(self):
+        response = self.get_sales(date="2022-05-29T10:30:00.000Z")
+        items = json.loads(b''.join(response.streaming_content))['items']
+        self.assertEqual({item['price'] for item in items}, {2})
+
+    def test_keyset_pagination(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.get_sales(**params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            seen += [(item['id'], item['date']) for item in page['items']]
+            cursor = page['nextCursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len(set(seen)), 10)
+
+    def test_bad_pagination_params(self):
+        self.assertEqual(self.get_sales(limit=0).status_code, 400)
+        self.assertEqual(self.get_sales(limit='x').status_code, 400)
+        self.assertEqual(self.get_sales(cursor='###').status_code, 400)
+
+
+class TestStreaming(TestCase):
+    def setUp(self):
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        for day, price in ((27, 1), (28, 2)):
+            response = self.client.post(
+                reverse('imports'),
+                json.dumps({"items": [{
+                    "id": self.offer_uuid,
+                    "name": "Оффер \u2028 \"в кавычках\"",
+                    "price": price,
+                    "type": "OFFER"
+                }], "updateDate": f"2022-05-{day}T21:12:01.000Z"}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_statistic_matches_renderer(self):
+        response = self.client.get(
+            reverse('get_node_statistic', args=[self.offer_uuid]))
+        self.assertTrue(response.streaming)
+        expected = JSONRenderer().render({
+            'items': ShopUnitStatisticUnitSerializer(
+                ShopUnitStatisticUnit.objects.all(), many=True).data
+        })
+        self.assertEqual(b''.join(response.streaming_content), expected)
+
+    def test_chunks(self):
+        with mock.patch('goods.streaming.CHUNK_SIZE', 1):
+            response = self.client.get(
+                reverse('get_node_statistic', args=[self.offer_uuid]))
+            chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(len(json.loads(b''.join(chunks))['items']), 2)
+
+
+# Запросы счетчиков ограничения частоты в подсчет не входят
+@override_settings(THROTTLE_STORE='memory')
+class TestNodeCache(TransactionTestCase):
+    def setUp(self):
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        self.location = use_shared_node_cache(self)
+        node_cache.stats.clear()
+        self.import_items([
+            {"type": "CATEGORY", "name": "Категория",
+             "id": self.category_uuid, "parentId": None},
+            {"type": "OFFER", "name": "Оффер", "id": self.offer_uuid,
+             "parentId": self.category_uuid, "price": 100},
+        ])
+
+    def import_items(self, items):
+        response = self.client.post(
+            reverse('imports'),
+            data={"items": items, "updateDate": self.date_ok},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def get_price(self, unit_id):
+        response = self.client.get(reverse('nodes', args=[unit_id]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['price']
+
+    def test_hit_without_queries(self):
+        self.assertEqual(self.get_price(self.category_uuid), 100)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_price(self.category_uuid), 100)
+        self.assertEqual(node_cache.stats['misses'], 1)
+        self.assertEqual(node_cache.stats['hits'], 1)
+
+    def test_import_invalidates_ancestors(self):
+        self.assertEqual(self.get_price(self.category_uuid), 100)
+        self.import_items([
+            {"type": "OFFER", "name": "Оффер", "id": self.offer_uuid,
+             "parentId": self.category_uuid, "price": 300},
+        ])
+        self.assertGreater(node_cache.stats['invalidations'], 0)
+        self.assertEqual(self.get_price(self.category_uuid), 300)
+        self.assertEqual(self.get_price(self.offer_uuid), 300)
+
+    def test_delete_invalidates_subtree(self):
+        self.assertEqual(self.get_price(self.offer_uuid), 100)
+        response = self.client.delete(
+            reverse('delete', args=[self.category_uuid]))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('nodes', args=[self.offer_uuid]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stale_response_not_served(self):
+        def compute():
+            # Изменение пришло, пока считался ответ
+            node_cache.invalidate([self.category_uuid])
+            return {'price': 'stale'}
+
+        node_cache.get_or_set(self.category_uuid, compute)
+        self.assertEqual(self.get_price(self.category_uuid), 100)
+
+    def test_import_invalidates_other_processes(self):
+        other = OtherProcessNodeCache(self.location)
+        self.assertEqual(other.get_or_set(
+            self.category_uuid, lambda: {'price': 100}), {'price': 100})
+        self.import_items([
+            {"type": "OFFER", "name": "Оффер", "id": self.offer_uuid,
+             "parentId": self.category_uuid, "price": 300},
+        ])
+        self.assertEqual(other.get_or_set(
+            self.category_uuid, lambda: {'price': 300}), {'price': 300})
+
+    def test_disabled_without_shared_backend(self):
+        for backend in ('locmem.LocMemCache', 'dummy.DummyCache'):
+            with override_settings(CACHES=dict(settings.CACHES, nodes={
+                    'BACKEND': f'django.core.cache.backends.{backend}'})):
+                self.assertFalse(node_cache.enabled)
+                self.assertEqual(self.get_price(self.category_uuid), 100)
+                with self.assertNumQueries(2):
+                    self.assertEqual(self.get_price(self.category_uuid), 100)
+
+
+class TestSubtreeDelete(TestCase):
+    def setUp(self):
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+        self.root_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a440"
+        self.category_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a441"
+        self.import_items([
+            {"type": "CATEGORY", "name": "Корень", "id": self.root_uuid},
+            {"type": "OFFER", "name": "Оффер", "id": str(uuid.uuid4()),
+             "parentId": self.root_uuid, "price": 10},
+        ], "2022-05-27T21:12:01.000Z")
+
+    def import_items(self, items, date):
+        response = self.client.post(
+            reverse('imports'),
+            data={"items": items, "updateDate": date},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def build_subtree(self, size):
+        """
+        Категория с цепочкой подкатегорий и товаром в каждой
+        """
+        items = [{"type": "CATEGORY", "name": "Категория",
+                  "id": self.category_uuid, "parentId": self.root_uuid}]
+        parent_id = self.category_uuid
+        for _ in range(size):
+            category_id = str(uuid.uuid4())
+            items += [
+                {"type": "CATEGORY", "name": "Категория", "id": category_id,
+                 "parentId": parent_id},
+                {"type": "OFFER", "name": "Оффер", "id": str(uuid.uuid4()),
+                 "parentId": category_id, "price": 100},
+            ]
+            parent_id = category_id
+        self.import_items(items, self.date_ok)
+
+    def delete_category(self):
+        response = self.client.delete(
+            reverse('delete', args=[self.category_uuid]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_subtree_and_history_deleted(self):
+        self.build_subtree(5)
+        with mock.patch('goods.models.DELETE_CHUNK_SIZE', 2):
+            self.delete_category()
+        self.assertEqual(ShopUnit.objects.count(), 2)
+        self.assertEqual(
+            set(ShopUnitStatisticUnit.objects.values_list(
+                'source_id', flat=True)),
+            set(ShopUnit.objects.values_list('id', flat=True)))
+
+    def test_root_aggregates_and_date(self):
+        self.build_subtree(5)
+        self.delete_category()
+        root = ShopUnit.objects.get(id=self.root_uuid)
+        self.assertEqual(root.offer_totals, (10, 1))
+        self.assertEqual(
+            root.date.isoformat(), "2022-05-28T21:12:01+00:00")
+
+    def test_stale_unit_reread(self):
+        self.build_subtree(1)
+        category = ShopUnit.objects.get(id=self.category_uuid)
+        # Импорт в поддерево после загрузки элемента
+        self.import_items([
+            {"type": "OFFER", "name": "Оффер", "id": str(uuid.uuid4()),
+             "parentId": self.category_uuid, "price": 1000},
+        ], self.date_ok)
+        self.assertTrue(delete_unit(category))
+        root = ShopUnit.objects.get(id=self.root_uuid)
+        self.assertEqual(root.offer_totals, (10, 1))
+        self.assertFalse(delete_unit(category))
+
+    def test_query_count_independent_of_size(self):
+        counts = []
+        for size in (2, 20):
+            self.build_subtree(size)
+            with CaptureQueriesContext(connection) as queries:
+                self.delete_category()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class TestImportJobs(TestCase):
+    def setUp(self):
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        self.missing_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a446"
+
+    def enqueue(self, items, date):
+        response = self.client.post(
+            reverse('imports') + '?async=1',
+            data={"items": items, "updateDate": date},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        return response.json()['id']
+
+    def enqueue_offer(self, price, date):
+        return self.enqueue([{"id": self.offer_uuid, "name": "Оффер",
+                              "type": "OFFER", "price": price}], date)
+
+    def get_job(self, job_id):
+        response = self.client.get(reverse('import_job', args=[job_id]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_jobs_applied_in_update_date_order(self):
+        later = self.enqueue_offer(20, "2022-05-29T21:12:01.000Z")
+        earlier = self.enqueue_offer(10, "2022-05-28T21:12:01.000Z")
+        self.assertFalse(ShopUnit.objects.exists())
+        self.assertEqual(self.get_job(earlier)['position'], 0)
+        self.assertEqual(self.get_job(later)['position'], 1)
+
+        self.assertEqual(process_jobs(), 2)
+        self.assertEqual(ShopUnit.objects.get(id=self.offer_uuid).price, 20)
+        job = self.get_job(later)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['total'], 1)
+        self.assertIsNone(job['position'])
+        self.assertEqual(job['updateDate'], "2022-05-29T21:12:01.000Z")
+
+    def test_failed_job(self):
+        job_id = self.enqueue([
+            {"id": self.offer_uuid, "name": "Оффер", "type": "OFFER",
+             "price": 10, "parentId": self.missing_uuid}
+        ], "2022-05-28T21:12:01.000Z")
+        process_jobs()
+        job = self.get_job(job_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertTrue(job['error'])
+        self.assertFalse(ShopUnit.objects.exists())
+
+    def test_invalid_request_not_queued(self):
+        response = self.client.post(
+            reverse('imports') + '?async=1',
+            data={"items": [{"id": self.offer_uuid}],
+                  "updateDate": "2022-05-28T21:12:01.000Z"},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_job_not_found(self):
+        response = self.client.get(
+            reverse('import_job', args=[self.missing_uuid]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestImportJobCache(TransactionTestCase):
+    """
+    Задачи выполняет отдельный процесс import_worker, а /nodes
+    отвечают процессы web и api
+    """
+
+    def setUp(self):
+        self.offer_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a445"
+        self.web_cache = OtherProcessNodeCache(use_shared_node_cache(self))
+
+    def import_offer(self, price, date, url):
+        return self.client.post(url, data={
+            "items": [{"id": self.offer_uuid, "name": "Оффер",
+                       "type": "OFFER", "price": price}],
+            "updateDate": date,
+        }, content_type='application/json')
+
+    def web_price(self):
+        return self.web_cache.get_or_set(
+            self.offer_uuid,
+            lambda: unit_item(get_subtree(self.offer_uuid)))['price']
+
+    def test_job_invalidates_web_cache(self):
+        self.import_offer(10, "2022-05-28T21:12:01.000Z", reverse('imports'))
+        self.assertEqual(self.web_price(), 10)
+        self.assertEqual(self.web_cache.stats['misses'], 1)
+
+        response = self.import_offer(
+            20, "2022-05-29T21:12:01.000Z", reverse('imports') + '?async=1')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.web_price(), 10)
+        self.assertEqual(process_jobs(), 1)
+        self.assertEqual(self.web_price(), 20)
+        self.assertEqual(self.web_cache.stats['misses'], 2)
+
+
+class TestImportFeed(TestCase):
+    def setUp(self):
+        self.date_ok = "2022-05-28T21:12:01.000Z"
+        self.root_uuid = "3fa85f64-5717-4562-b3fc-2c963f66a440"
+        self.offer_uuids = [str(uuid.uuid4()) for _ in range(5)]
+        lines = [json.dumps({"id": self.root_uuid, "name": "Корень",
+                             "type": "CATEGORY"})]
+        lines += [json.dumps([
+            {"id": offer_uuid, "name": "Оффер", "type": "OFFER",
+             "parentId": self.root_uuid, "price": price}
+            for offer_uuid, price in zip(self.offer_uuids[:2], [10, 20])])]
+        lines += [json.dumps({"id": offer_uuid, "name": "Оффер",
+                              "type": "OFFER", "parentId": self.root_uuid,
+                              "price": 30})
+                  for offer_uuid in self.offer_uuids[2:]]
+        self.feed = '\n'.join(lines + ['']).encode()
+
+    def post_feed(self, body, date=None):
+        url = reverse('imports_feed') + '?' + urllib.parse.urlencode(
+            {'updateDate': date or self.date_ok})
+        return self.client.post(url, data=body,
+                                content_type='application/x-ndjson')
+
+    def test_feed_imported_in_chunks(self):
+        with mock.patch('goods.feed.FEED_CHUNK_SIZE', 2):
+            response = self.post_feed(self.feed)
+        self.assertEqual(response.status_code, 200)
+        root = ShopUnit.objects.get(id=self.root_uuid)
+        self.assertEqual(root.offer_totals, (120, 5))
+        self.assertEqual(ShopUnitStatisticUnit.objects.count(), 6)
+
+    def test_duplicate_id_rejected(self):
+        duplicate = json.dumps({"id": self.offer_uuids[0], "name": "Оффер",
+                                "type": "OFFER", "parentId": self.root_uuid,
+                                "price": 40})
+        for chunk_size in (2, 3, 10):
+            with mock.patch('goods.feed.FEED_CHUNK_SIZE', chunk_size):
+                response = self.post_feed(self.feed + duplicate.encode())
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(ShopUnit.objects.exists())
+
+    def test_invalid_line_rolls_back(self):
+        response = self.post_feed(self.feed + b'{"id": \n')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ShopUnit.objects.exists())
+
+    def test_incorrect_date(self):
+        response = self.post_feed(self.feed, date='2022-05-12T21:')
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_feed(self):
+        for body in (b'', b'\n\n'):
+            response = self.post_feed(body)
+            self.assertEqual(response.status_code, 400)
+        url = reverse('imports_feed') + '?' + urllib.parse.urlencode(
+            {'updateDate': self.date_ok})
+        self.assertEqual(self.client.post(url).status_code, 400)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.ndjson') as feed:
+            feed.write(self.feed)
+            feed.flush()
+            out = io.StringIO()
+            call_command('import_feed', feed.name, date=self.date_ok,
+                         chunk_size=3, stdout=out)
+        self.assertIn('Imported 6 items', out.getvalue())
+        self.assertEqual(
+            ShopUnit.objects.get(id=self.root_uuid).price, 24)
@@ -1,9 +1,197 @@
+"""
+Ограничение частоты запросов фиксированными окнами: на каждого клиента
+хранится время окончания текущего окна и число запросов в нем,
+проверка - одно атомарное увеличение счетчика в хранилище THROTTLE_STORE:
+
+- memory: словарь процесса, у каждого воркера свои счетчики;
+- sqlite: файл SQLite THROTTLE_SQLITE_PATH, общий для процессов
+  одного сервера;
+- database: таблица ThrottleCounter в основной БД, общая для серверов
+  (по умолчанию).
+
+Ошибки хранилищ записываются в журнал, а запрос пропускается
+"""
+import logging
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections
 from rest_framework import throttling
 
+from .models import ThrottleCounter
+
+logger = logging.getLogger(__name__)
+
+# Устаревшие счетчики удаляются раз в PURGE_EVERY увеличений
+PURGE_EVERY = 10000
+
+UPSERT = (
+    'INSERT INTO {table} (key, bucket, count) VALUES ({p}, {p}, 1) '
+    'ON CONFLICT (key) DO UPDATE SET '
+    'count = CASE WHEN {table}.bucket = excluded.bucket '
+    'THEN {table}.count + 1 ELSE 1 END, bucket = excluded.bucket '
+    'RETURNING count'
+)
+
+
+class CounterStore:
+    """
+    incr(key, bucket, expires) увеличивает счетчик key в окне bucket
+    и возвращает его значение или None, если хранилище недоступно.
+    Счетчики с окнами раньше expires можно удалить, поэтому bucket
+    и expires должны быть в одной шкале у всех ограничений, которые
+    делят хранилище
+    """
+
+    def __init__(self):
+        self.increments = 0
+
+    def incr(self, key, bucket, expires):
+        self.increments += 1
+        if self.increments % PURGE_EVERY == 0:
+            self.purge(expires)
+        return self._incr(key, bucket)
+
+
+class MemoryCounterStore(CounterStore):
+    def __init__(self):
+        super().__init__()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def _incr(self, key, bucket):
+        with self.lock:
+            counter = self.counters.get(key)
+            count = counter[1] + 1 if counter and counter[0] == bucket else 1
+            self.counters[key] = (bucket, count)
+            return count
+
+    def purge(self, expires):
+        with self.lock:
+            self.counters = {key: counter
+                             for key, counter in self.counters.items()
+                             if counter[0] >= expires}
+
+
+class SQLiteCounterStore(CounterStore):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, '
+                'bucket INTEGER NOT NULL, count INTEGER NOT NULL)')
+            self.local.connection = connection
+        return connection
+
+    def _incr(self, key, bucket):
+        try:
+            return self.connection.execute(
+                UPSERT.format(table='counters', p='?'),
+                (key, bucket)).fetchone()[0]
+        except sqlite3.Error:
+            logger.exception('Throttle counter %s is unavailable', self.path)
+            return None
+
+    def purge(self, expires):
+        try:
+            self.connection.execute(
+                'DELETE FROM counters WHERE bucket < ?', (expires,))
+        except sqlite3.Error:
+            logger.exception('Throttle counters %s are not purged',
+                             self.path)
+
+
+class DatabaseCounterStore(CounterStore):
+    table = ThrottleCounter._meta.db_table
+
+    def _incr(self, key, bucket):
+        try:
+            with connections['default'].cursor() as cursor:
+                cursor.execute(UPSERT.format(table=self.table, p='%s'),
+                               [key, bucket])
+                return cursor.fetchone()[0]
+        except DatabaseError:
+            logger.exception('Throttle counter table is unavailable')
+            return None
+
+    def purge(self, expires):
+        try:
+            ThrottleCounter.objects.filter(bucket__lt=expires).delete()
+        except DatabaseError:
+            logger.exception('Throttle counters are not purged')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_counter_store():
+    name = settings.THROTTLE_STORE
+    store = _stores.get(name)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(name)
+            if store is None:
+                if name == 'sqlite':
+                    store = SQLiteCounterStore(settings.THROTTLE_SQLITE_PATH)
+                elif name == 'database':
+                    store = DatabaseCounterStore()
+                else:
+                    store = MemoryCounterStore()
+                _stores[name] = store
+    return store
+
+
+class FixedWindowRateThrottle(throttling.AnonRateThrottle):
+    """
+    AnonRateThrottle со счетчиком на окно вместо списка времени
+    запросов. На границе окон клиент может успеть сделать до двух
+    лимитов запросов подряд. Если хранилище недоступно, запрос
+    пропускается
+    """
+
+    def get_cache_key(self, request, view):
+        # В mega_market.settings_api аутентификации нет и user - None
+        if request.user is not None and request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        # Окно обозначается временем окончания в секундах: у окон
+        # разной длины шкала одна, и удаляются только закончившиеся
+        self.window_end = (int(self.now // self.duration) + 1) * self.duration
+        self.count = get_counter_store().incr(
+            self.key, self.window_end, int(self.now))
+        return self.count is None or self.count <= self.num_requests
+
+    def wait(self):
+        return self.window_end - self.now
+
 
-class GetReadRateThrottle(throttling.AnonRateThrottle):
+class GetReadRateThrottle(FixedWindowRateThrottle):
     scope = 'read_anon'
 
 
-class GetModifyRateThrottle(throttling.AnonRateThrottle):
+class GetModifyRateThrottle(FixedWindowRateThrottle):
     scope = 'modify_anon'
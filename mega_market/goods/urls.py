@@ -5,8 +5,11 @@ from . import views
 urlpatterns = [
     path('nodes/<uuid:node_id>', views.nodes, name='nodes'),
     path('imports', views.imports, name='imports'),
+    path('imports/feed', views.imports_feed, name='imports_feed'),
+    path('imports/<uuid:job_id>', views.import_job, name='import_job'),
     path('delete/<uuid:node_id>', views.delete, name='delete'),
     path('sales', views.sales, name='sales'),
     path('node/<uuid:node_id>/statistic', views.get_node_statistic,
          name='get_node_statistic'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,15 +1,29 @@
-import datetime
 from http import HTTPStatus
 
 from dateutil.parser import isoparse
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 
-from .models import ShopUnit, update_parents_date, \
-    ShopUnitType, ShopUnitStatisticUnit
-from .serializers import ShopUnitSerializer, ShopUnitStatisticUnitSerializer
+from core.metrics import pool_samples, render
+from core.routers import get_read_alias
+
+from .cache import node_cache
+from .engine import catalog_engine
+from .encoders import ROLLUP_FIELDS, STATISTIC_FIELDS, rollup_item, \
+    statistic_item, unit_item
+from .feed import import_feed
+from .importer import import_units
+from .jobs import enqueue_import
+from .pagination import after_cursor, decode_cursor, encode_cursor, \
+    parse_limit
+from .models import ImportJob, RollupInterval, ShopUnit, delete_unit, \
+    get_subtree, get_sales, get_statistic, get_statistic_rollups
+from .serializers import ImportJobSerializer, \
+    ShopUnitImportRequestSerializer
+from .streaming import stream_items
 from .throttle import GetModifyRateThrottle, GetReadRateThrottle
 
 
@@ -19,39 +33,69 @@ def nodes(request, node_id):
     """
     Возвращает элемент по id
     """
+    if catalog_engine.enabled:
+        data = catalog_engine.node(node_id)
+        if data is None:
+            raise Http404
+        return Response(data, status=HTTPStatus.OK)
 
-    node = get_object_or_404(ShopUnit, id=node_id)
-    serializer = ShopUnitSerializer(node)
-    return Response(serializer.data, status=HTTPStatus.OK)
+    def load():
+        node = get_subtree(node_id)
+        return unit_item(node) if node is not None else None
+
+    data = node_cache.get_or_set(
+        node_id, load, store=get_read_alias() is None)
+    if data is None:
+        raise Http404
+    return Response(data, status=HTTPStatus.OK)
 
 
 @api_view(['GET'])
 @throttle_classes([GetReadRateThrottle])
 def sales(request):
     """
-    Возвращает список продаж за последние сутки
+    Возвращает список обновлений товаров за последние сутки.
+    С параметром limit возвращает страницу и курсор следующей
+    страницы nextCursor, без него - весь список потоком
     """
     try:
         date = isoparse(request.query_params.get('date'))
     except (ValueError, TypeError):
         raise ParseError('Incorrect date format')
 
-    sales = ShopUnit.objects.filter(
-        type=ShopUnitType.OFFER.value
-    ).filter(
-        date__gte=(date - datetime.timedelta(days=1))
-    ).filter(
-        date__lte=date
-    )
-    serializer = ShopUnitSerializer(sales, many=True)
-    return Response({'items': serializer.data}, status=HTTPStatus.OK)
+    limit = parse_limit(request.query_params.get('limit'))
+    cursor = request.query_params.get('cursor')
+
+    page = None
+    if catalog_engine.enabled:
+        page = catalog_engine.sales(
+            date, decode_cursor(cursor) if cursor else None, limit)
+        if page is not None and limit is None:
+            return stream_items(
+                (row[1:] for row in page), statistic_item)
+    if page is None:
+        sales = get_sales(date)
+        if cursor:
+            sales = after_cursor(sales, cursor)
+        if limit is None:
+            return stream_items(
+                sales.values_list(*STATISTIC_FIELDS), statistic_item)
+        page = list(sales.values_list('id', *STATISTIC_FIELDS)[:limit])
+
+    return Response({
+
+        'items': [statistic_item(row[1:]) for row in page],
+        'nextCursor': encode_cursor(page[-1][0], page[-1][3])
+        if len(page) == limit else None
+    }, status=HTTPStatus.OK)
 
 
 @api_view(['GET'])
 @throttle_classes([GetReadRateThrottle])
 def get_node_statistic(request, node_id):
     """
-    Возвращает статистику по элементу
+    Возвращает статистику по элементу. С параметром interval
+    возвращает агрегаты по интервалам, построенные build_rollups
     """
     node = get_object_or_404(ShopUnit, id=node_id)
     date_from = request.query_params.get('dateStart')
@@ -64,54 +108,70 @@ def get_node_statistic(request, node_id):
     except ValueError:
         raise ParseError('Incorrect date format')
 
-    queryset = ShopUnitStatisticUnit.objects.filter(source=node)
-    if date_from:
-        queryset = queryset.filter(date__gte=date_from)
-    if date_to:
-        queryset = queryset.filter(date__lte=date_to)
-    serializer = ShopUnitStatisticUnitSerializer(queryset, many=True)
-    return Response({'items': serializer.data}, status=HTTPStatus.OK)
+    interval = request.query_params.get('interval')
+    if interval:
+        if interval not in dict(RollupInterval.choices()):
+            raise ParseError('Incorrect interval')
+        queryset = get_statistic_rollups(
+            node.id, interval, date_from, date_to)
+        return stream_items(
+            queryset.values_list(*ROLLUP_FIELDS), rollup_item)
+
+    queryset = get_statistic(node.id, date_from, date_to)
+    return stream_items(
+        queryset.values_list(*STATISTIC_FIELDS), statistic_item)
 
 
 @api_view(['POST'])
 @throttle_classes([GetModifyRateThrottle])
 def imports(request):
     """
-    Импортирует данные по нодам из запроса
+    Импортирует данные по нодам из запроса. С параметром async=1
+    ставит импорт в очередь import_worker и возвращает id задачи
     """
 
-    data = request.data
-    updated = data.get('updateDate')
-    created = []
-    ids = set()
-    for node in data.get('items'):
-        node['date'] = updated
+    serializer = ShopUnitImportRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        raise ParseError(serializer.errors)
 
-        # Проверяем уникальность нод в запросе
-        if node['id'] in ids:
-            [item.delete() for item in created]
-            raise ParseError('Duplicate id')
-        ids.add(node['id'])
+    if request.query_params.get('async') in ('1', 'true'):
+        job = enqueue_import(serializer.validated_data['items'],
+                             serializer.validated_data['updateDate'])
+        return Response({'id': str(job.id)}, status=HTTPStatus.ACCEPTED)
 
-        # Возвращает существующий нод или None
-        item = ShopUnit.objects.filter(id=node['id']).first()
+    import_units(serializer.validated_data['items'],
+                 serializer.validated_data['updateDate'])
 
-        # Если тип существующего нода и тип пришедшего не совпадают
-        if item and item.type != node['type']:
-            [item.delete() for item in created]
-            raise ParseError()
+    return Response(status=HTTPStatus.OK)
 
-        serializer = ShopUnitSerializer(item, data=node)
 
-        if not serializer.is_valid():
-            [item.delete() for item in created]
-            raise ParseError(serializer.errors)
+@api_view(['POST'])
+@throttle_classes([GetModifyRateThrottle])
+def imports_feed(request):
+    """
+    Импортирует каталог из тела запроса в формате NDJSON, не загружая
+    его в память целиком. Дата обновления - в параметре updateDate.
+    Фид без элементов - ошибка: скорее всего, тело запроса потерялось
+    """
+    try:
+        date = isoparse(request.query_params.get('updateDate'))
+    except (ValueError, TypeError):
+        raise ParseError('Incorrect date format')
 
-        created.append(serializer.save())
+    lines = iter(request.stream.readline, b'') if request.stream else []
+    if not import_feed(lines, date):
+        raise ParseError('Empty feed')
+    return Response(status=HTTPStatus.OK)
 
-    update_parents_date(list(ids), updated)
 
-    return Response(status=HTTPStatus.OK)
+@api_view(['GET'])
+@throttle_classes([GetReadRateThrottle])
+def import_job(request, job_id):
+    """
+    Возвращает состояние задачи импорта
+    """
+    job = get_object_or_404(ImportJob, id=job_id)
+    return Response(ImportJobSerializer(job).data, status=HTTPStatus.OK)
 
 
 @api_view(['GET', 'DELETE'])  # get to allow postman to test delete
@@ -122,6 +182,19 @@ def delete(request, node_id):
     """
 
     node = get_object_or_404(ShopUnit, id=node_id)
-    node.delete()
+    if not delete_unit(node):
+        raise Http404
 
     return Response(status=HTTPStatus.OK)
+
+
+def metrics(request):
+    """
+    Метрики процесса: пулы соединений с БД и кэш /nodes
+    """
+    samples = pool_samples() + [
+        (f'nodes_cache_{name}_total', 'counter', {}, node_cache.stats[name])
+        for name in ('hits', 'misses', 'invalidations', 'clears')
+    ]
+    return HttpResponse(render(samples),
+                        content_type='text/plain; version=0.0.4')
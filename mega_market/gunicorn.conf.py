@@ -0,0 +1,12 @@
+"""
+Настройки gunicorn, читается из рабочего каталога при запуске.
+Класс и число воркеров задаются переменными окружения, для ASGI
+(mega_market.asgi:application) нужен uvicorn.workers.UvicornWorker
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND') or '0:8000'
+worker_class = os.getenv('GUNICORN_WORKER_CLASS') or 'sync'
+workers = int(os.getenv('GUNICORN_WORKERS') or 1)
+threads = int(os.getenv('GUNICORN_THREADS') or 1)
+timeout = int(os.getenv('GUNICORN_TIMEOUT') or 30)
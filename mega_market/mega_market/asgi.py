@@ -0,0 +1,18 @@
+"""
+ASGI config for mega_market project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``. Django 2.2 handles requests synchronously, so requests
+are run in a thread pool of ASGI_THREADS threads per process.
+
+Run it with uvicorn workers:
+
+    gunicorn mega_market.asgi:application -k uvicorn.workers.UvicornWorker
+"""
+
+from django.conf import settings
+
+from core.asgi import ThreadPoolASGIHandler
+from .wsgi import application as wsgi_application
+
+application = ThreadPoolASGIHandler(wsgi_application, settings.ASGI_THREADS)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -51,11 +52,19 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'core.utils.custom_exception_handler',
     'DATETIME_FORMAT': "%Y-%m-%dT%H:%M:%S.%fZ",
     'DEFAULT_THROTTLE_RATES': {
-        'read_anon': '100/second',
-        'modify_anon': '1000/minute',
+        'read_anon': os.getenv('READ_THROTTLE_RATE') or '100/second',
+        'modify_anon': os.getenv('MODIFY_THROTTLE_RATE') or '1000/minute',
     }
 }
 
+# Хранилище счетчиков ограничения частоты запросов (goods.throttle):
+# memory - в процессе, sqlite - файл, общий для процессов сервера,
+# database - таблица в основной БД, общая для серверов. С memory каждый
+# воркер пропускает свой лимит запросов
+THROTTLE_STORE = os.getenv('THROTTLE_STORE') or 'database'
+THROTTLE_SQLITE_PATH = os.getenv('THROTTLE_SQLITE_PATH') or os.path.join(
+    tempfile.gettempdir(), 'mega_market_throttle.sqlite3')
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -64,6 +73,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'mega_market.urls'
@@ -104,10 +114,114 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER') or 'postgres',
         'PASSWORD': os.getenv('POSTGRES_PASSWORD') or 'password',
         'HOST': os.getenv('DB_HOST') or 'db',
-        'PORT': os.getenv('DB_PORT') or '5432'
+        'PORT': os.getenv('DB_PORT') or '5432',
+        # Время жизни соединения в секундах, 0 - соединение на запрос
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE') or 0),
+        # Проверять постоянное соединение перед использованием в запросе
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', 'true').lower() in ('1', 'true', 'yes'),
+        # Пул соединений процесса, SIZE 0 - без пула
+        'POOL': {
+            'SIZE': int(os.getenv('DB_POOL_SIZE') or 0),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT') or 10),
+            'CHECK_INTERVAL': float(
+                os.getenv('DB_POOL_CHECK_INTERVAL') or 30),
+        },
     }
 }
 
+# Проверка соединений и пул поддерживает core.backends.postgresql
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['ENGINE'] = 'core.backends.postgresql'
+
+# Реплики для чтения: DB_REPLICA_HOSTS=host[:port],... Остальные
+# параметры подключения такие же, как у default
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+        filter(None, (os.getenv('DB_REPLICA_HOSTS') or '').split(','))):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(
+        DATABASES['default'], HOST=host,
+        PORT=port or DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Представления, которые читают с реплик
+REPLICA_READ_VIEWS = ('nodes', 'sales', 'get_node_statistic')
+# После этих представлений клиент читает из default
+REPLICA_STICKY_VIEWS = ('imports', 'imports_feed', 'delete')
+REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS') or 10)
+# Привязка должна быть видна всем процессам: с LocMemCache или DummyCache
+# реплики не используются
+REPLICA_STICKY_CACHE = 'default'
+# Сколько секунд не выбирать недоступную реплику
+REPLICA_RETRY_SECONDS = int(os.getenv('DB_REPLICA_RETRY_SECONDS') or 30)
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+# Кэш ответов /nodes/{id}. Инвалидация должна доходить до всех процессов,
+# которые пишут и читают каталог (воркеры gunicorn, контейнеры api, web
+# и worker), поэтому кэш работает только с общим бэкендом: memcached,
+# БД (DatabaseCache, таблица создается командой createcachetable) или
+# FileBasedCache на общем томе. Без NODES_CACHE_BACKEND и с локальной
+# памятью кэш выключен
+CACHES = {
+    # Общий для процессов кэш (например, FileBasedCache или
+    # DatabaseCache) нужен, чтобы привязка клиента к default после
+    # записи работала во всех процессах. С памятью процесса по умолчанию
+    # чтение с реплик выключено
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND') or
+        'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('CACHE_LOCATION') or '',
+    },
+    'nodes': {
+        'BACKEND': os.getenv(
+            'NODES_CACHE_BACKEND') or
+        'django.core.cache.backends.dummy.DummyCache',
+        'LOCATION': os.getenv('NODES_CACHE_LOCATION') or 'nodes',
+        'TIMEOUT': int(os.getenv('NODES_CACHE_TIMEOUT') or 300),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('NODES_CACHE_MAX_ENTRIES') or 10000),
+        },
+    },
+}
+
+# Секционирование истории (только PostgreSQL), см. manage_partitions:
+# сколько месяцев вперед создавать секции и сколько полных месяцев
+# хранить. Пустой HISTORY_RETENTION_MONTHS - хранить всю историю.
+# HISTORY_RETENTION_ACTION: detach - оставить старые секции отдельными
+# таблицами, drop - удалить. HISTORY_RETENTION_COMPACT - перед этим
+# достроить агрегаты истории (build_rollups)
+HISTORY_PARTITIONS_AHEAD = int(os.getenv('HISTORY_PARTITIONS_AHEAD') or 3)
+HISTORY_RETENTION_MONTHS = (int(os.getenv('HISTORY_RETENTION_MONTHS'))
+                            if os.getenv('HISTORY_RETENTION_MONTHS') else None)
+HISTORY_RETENTION_ACTION = os.getenv('HISTORY_RETENTION_ACTION') or 'detach'
+HISTORY_RETENTION_COMPACT = os.getenv(
+    'HISTORY_RETENTION_COMPACT', 'true').lower() in ('1', 'true', 'yes')
+
+# Запись истории при ShopUnit.save(): batched - через history_recorder
+# (пакетами внутри history_recorder.batch(), в нем выполняются
+# сохранения в админке), signal - отдельными запросами update_or_create
+# при каждом сохранении
+HISTORY_RECORDER = os.getenv('HISTORY_RECORDER') or 'batched'
+
+# Каталог в памяти процесса для /nodes и /sales (goods.engine).
+# Изменения записываются в журнал CatalogEvent, процессы применяют его
+# перед каждым чтением
+CATALOG_ENGINE = os.getenv(
+    'CATALOG_ENGINE', '').lower() in ('1', 'true', 'yes')
+# За сколько дней до самого нового обновления цены каталог в памяти
+# хранит обновления для /sales, более ранние сутки читаются из БД
+CATALOG_ENGINE_SALES_DAYS = int(os.getenv('CATALOG_ENGINE_SALES_DAYS') or 7)
+
+# Потоков на процесс, в которых mega_market.asgi выполняет запросы
+ASGI_THREADS = int(os.getenv('ASGI_THREADS') or 16)
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,35 @@
+"""
+Профиль для процессов, которые обслуживают только API goods:
+DJANGO_SETTINGS_MODULE=mega_market.settings_api.
+
+Без админки, сессий, сообщений, статики и аутентификации: все запросы
+API анонимные, ответы только JSON. Админка и миграции запускаются
+отдельным процессом с mega_market.settings
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import REST_FRAMEWORK
+
+INSTALLED_APPS = [
+    'rest_framework',
+    'core',
+    'goods',
+]
+
+MIDDLEWARE = [
+    'core.middleware.ReplicaMiddleware',
+]
+
+ROOT_URLCONF = 'mega_market.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_AUTHENTICATION_CLASSES=[],
+    DEFAULT_PERMISSION_CLASSES=[],
+    DEFAULT_RENDERER_CLASSES=['rest_framework.renderers.JSONRenderer'],
+    UNAUTHENTICATED_USER=None,
+)
+
+# Тексты ошибок заменяет core.utils.custom_exception_handler
+USE_I18N = False
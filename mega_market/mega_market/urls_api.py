@@ -0,0 +1,8 @@
+"""
+URL для mega_market.settings_api: только API goods, без админки
+"""
+from django.urls import include, path
+
+urlpatterns = [
+    path('', include('goods.urls')),
+]
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mega_market.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+from goods.engine import catalog_engine  # noqa: E402
+
+if settings.CATALOG_ENGINE:
+    # Каталог загружается при старте процесса, а не первым запросом
+    catalog_engine.load()